@@ -3,3 +3,6 @@ from django.apps import AppConfig
 class BookCatalogConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'book_catalog'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
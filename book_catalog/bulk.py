@@ -0,0 +1,214 @@
+"""
+Validated bulk creation of catalog objects.
+
+Model.save() runs full_clean(), which costs a query per foreign key and per
+unique constraint for every saved object. create_validated() applies the
+same rules to a whole batch instead: foreign keys are loaded with one query
+each, clean_fields() and clean() run in memory, every unique constraint is
+checked against the batch with one query, and the valid objects are
+inserted with bulk_create(). Invalid rows are reported without aborting
+the batch.
+"""
+from operator import or_
+from functools import reduce
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.db import models, transaction
+from django.db.models.functions import Lower, Upper
+from . import counts, object_cache, search
+from .models import Author, Book, BookSaga
+
+# Rows per query of the uniqueness checks, to stay below the limit of query
+# parameters of SQLite
+CHUNK_SIZE = 300
+
+# Python equivalents of the functions allowed in unique constraints
+CONSTRAINT_FUNCTIONS = {
+    Lower: str.lower,
+    Upper: str.upper,
+}
+
+
+def _add_error(errors, index, error):
+    """
+    Store the error of a row, merging it with the previous errors of the row.
+    """
+    if index in errors:
+        error = ValidationError(error.update_error_dict(errors[index].update_error_dict({})))
+    errors[index] = error
+
+def _load_foreign_keys(model, objs, errors):
+    """
+    Fetch the objects referenced by the foreign keys of the batch with one
+    query per foreign key, reporting the rows whose references do not exist.
+    """
+    for field in model._meta.concrete_fields:
+        if not field.many_to_one:
+            continue
+        ids = {getattr(obj, field.attname) for obj in objs} - {None}
+        if not ids:
+            continue
+        targets = field.related_model._base_manager.in_bulk(ids)
+        for index, obj in enumerate(objs):
+            value = getattr(obj, field.attname)
+            if value is None:
+                continue
+            if value in targets:
+                setattr(obj, field.name, targets[value])
+            else:
+                _add_error(errors, index, ValidationError({field.name: ValidationError(
+                    field.error_messages['invalid'], code='invalid', params={
+                        'model': field.related_model._meta.verbose_name, 'pk': value,
+                        'field': field.remote_field.field_name, 'value': value})}))
+
+def _clean(model, objs, errors):
+    """
+    Run the field validation and the clean() method of every object.
+    """
+    foreign_keys = [field.name for field in model._meta.concrete_fields if field.many_to_one]
+    for index, obj in enumerate(objs):
+        if index in errors:
+            continue
+        try:
+            obj.clean_fields(exclude=foreign_keys)
+            obj.clean()
+        except ValidationError as error:
+            _add_error(errors, index, error)
+
+def _existing_keys(queryset, lookups, keys):
+    """
+    Returns the keys, tuples of values of the given lookups, that already
+    exist in the queryset.
+    """
+    existing = set()
+    keys = list(keys)
+    for start in range(0, len(keys), CHUNK_SIZE):
+        chunk = keys[start:start + CHUNK_SIZE]
+        condition = reduce(or_, (models.Q(**dict(zip(lookups, key))) for key in chunk))
+        existing.update(queryset.filter(condition).values_list(*lookups))
+    return {tuple(key) for key in existing}
+
+def _check_unique(queryset, objs, errors, get_key, lookups, message):
+    """
+    Report the rows whose key, computed by get_key, is repeated in the batch
+    or already exists in the data base. Keys with a None value are not
+    checked, like in the data base.
+    """
+    keys = {}
+    for index, obj in enumerate(objs):
+        if index in errors:
+            continue
+        key = get_key(obj)
+        if None in key:
+            continue
+        if key in keys:
+            _add_error(errors, index, message(obj))
+        else:
+            keys[key] = index
+    for key in _existing_keys(queryset, lookups, keys):
+        _add_error(errors, keys[key], message(objs[keys[key]]))
+
+def _check_unique_fields(model, objs, errors):
+    """
+    Check the unique fields, unique_together and unique constraints on
+    fields of the model.
+    """
+    unique_checks, _ = objs[0]._get_unique_checks(include_meta_constraints=True)
+    for _, field_names in unique_checks:
+        fields = [model._meta.get_field(name) for name in field_names]
+        if any(field.primary_key for field in fields):
+            continue
+        _check_unique(
+            model._default_manager.all(), objs, errors,
+            lambda obj, fields=fields: tuple(getattr(obj, field.attname) for field in fields),
+            [field.attname for field in fields],
+            lambda obj, field_names=field_names: ValidationError(
+                obj.unique_error_message(model, field_names)))
+
+def _check_unique_expressions(model, objs, errors):
+    """
+    Check the unique constraints on functions of fields (e.g. the case
+    insensitive name of a language). Constraints that cannot be evaluated in
+    Python are checked one row at a time.
+    """
+    for constraint in model._meta.constraints:
+        if not isinstance(constraint, models.UniqueConstraint) or not constraint.expressions:
+            continue
+        expressions = constraint.expressions
+        supported = constraint.condition is None and all(
+            type(expression) in CONSTRAINT_FUNCTIONS
+            and len(expression.source_expressions) == 1
+            and isinstance(expression.source_expressions[0], models.F)
+            for expression in expressions)
+        message = lambda obj, constraint=constraint: ValidationError(
+            constraint.get_violation_error_message())
+        if not supported:
+            for index, obj in enumerate(objs):
+                if index not in errors:
+                    try:
+                        constraint.validate(model, obj)
+                    except ValidationError as error:
+                        _add_error(errors, index, error)
+            continue
+        names = [expression.source_expressions[0].name for expression in expressions]
+        functions = [CONSTRAINT_FUNCTIONS[type(expression)] for expression in expressions]
+        annotations = {f'unique_key_{position}': expression
+                       for position, expression in enumerate(expressions)}
+
+        def get_key(obj, names=names, functions=functions):
+            values = [getattr(obj, name) for name in names]
+            return tuple(None if value is None else function(value)
+                         for function, value in zip(functions, values))
+        _check_unique(model._default_manager.annotate(**annotations), objs, errors, get_key,
+                      list(annotations), message)
+
+def validate_batch(model, objs):
+    """
+    Validate a list of unsaved objects of a model with the rules of
+    full_clean(). Returns a dict mapping the index of every invalid object to
+    its ValidationError.
+    """
+    errors = {}
+    if not objs:
+        return errors
+    _load_foreign_keys(model, objs, errors)
+    _clean(model, objs, errors)
+    _check_unique_fields(model, objs, errors)
+    _check_unique_expressions(model, objs, errors)
+    return dict(sorted(errors.items()))
+
+def _after_create(model, created):
+    """
+    Do the work of the post_save signals, which bulk_create() does not send.
+    """
+    if model in (Author, Book, BookSaga):
+        object_cache.bump_catalog_version()
+    if model is Book:
+        search.index_books(obj.pk for obj in created)
+        counts.invalidate_count('books')
+    elif model is Author:
+        counts.invalidate_count('authors')
+
+def create_validated(model, objs, batch_size=None):
+    """
+    Validate a list of unsaved objects of a model and insert the valid ones
+    with bulk_create(). Returns the list of created objects and the dict of
+    the errors of the others, by index in objs.
+    """
+    objs = list(objs)
+    errors = validate_batch(model, objs)
+    valid = [obj for index, obj in enumerate(objs) if index not in errors]
+    with transaction.atomic():
+        created = model._default_manager.bulk_create(valid, batch_size=batch_size)
+        _after_create(model, created)
+    return created, errors
+
+def format_errors(error):
+    """
+    Returns the messages of a ValidationError as a list of strings, prefixed
+    with the name of the field if any.
+    """
+    messages = []
+    for field, field_messages in error.update_error_dict({}).items():
+        for message in ValidationError(field_messages).messages:
+            messages.append(message if field == NON_FIELD_ERRORS else f'{field}: {message}')
+    return messages
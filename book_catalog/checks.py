@@ -0,0 +1,24 @@
+"""
+System checks of the settings the catalog relies on.
+"""
+from django.conf import settings
+from django.core.checks import Warning, register
+
+LOCAL_CACHE_BACKENDS = {'django.core.cache.backends.locmem.LocMemCache'}
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Warn if the default cache lives in the memory of each process: the
+    invalidations of the workers and commands (see object_cache.py and
+    counts.py) would never reach the web server.
+    """
+    if settings.CACHES.get('default', {}).get('BACKEND') in LOCAL_CACHE_BACKENDS:
+        return [Warning(
+            'The default cache is not shared between processes.',
+            hint='Use a file, database, Memcached or Redis cache, the pages and counts '
+                 'invalidated by run_jobs and the management commands stay stale otherwise.',
+            id='book_catalog.W001',
+        )]
+    return []
@@ -0,0 +1,50 @@
+"""
+Cached row counts of the catalog tables and of the shelves of the users.
+
+COUNT(*) scans the whole table in SQLite, so the totals shown by the list
+tables and the home page are cached and invalidated by the model signals
+(see signals.py) whenever a row is created or deleted, and by the writes
+of the relations in bulk or in services.py whenever a shelf changes.
+"""
+from django.core.cache import cache
+from django.utils import timezone
+
+COUNT_TIMEOUT = 60 * 60
+
+
+def _get_key(name):
+    return f'book_catalog:count:{name}'
+
+def get_count(name, queryset):
+    """
+    Returns the cached number of rows of the queryset stored under name.
+    """
+    return cache.get_or_set(_get_key(name), queryset.count, COUNT_TIMEOUT)
+
+def invalidate_count(*names):
+    """
+    Forget the cached counts with the given names.
+    """
+    cache.delete_many([_get_key(name) for name in names])
+
+def shelf_count_name(user_id):
+    """
+    Returns the name of the count of the relations of a user.
+    """
+    return f'shelf:{user_id}'
+
+def read_count_name(user_id, year=None):
+    """
+    Returns the name of the count of the books read by a user, in total or
+    in the given year.
+    """
+    return f'read:{user_id}' if year is None else f'read:{user_id}:{year}'
+
+def invalidate_shelf_counts(*user_ids):
+    """
+    Forget the cached counts of the shelves of the given users: their size
+    and their books read in total and this year, the only year counted.
+    """
+    year = timezone.now().year
+    invalidate_count(*[name for user_id in set(user_ids) for name in (
+        shelf_count_name(user_id), read_count_name(user_id), read_count_name(user_id, year))])
@@ -0,0 +1,296 @@
+"""
+Generation of synthetic datasets for load tests and benchmarks.
+
+The data is generated with Faker and random.Random from a seed, so the same
+profile and seed always produce the same catalog and shelves. Objects are
+written with bulk_create() in batches, without the per-row validation and
+signals of save(); the derived data (rating statistics, search index and
+cached counts) is rebuilt once at the end.
+
+Relations follow a skewed popularity: a few books are in many shelves and a
+few users have most of the relations, like in a real catalog.
+
+reset() empties the catalog, the users and their data with one DELETE per
+table instead of the ORM collector, which loads every object to resolve the
+cascades.
+"""
+import random
+from datetime import date, timedelta
+from graphlib import TopologicalSorter
+from itertools import accumulate
+from django.apps import apps
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+from faker import Faker
+from . import counts, object_cache, search
+from .models import Author, Book, BookSaga, Genre, Language, User, UserBookRelation
+
+PROFILES = {
+    'small': {'users': 100, 'authors': 200, 'books': 2000, 'relations': 20000},
+    'medium': {'users': 1000, 'authors': 2000, 'books': 20000, 'relations': 200000},
+    'large': {'users': 10000, 'authors': 10000, 'books': 100000, 'relations': 2000000},
+    'xl': {'users': 50000, 'authors': 50000, 'books': 500000, 'relations': 10000000},
+}
+
+# Password of every generated user, hashed once
+PASSWORD = 'password'
+
+GENRES = ['Fantasy', 'Science Fiction', 'Mystery', 'Thriller', 'Romance', 'Horror',
+          'Historical Fiction', 'Biography', 'Poetry', 'Drama', 'Adventure', 'Essay']
+LANGUAGES = ['English', 'Spanish', 'French', 'German', 'Italian', 'Portuguese']
+
+# Exponents of the Zipf distributions of the popularity of the books and of
+# the size of the shelves
+BOOK_SKEW = 0.9
+USER_SKEW = 0.6
+# Largest share of the catalog in a single shelf
+MAX_SHELF_SHARE = 0.25
+STATUS_WEIGHTS = {'r': 60, 't': 25, 'i': 15}
+RATING_WEIGHTS = [4, 8, 22, 38, 28]
+RATED_SHARE = 0.8
+REVIEWED_SHARE = 0.2
+# Number of distinct texts used for summaries and reviews
+TEXT_POOL_SIZE = 500
+HISTORY_DAYS = 3 * 365
+FIRST_PUBLISH_DATE = date(1900, 1, 1)
+
+# Applications whose tables are emptied by reset(), and models of them that
+# hold schema metadata created by the migrations and are kept
+RESET_APPS = ('book_catalog', 'auth', 'admin', 'sessions')
+KEPT_MODELS = (Permission,)
+
+
+def _zipf_weights(size, exponent):
+    return [1 / rank ** exponent for rank in range(1, size + 1)]
+
+def _shelf_sizes(rng, users, books, relations):
+    """
+    Returns the number of relations of each user, following a Zipf
+    distribution in a random order and adding up to the requested number of
+    relations (or to the largest possible number).
+    """
+    limit = max(1, int(books * MAX_SHELF_SHARE))
+    weights = _zipf_weights(users, USER_SKEW)
+    total = sum(weights)
+    sizes = [min(limit, int(relations * weight / total)) for weight in weights]
+    missing = min(relations, users * limit) - sum(sizes)
+    while missing > 0:
+        for index in range(users):
+            if missing and sizes[index] < limit:
+                sizes[index] += 1
+                missing -= 1
+    rng.shuffle(sizes)
+    return sizes
+
+
+class DatasetGenerator:
+    """
+    Generate a synthetic dataset of the given size. Each generate_* method
+    writes one kind of objects and returns the number of created rows.
+    """
+    def __init__(self, users, authors, books, relations, seed=0, batch_size=5000):
+        self.sizes = {'users': users, 'authors': authors, 'books': books,
+                      'relations': relations}
+        self.batch_size = batch_size
+        self.rng = random.Random(seed)
+        self.fake = Faker()
+        self.fake.seed_instance(seed)
+        self.today = timezone.now().date()
+        self.user_ids = []
+        self.author_ids = []
+        self.book_ids = []
+
+    def _texts(self, count, nb_sentences):
+        return [self.fake.paragraph(nb_sentences=nb_sentences) for _ in range(count)]
+
+    def _random_date(self):
+        return self.today - timedelta(days=self.rng.randrange(HISTORY_DAYS))
+
+    def _create(self, model, objs):
+        """
+        Insert the objects in batches and returns their primary keys.
+        """
+        ids = []
+        for start in range(0, len(objs), self.batch_size):
+            created = model.objects.bulk_create(objs[start:start + self.batch_size])
+            ids.extend(obj.pk for obj in created)
+        return ids
+
+    def _get_or_create_names(self, model, names):
+        existing = {name.lower(): pk for pk, name in model.objects.values_list('pk', 'name')}
+        missing = [model(name=name) for name in names if name.lower() not in existing]
+        model.objects.bulk_create(missing)
+        existing.update((obj.name.lower(), obj.pk) for obj in missing)
+        return [existing[name.lower()] for name in names]
+
+    def generate_users(self):
+        """
+        Create the users, all with the same password hashed only once.
+        """
+        password = make_password(PASSWORD)
+        users = []
+        for index in range(self.sizes['users']):
+            username = f'{self.fake.user_name()}.{index}'
+            users.append(User(username=username, password=password,
+                              first_name=self.fake.first_name(), last_name=self.fake.last_name(),
+                              email=f'{username}@example.com'))
+        self.user_ids = self._create(User, users)
+        return len(self.user_ids)
+
+    def generate_authors(self):
+        """
+        Create the authors.
+        """
+        authors = []
+        for _ in range(self.sizes['authors']):
+            year_of_birth = self.rng.randint(1800, self.today.year - 20)
+            year_of_death = self.rng.randint(year_of_birth + 20, year_of_birth + 90)
+            authors.append(Author(
+                first_name=self.fake.first_name(), last_name=self.fake.last_name(),
+                year_of_birth=year_of_birth,
+                year_of_death=year_of_death if year_of_death < self.today.year else None))
+        self.author_ids = self._create(Author, authors)
+        return len(self.author_ids)
+
+    def generate_books(self):
+        """
+        Create the books, a fifth of the authors with a saga of 2 to 7
+        volumes, with one to three genres each. Returns the number of books
+        and of sagas.
+        """
+        genre_ids = self._get_or_create_names(Genre, GENRES)
+        language_ids = self._get_or_create_names(Language, LANGUAGES)
+        summaries = self._texts(TEXT_POOL_SIZE, 4)
+        remaining = self.sizes['books']
+        saga_authors = self.rng.sample(self.author_ids, len(self.author_ids) // 5)
+        sagas = []
+        for author_id in saga_authors:
+            volumes = min(remaining, self.rng.randint(2, 7))
+            if not volumes:
+                break
+            remaining -= volumes
+            sagas.append((BookSaga(name=self.fake.catch_phrase(), author_id=author_id), volumes))
+        saga_ids = self._create(BookSaga, [saga for saga, volumes in sagas])
+
+        volumes = [(saga.author_id, saga_id, volume) for (saga, count), saga_id in zip(sagas, saga_ids)
+                   for volume in range(1, count + 1)]
+        volumes += [(self.rng.choice(self.author_ids), None, None) for _ in range(remaining)]
+        publish_days = (self.today - FIRST_PUBLISH_DATE).days
+        titles = set()
+        books = []
+        for author_id, saga_id, volume in volumes:
+            title = self.fake.sentence(nb_words=self.rng.randint(1, 5)).rstrip('.')
+            while (title, author_id) in titles:
+                title = f'{title} {self.rng.randint(2, 99)}'
+            titles.add((title, author_id))
+            books.append(Book(
+                title=title, author_id=author_id, saga_id=saga_id, saga_volume=volume,
+                publish_date=FIRST_PUBLISH_DATE + timedelta(days=self.rng.randrange(publish_days)),
+                summary=self.rng.choice(summaries), isbn=f'978{self.rng.randrange(10 ** 10):010d}',
+                language_id=self.rng.choice(language_ids)))
+        self.book_ids = self._create(Book, books)
+
+        through = Book.genre.through
+        self._create(through, [through(book_id=book_id, genre_id=genre_id)
+                               for book_id in self.book_ids
+                               for genre_id in self.rng.sample(genre_ids, self.rng.randint(1, 3))])
+        return len(self.book_ids), len(saga_ids)
+
+    def _relation(self, user_id, book_id, reviews):
+        status = self.rng.choices(list(STATUS_WEIGHTS), weights=list(STATUS_WEIGHTS.values()))[0]
+        relation = UserBookRelation(user_id=user_id, book_id=book_id, status=status)
+        if status == 'i':
+            relation.reading_date = self._random_date()
+        elif status == 'r':
+            relation.read_date = self._random_date()
+            if self.rng.random() < RATED_SHARE:
+                relation.rating = self.rng.choices(range(1, 6), weights=RATING_WEIGHTS)[0]
+            if self.rng.random() < REVIEWED_SHARE:
+                relation.review = self.rng.choice(reviews)
+                relation.review_date = relation.read_date
+        return relation
+
+    def _create_relations(self, relations, progress, created):
+        UserBookRelation.objects.bulk_create(relations, refresh_stats=False)
+        if progress:
+            progress(created + len(relations))
+        return len(relations)
+
+    def generate_relations(self, progress=None):
+        """
+        Create the relations of the users with skewed book popularity. The
+        distinct books of each shelf are sampled in memory, so the data base
+        is never queried for existing pairs. progress, if given, is called
+        with the number of relations created after every batch.
+        """
+        books = self.book_ids[:]
+        self.rng.shuffle(books)
+        cum_weights = list(accumulate(_zipf_weights(len(books), BOOK_SKEW)))
+        reviews = self._texts(TEXT_POOL_SIZE, 2)
+        sizes = _shelf_sizes(self.rng, len(self.user_ids), len(books), self.sizes['relations'])
+        created = 0
+        batch = []
+        for user_id, size in zip(self.user_ids, sizes):
+            shelf = set()
+            while len(shelf) < size:
+                shelf.update(self.rng.choices(books, cum_weights=cum_weights, k=size - len(shelf)))
+            batch.extend(self._relation(user_id, book_id, reviews) for book_id in sorted(shelf))
+            while len(batch) >= self.batch_size:
+                created += self._create_relations(batch[:self.batch_size], progress, created)
+                batch = batch[self.batch_size:]
+        if batch:
+            created += self._create_relations(batch, progress, created)
+        return created
+
+    def finish(self):
+        """
+        Rebuild the rating statistics and the search index of the books and
+        drop the cached counts.
+        """
+        with transaction.atomic():
+            Book.objects.all().refresh_rating_stats()
+        search.rebuild_index()
+        counts.invalidate_count('books', 'authors')
+        object_cache.bump_catalog_version()
+
+
+def get_reset_models():
+    """
+    Returns the models emptied by reset(), every model before the models it
+    references.
+    """
+    models = [model for app_label in RESET_APPS
+              for model in apps.get_app_config(app_label).get_models(include_auto_created=True)
+              if model not in KEPT_MODELS]
+    sorter = TopologicalSorter()
+    for model in models:
+        sorter.add(model)
+        for field in model._meta.concrete_fields:
+            if field.many_to_one and field.related_model in models and field.related_model is not model:
+                sorter.add(field.related_model, model)
+    return list(sorter.static_order())
+
+def reset(vacuum=False):
+    """
+    Delete every row of the catalog, users, sessions and admin log, reset
+    their sequences, clear the search index and the cache and optionally
+    vacuum the data base to give the free space back. Returns the list of
+    emptied tables.
+    """
+    tables = [model._meta.db_table for model in get_reset_models()]
+    # Without foreign key checks SQLite empties each table at once instead of
+    # deleting and checking its rows one by one
+    with connection.constraint_checks_disabled():
+        with transaction.atomic():
+            connection.ops.execute_sql_flush(
+                connection.ops.sql_flush(no_style(), tables, reset_sequences=True))
+            search.clear_index()
+    cache.clear()
+    if vacuum:
+        with connection.cursor() as cursor:
+            cursor.execute('VACUUM')
+    return tables
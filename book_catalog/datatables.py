@@ -0,0 +1,101 @@
+"""
+Server-side processing for DataTables.
+
+The tables send draw/start/length/order/search parameters and receive only
+the requested window of rows, so sorting, filtering and paging happen in
+the data base instead of in the browser.
+"""
+from django.http import JsonResponse
+from django.views import View
+
+MAX_LENGTH = 100
+
+
+def _get_int(value, default, minimum=0):
+    """
+    Returns value as an integer not lower than minimum, or default.
+    """
+    try:
+        return max(int(value), minimum)
+    except (TypeError, ValueError):
+        return default
+
+class DataTableView(View):
+    """
+    Base view answering the server-side processing requests of DataTables.
+
+    columns is the list of the table columns, in display order, each one
+    being the tuple of order_by() expressions used to sort by the column or
+    None if the column cannot be sorted. Rows are built by render_row().
+    """
+    columns = ()
+    default_length = 10
+
+    def get_queryset(self):
+        raise NotImplementedError
+
+    def get_records_total(self, queryset):
+        """
+        Returns the number of rows before filtering.
+        """
+        return queryset.count()
+
+    def filter_queryset(self, queryset, search):
+        """
+        Returns the rows matching the search value of the table.
+        """
+        return queryset
+
+    def annotate_queryset(self, queryset):
+        """
+        Returns the rows with the annotations needed to sort and render them,
+        added after the rows are counted so the counts do not compute them.
+        """
+        return queryset
+
+    def render_row(self, obj):
+        """
+        Returns the list of HTML cells of the row of obj.
+        """
+        raise NotImplementedError
+
+    def get_ordering(self):
+        """
+        Returns the order_by() expressions requested by the table.
+        """
+        ordering = []
+        index = 0
+        while f'order[{index}][column]' in self.request.GET:
+            column = _get_int(self.request.GET.get(f'order[{index}][column]'), None)
+            descending = self.request.GET.get(f'order[{index}][dir]') == 'desc'
+            index += 1
+            if column is None or column >= len(self.columns) or self.columns[column] is None:
+                continue
+            for expression in self.columns[column]:
+                if isinstance(expression, str):
+                    ordering.append(f'-{expression}' if descending else expression)
+                else:
+                    ordering.append(expression.desc(nulls_last=True) if descending
+                                    else expression.asc(nulls_last=True))
+        return ordering + ['pk']
+
+    def get(self, request, *args, **kwargs):
+        draw = _get_int(request.GET.get('draw'), 0)
+        start = _get_int(request.GET.get('start'), 0)
+        length = min(_get_int(request.GET.get('length'), self.default_length, minimum=1),
+                     MAX_LENGTH)
+        search = request.GET.get('search[value]', '').strip()
+        queryset = self.get_queryset()
+        records_total = self.get_records_total(queryset)
+        if search:
+            queryset = self.filter_queryset(queryset, search)
+            records_filtered = queryset.count()
+        else:
+            records_filtered = records_total
+        rows = self.annotate_queryset(queryset).order_by(*self.get_ordering())[start:start + length]
+        return JsonResponse({
+            'draw': draw,
+            'recordsTotal': records_total,
+            'recordsFiltered': records_filtered,
+            'data': [self.render_row(obj) for obj in rows],
+        })
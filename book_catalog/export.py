@@ -0,0 +1,75 @@
+"""
+Streaming export of the shelf of a user as CSV or JSON Lines.
+
+The relations are read with iterator() in chunks and every line is encoded
+as soon as it is read, so the memory used does not depend on the size of the
+shelf. The columns use the names of the records of the catalog importer
+(see importer.py).
+"""
+import csv
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from .models import UserBookRelation
+
+EXPORT_FIELDS = ('id', 'title', 'author_first_name', 'author_last_name', 'saga', 'saga_volume',
+                 'isbn', 'status', 'reading_date', 'read_date', 'rating', 'review',
+                 'review_date')
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/jsonl',
+}
+# Relations fetched from the data base at a time
+CHUNK_SIZE = 2000
+
+
+class _Echo:
+    """
+    File-like object returning what is written, for csv.writer.
+    """
+    def write(self, value):
+        return value
+
+
+def get_shelf(user):
+    """
+    Returns the relations of the user with their book, author and saga,
+    in a stable order.
+    """
+    return UserBookRelation.objects.filter(user=user).select_related(
+        'book__author', 'book__saga').order_by('pk')
+
+def export_rows(relations):
+    """
+    Yield the row of every relation as a dict of EXPORT_FIELDS.
+    """
+    for relation in relations.iterator(chunk_size=CHUNK_SIZE):
+        book = relation.book
+        yield {
+            'id': str(relation.uuid),
+            'title': book.title,
+            'author_first_name': book.author.first_name,
+            'author_last_name': book.author.last_name,
+            'saga': book.saga.name if book.saga else None,
+            'saga_volume': book.saga_volume,
+            'isbn': book.isbn,
+            'status': relation.status,
+            'reading_date': relation.reading_date,
+            'read_date': relation.read_date,
+            'rating': relation.rating,
+            'review': relation.review,
+            'review_date': relation.review_date,
+        }
+
+def export_lines(relations, file_format):
+    """
+    Yield the lines of the export of the relations in the given format.
+    """
+    rows = export_rows(relations)
+    if file_format == 'csv':
+        writer = csv.DictWriter(_Echo(), fieldnames=EXPORT_FIELDS)
+        yield writer.writeheader()
+        for row in rows:
+            yield writer.writerow(row)
+    else:
+        for row in rows:
+            yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
@@ -25,3 +25,9 @@ class SearchForm(forms.Form):
     Form for searching books
     """
     query = forms.CharField(label='Search', max_length=100)
+
+class ShelfImportForm(forms.Form):
+    """
+    Form for importing a Goodreads export into the shelf of the user
+    """
+    file = forms.FileField(label='Goodreads export (CSV)')
@@ -0,0 +1,258 @@
+"""
+Import of shelves exported from Goodreads (My Books > Import and export).
+
+The CSV file is read as a stream. Every row is matched to a book of the
+catalog by ISBN or else by normalized title and author, through indexes of
+the whole catalog built in memory with one query, and the relations are
+upserted in batches. The rows that cannot be matched are reported.
+"""
+import csv
+import io
+import re
+import unicodedata
+from datetime import datetime
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from . import jobs
+from .models import Book, ShelfImport, UserBookRelation
+
+# Status of the relation of each exclusive shelf of Goodreads
+SHELVES = {
+    'read': 'r',
+    'currently-reading': 'i',
+    'to-read': 't',
+}
+REQUIRED_COLUMNS = ('Title', 'Author', 'Exclusive Shelf')
+DATE_FORMATS = ('%Y/%m/%d', '%Y-%m-%d')
+BATCH_SIZE = 500
+# Uploads up to this size are imported during the request, larger ones by
+# the job worker
+INLINE_SIZE = 256 * 1024
+REVIEW_MAX_LENGTH = 1000
+# Series suffix of the Goodreads titles, e.g. "(The Hunger Games, #1)"
+SERIES_RE = re.compile(r'\s*\([^()]*#[^()]*\)\s*$')
+NON_WORD_RE = re.compile(r'[\W_]+')
+
+
+def normalize(text):
+    """
+    Returns the text in lower case, without accents nor punctuation.
+    """
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return NON_WORD_RE.sub(' ', text.lower()).strip()
+
+def normalize_title(title):
+    """
+    Returns the normalized title without its series suffix.
+    """
+    return normalize(SERIES_RE.sub('', title or ''))
+
+def clean_isbn(value):
+    """
+    Returns the ISBN-13 of a Goodreads ISBN or ISBN13 column (written as
+    ="9780439023481"), converting ISBN-10s, or None if it is not valid.
+    """
+    isbn = re.sub(r'[^0-9X]', '', (value or '').upper())
+    if len(isbn) == 10 and isbn[:9].isdigit():
+        isbn = '978' + isbn[:9]
+        total = sum(int(digit) * (3 if index % 2 else 1) for index, digit in enumerate(isbn))
+        return isbn + str(-total % 10)
+    return isbn if len(isbn) == 13 and isbn.isdigit() else None
+
+def _parse_date(value):
+    value = (value or '').strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            pass
+    return None
+
+def read_goodreads(binary_file):
+    """
+    Yield the rows of a Goodreads export file opened in binary mode.
+    """
+    reader = csv.DictReader(io.TextIOWrapper(binary_file, encoding='utf-8-sig', newline=''))
+    missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"Not a Goodreads export, missing columns: {', '.join(missing)}")
+    yield from reader
+
+
+class BookIndex:
+    """
+    Maps from ISBN and from normalized title and author to the id of the
+    books of the catalog, built with a single query.
+    """
+    def __init__(self):
+        self.by_isbn = {}
+        self.by_title_author = {}
+        books = Book.objects.order_by().values_list(
+            'pk', 'isbn', 'title', 'author__first_name', 'author__last_name')
+        for pk, isbn, title, first_name, last_name in books.iterator():
+            if isbn:
+                self.by_isbn.setdefault(isbn, pk)
+            self.by_title_author.setdefault(
+                (normalize_title(title), normalize(f'{first_name} {last_name}')), pk)
+
+    def match(self, row):
+        """
+        Returns the id of the book of a Goodreads row, or None.
+        """
+        for column in ('ISBN13', 'ISBN'):
+            book_id = self.by_isbn.get(clean_isbn(row.get(column)))
+            if book_id:
+                return book_id
+        return self.by_title_author.get((normalize_title(row['Title']), normalize(row['Author'])))
+
+
+class ShelfImporter:
+    """
+    Import Goodreads rows into the shelf of a user. The fields missing from a
+    row (e.g. the rating of an unrated book) do not overwrite the values of
+    an existing relation, and rows whose dates are not valid with the kept
+    ones are reported.
+    """
+    def __init__(self, user, index=None, batch_size=BATCH_SIZE):
+        self.user = user
+        self.index = index or BookIndex()
+        self.batch_size = batch_size
+        self.rows = 0
+        self.imported = 0
+        self.unmatched = []
+
+    def _report(self, number, row, reason):
+        self.unmatched.append({'row': number, 'title': row.get('Title') or '',
+                               'author': row.get('Author') or '', 'reason': reason})
+
+    def _relation(self, number, row):
+        """
+        Returns the unsaved relation of a row, or None if it is reported.
+        """
+        status = SHELVES.get((row.get('Exclusive Shelf') or '').strip())
+        if status is None:
+            self._report(number, row, f"Unknown shelf \"{row.get('Exclusive Shelf')}\"")
+            return None
+        book_id = self.index.match(row)
+        if book_id is None:
+            self._report(number, row, 'Book not found')
+            return None
+        date_read = _parse_date(row.get('Date Read'))
+        date_added = _parse_date(row.get('Date Added'))
+        rating = row.get('My Rating') or ''
+        review = (row.get('My Review') or '').strip()[:REVIEW_MAX_LENGTH] or None
+        relation = UserBookRelation(
+            user=self.user, book_id=book_id, status=status,
+            read_date=date_read if status == 'r' else None,
+            reading_date=date_added if status == 'i' else None,
+            rating=int(rating) if rating.isdigit() and 1 <= int(rating) <= 5 else None,
+            review=review, review_date=(date_read or date_added) if review else None)
+        try:
+            relation.clean()
+        except ValidationError as error:
+            self._report(number, row, ' '.join(error.messages))
+            return None
+        return relation
+
+    def _check_dates(self, batch):
+        """
+        Returns the relations of a batch, mapping book ids to (number, row,
+        relation), that stay valid with the dates of the existing relations
+        they update, which the upsert keeps when the row has none. The others
+        are reported.
+        """
+        existing = {book_id: (reading_date, read_date) for book_id, reading_date, read_date in
+                    UserBookRelation.objects.filter(user=self.user, book_id__in=batch)
+                    .values_list('book_id', 'reading_date', 'read_date')}
+        relations = []
+        for book_id, (number, row, relation) in batch.items():
+            if book_id in existing:
+                reading_date, read_date = existing[book_id]
+                merged = UserBookRelation(
+                    status=relation.status,
+                    reading_date=relation.reading_date or reading_date,
+                    read_date=relation.read_date or read_date)
+                try:
+                    merged.clean()
+                except ValidationError as error:
+                    self._report(number, row, ' '.join(error.messages))
+                    continue
+            relations.append(relation)
+        return relations
+
+    def _upsert(self, relations):
+        """
+        Insert or update the relations, with one statement per set of fields
+        present in the rows.
+        """
+        groups = {}
+        for relation in relations:
+            fields = ('status',) + tuple(
+                name for name in ('reading_date', 'read_date', 'rating', 'review', 'review_date')
+                if getattr(relation, name) is not None)
+            groups.setdefault(fields, []).append(relation)
+        with transaction.atomic():
+            for fields, group in groups.items():
+                UserBookRelation.objects.bulk_create(
+                    group, update_conflicts=True, unique_fields=['user', 'book'],
+                    update_fields=list(fields))
+        self.imported += len(relations)
+
+    def import_rows(self, rows, progress=None):
+        """
+        Import the rows in batches. progress, if given, is called after every
+        batch.
+        """
+        batch = {}
+        for number, row in enumerate(rows, start=1):
+            self.rows += 1
+            relation = self._relation(number, row)
+            if relation is not None:
+                # A book repeated in the file keeps its last row
+                batch[relation.book_id] = (number, row, relation)
+            if len(batch) >= self.batch_size:
+                self._upsert(self._check_dates(batch))
+                batch = {}
+                if progress:
+                    progress()
+        if batch:
+            self._upsert(self._check_dates(batch))
+        if progress:
+            progress()
+
+def run_shelf_import(shelf_import_id):
+    """
+    Import the file of a ShelfImport, saving its progress after every batch
+    and its report at the end, and delete the file.
+    """
+    shelf_import = ShelfImport.objects.select_related('user').get(pk=shelf_import_id)
+    ShelfImport.objects.filter(pk=shelf_import.pk).update(status='r')
+    importer = ShelfImporter(shelf_import.user)
+
+    def progress():
+        ShelfImport.objects.filter(pk=shelf_import.pk).update(
+            rows=importer.rows, imported=importer.imported)
+    try:
+        with shelf_import.file.open('rb') as binary_file:
+            importer.import_rows(read_goodreads(binary_file), progress)
+        shelf_import.status = 'd'
+    except Exception as error:
+        shelf_import.status = 'f'
+        shelf_import.error = str(error)
+    # The file holds the private reviews of the user, it is not kept
+    shelf_import.file.delete(save=False)
+    shelf_import.rows = importer.rows
+    shelf_import.imported = importer.imported
+    shelf_import.unmatched = importer.unmatched
+    shelf_import.finished = timezone.now()
+    shelf_import.save()
+    return shelf_import
+
+def start_shelf_import(shelf_import):
+    """
+    Queue the import to be run by the job worker. It records its own errors,
+    so it is not retried.
+    """
+    return jobs.enqueue('shelf_import', shelf_import.pk, max_attempts=1)
@@ -0,0 +1,342 @@
+"""
+Resized copies (derivatives) of the book covers and author photos.
+
+Every uploaded image gets a copy of each width of DERIVATIVE_SIZES in WebP
+and in JPEG, stored next to the original (covers/3a/3a7b...png gives
+covers/3a/3a7b....thumb-5d41402a.webp, covers/3a/3a7b....thumb-5d41402a.jpg,
+...), re-encoded without its metadata. The names hold a version of the
+encoding settings, so changing them gives new names instead of new bytes
+under names browsers cache forever; the images then need their
+derivatives again (see build_image_derivatives). Templates show them with picture_html() (the
+responsive_image tag), which lets the browser pick the smallest copy large
+enough for the displayed size.
+
+The derivatives are generated by the job worker (see jobs.py), not during
+the upload; the original is shown until they exist. The same job stores on
+the object a blurred placeholder of a few hundred bytes and the size of the
+image, so the pages inline the placeholder and reserve the space of the
+image while it is lazily loaded.
+"""
+import base64
+import hashlib
+import logging
+import os
+from io import BytesIO
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils.html import format_html, format_html_join
+from PIL import Image, ImageOps
+from . import jobs, object_cache
+from .models import Author, Book, invalidate_book_caches
+from .storage import is_content_addressed
+
+logger = logging.getLogger(__name__)
+
+# Width in pixels of each derivative: twice the 50px of the list tables,
+# the saga carousel and the detail pages
+DERIVATIVE_SIZES = {
+    'thumb': 100,
+    'carousel': 300,
+    'detail': 600,
+}
+# Extension and Pillow format of each encoding, the fallback one last
+DERIVATIVE_FORMATS = {
+    'webp': 'WEBP',
+    'jpg': 'JPEG',
+}
+QUALITY = 80
+# Revision of the encoding code, to increase when a change of the code
+# changes the bytes of the derivatives
+DERIVATIVE_REVISION = 1
+# Image field of each model with derivatives
+IMAGE_FIELDS = {
+    Book: 'cover_image',
+    Author: 'photo',
+}
+# Fields of each model storing the placeholder, width and height of its
+# image, and the version of the derivatives they were taken from
+PLACEHOLDER_FIELDS = {
+    Book: ('cover_placeholder', 'cover_width', 'cover_height', 'cover_derivatives'),
+    Author: ('photo_placeholder', 'photo_width', 'photo_height', 'photo_derivatives'),
+}
+PLACEHOLDER_WIDTH = 16
+PLACEHOLDER_QUALITY = 40
+# Objects whose image name is saved at a time by rehash_images
+REHASH_BATCH_SIZE = 500
+
+
+def derivative_version():
+    """
+    Returns the version of the derivatives, a short hash of the settings
+    they are encoded with.
+    """
+    settings = (DERIVATIVE_REVISION, DERIVATIVE_SIZES, DERIVATIVE_FORMATS, QUALITY)
+    return hashlib.sha256(repr(settings).encode()).hexdigest()[:8]
+
+def derivative_name(name, size, extension):
+    """
+    Returns the storage name of a derivative of the image with the given
+    name.
+    """
+    root, _ = os.path.splitext(name)
+    return f'{root}.{size}-{derivative_version()}.{extension}'
+
+def _last_derivative(name):
+    """
+    Returns the name of the derivative written last, whose existence means
+    that all the derivatives exist.
+    """
+    return derivative_name(name, list(DERIVATIVE_SIZES)[-1], list(DERIVATIVE_FORMATS)[-1])
+
+def has_derivatives(image):
+    """
+    Returns True if the derivatives of an image field file exist.
+    """
+    return bool(image) and image.storage.exists(_last_derivative(image.name))
+
+def _to_rgb(image):
+    """
+    Returns the image in RGB, with the transparent parts on white.
+    """
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+def _resize(image, width):
+    """
+    Returns the image reduced to the given width, or itself if it is not
+    wider.
+    """
+    if image.width <= width:
+        return image
+    return image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+
+def placeholder_data_uri(image):
+    """
+    Returns a data URI of a tiny copy of a Pillow image, shown blurred by the
+    browser while the image loads.
+    """
+    buffer = BytesIO()
+    _resize(image, PLACEHOLDER_WIDTH).save(buffer, 'WEBP', quality=PLACEHOLDER_QUALITY)
+    return 'data:image/webp;base64,' + base64.b64encode(buffer.getvalue()).decode()
+
+def get_placeholder(image):
+    """
+    Returns the (placeholder, width, height, version of the derivatives)
+    stored for an image field file.
+    """
+    obj = image.instance
+    return tuple(getattr(obj, name) for name in PLACEHOLDER_FIELDS[type(obj)])
+
+def save_placeholder(image, source):
+    """
+    Store on the object of an image field file the placeholder and the size
+    of source, its largest derivative, and forget the cached pages showing
+    the image.
+    """
+    obj = image.instance
+    values = dict(zip(PLACEHOLDER_FIELDS[type(obj)], (
+        placeholder_data_uri(source), source.width, source.height, derivative_version())))
+    # Nothing is saved if the image was replaced since the job was queued
+    type(obj).objects.filter(pk=obj.pk, **{image.field.name: image.name}).update(**values)
+    for name, value in values.items():
+        setattr(obj, name, value)
+    if isinstance(obj, Book):
+        invalidate_book_caches(obj.pk)
+    else:
+        object_cache.bump_version(type(obj), obj.pk)
+
+def reset_placeholder(obj):
+    """
+    Forget the placeholder of an object whose image is removed or replaced by
+    an upload not saved yet.
+    """
+    image = getattr(obj, IMAGE_FIELDS[type(obj)])
+    if not image or not image._committed:
+        for name, value in zip(PLACEHOLDER_FIELDS[type(obj)], ('', None, None, '')):
+            setattr(obj, name, value)
+
+def needs_derivatives(obj):
+    """
+    Returns True if the object has an image whose derivatives or placeholder
+    are missing, or were made with other encoding settings.
+    """
+    image = getattr(obj, IMAGE_FIELDS[type(obj)])
+    if not image:
+        return False
+    placeholder, _, _, version = get_placeholder(image)
+    return not (placeholder and version == derivative_version() and has_derivatives(image))
+
+def generate_derivatives(image):
+    """
+    Write the derivatives of an image field file, replacing the existing
+    ones, and store its placeholder. Returns their names.
+    """
+    storage = image.storage
+    with image.open('rb'):
+        with Image.open(image) as original:
+            source = _to_rgb(ImageOps.exif_transpose(original))
+    names = []
+    for size, width in DERIVATIVE_SIZES.items():
+        resized = _resize(source, width)
+        for extension, image_format in DERIVATIVE_FORMATS.items():
+            buffer = BytesIO()
+            resized.save(buffer, image_format, quality=QUALITY)
+            names.append(storage.save_as(derivative_name(image.name, size, extension),
+                                         ContentFile(buffer.getvalue())))
+    save_placeholder(image, resized)
+    return names
+
+def generate_missing_derivatives(image):
+    """
+    Write the derivatives of an image field file if they do not exist, or
+    only its placeholder from the largest one if it is the only thing
+    missing. Errors reading the image are logged, the original is shown
+    instead. Returns True if something was written.
+    """
+    if not image or not needs_derivatives(image.instance):
+        return False
+    try:
+        if has_derivatives(image):
+            with image.storage.open(_last_derivative(image.name)) as derivative:
+                with Image.open(derivative) as largest:
+                    save_placeholder(image, largest.convert('RGB'))
+        else:
+            generate_derivatives(image)
+    except (OSError, Image.DecompressionBombError) as error:
+        logger.warning('Cannot generate the derivatives of %s: %s', image.name, error)
+        return False
+    return True
+
+def build_derivatives(model_label, pk):
+    """
+    Write the missing derivatives of the image of an object, given by the
+    label of its model and its primary key. Task of the job worker.
+    """
+    model = apps.get_model(model_label)
+    field = IMAGE_FIELDS[model]
+    obj = model.objects.filter(pk=pk).only('pk', field, *PLACEHOLDER_FIELDS[model]).first()
+    # The object may have been deleted since it was queued
+    return obj is not None and generate_missing_derivatives(getattr(obj, field))
+
+def queue_derivatives(obj):
+    """
+    Queue the generation of the derivatives and placeholder of the image of
+    an object if they do not exist. Returns the job, or None.
+    """
+    if not needs_derivatives(obj):
+        return None
+    return jobs.enqueue('image_derivatives', obj._meta.label, obj.pk, unique=True)
+
+def _rehash(storage, name):
+    """
+    Store a file and its derivatives under the hash of its content. Returns
+    the new name and True if the content was already stored.
+    """
+    with storage.open(name) as content:
+        new_name = storage.hashed_name(name, content)
+        duplicate = storage.exists(new_name)
+        if not duplicate:
+            storage.save_as(new_name, content)
+    for size in DERIVATIVE_SIZES:
+        for extension in DERIVATIVE_FORMATS:
+            derivative = derivative_name(name, size, extension)
+            new_derivative = derivative_name(new_name, size, extension)
+            if storage.exists(derivative) and not storage.exists(new_derivative):
+                with storage.open(derivative) as content:
+                    storage.save_as(new_derivative, content)
+    return new_name, duplicate
+
+def _delete_with_derivatives(storage, names):
+    for name in names:
+        storage.delete(name)
+        for size in DERIVATIVE_SIZES:
+            for extension in DERIVATIVE_FORMATS:
+                storage.delete(derivative_name(name, size, extension))
+
+def rehash_images(model, batch_size=REHASH_BATCH_SIZE, delete_old=False, progress=None):
+    """
+    Move the images of a model that are not named by their content yet, with
+    their derivatives, to their content-addressed names, saving the new
+    names with one UPDATE per batch. With delete_old, the old files no
+    longer used are deleted after every batch. progress, if given, is called
+    with the counts after every batch. Returns the counts of images renamed,
+    duplicated (content already stored) and missing.
+    """
+    field = IMAGE_FIELDS[model]
+    storage = model._meta.get_field(field).storage
+    counts = {'renamed': 0, 'duplicates': 0, 'missing': 0}
+    objs = model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+    objs = objs.only('pk', field).order_by('pk').iterator(chunk_size=batch_size)
+
+    def save(batch, old_names):
+        with transaction.atomic():
+            model.objects.bulk_update(batch, [field])
+        if delete_old:
+            used = set(model.objects.filter(**{f'{field}__in': old_names})
+                       .values_list(field, flat=True))
+            _delete_with_derivatives(storage, set(old_names) - used)
+        if progress:
+            progress(counts)
+    batch, old_names = [], []
+    for obj in objs:
+        image = getattr(obj, field)
+        if is_content_addressed(image.name):
+            continue
+        if not storage.exists(image.name):
+            counts['missing'] += 1
+            continue
+        new_name, duplicate = _rehash(storage, image.name)
+        counts['renamed'] += 1
+        counts['duplicates'] += duplicate
+        old_names.append(image.name)
+        image.name = new_name
+        batch.append(obj)
+        if len(batch) >= batch_size:
+            save(batch, old_names)
+            batch, old_names = [], []
+    if batch:
+        save(batch, old_names)
+    return counts
+
+def srcset(image, extension):
+    """
+    Returns the srcset attribute listing the derivatives of an image in the
+    given encoding.
+    """
+    return ', '.join(f'{image.storage.url(derivative_name(image.name, size, extension))} {width}w'
+                     for size, width in DERIVATIVE_SIZES.items())
+
+def picture_html(image, alt, sizes, css_class='', style='', loading='lazy'):
+    """
+    HTML of a picture element showing an image field file with its
+    derivatives, for a displayed width given by the sizes attribute (e.g.
+    "50px"), over its placeholder and with its size to reserve its space.
+    The original is shown while the derivatives do not exist. loading is
+    "lazy", or "eager" for the images at the top of the page.
+    """
+    if not image:
+        return ''
+    placeholder, width, height, version = get_placeholder(image)
+    # The version is stored with the placeholder once the derivatives are
+    # written, the file system is only checked for the images without them
+    # or whose derivatives were made with other encoding settings
+    if version != derivative_version() and not has_derivatives(image):
+        return format_html('<img src="{}" alt="{}" class="{}" style="{}" loading="{}">',
+                           image.url, alt, css_class, style, loading)
+    if placeholder:
+        style = format_html('{}background: url({}) center / cover no-repeat;',
+                            f'{style} ' if style else '', placeholder)
+    dimensions = format_html(' width="{}" height="{}"', width, height) if width and height else ''
+    *sources, fallback = DERIVATIVE_FORMATS
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" style="{}"{} '
+        'loading="{}" decoding="async"></picture>',
+        format_html_join('', '<source type="image/{}" srcset="{}" sizes="{}">',
+                         ((extension, srcset(image, extension), sizes) for extension in sources)),
+        image.storage.url(derivative_name(image.name, list(DERIVATIVE_SIZES)[-1], fallback)),
+        srcset(image, fallback), sizes, alt, css_class, style, dimensions, loading)
@@ -0,0 +1,216 @@
+"""
+Import of catalogs of authors, sagas and books.
+
+Records are dicts read from JSON Lines or CSV files. Their "type" is
+"author", "saga" or "book" (the default):
+
+- author: first_name, last_name, year_of_birth, year_of_death, biography,
+  social_media
+- saga: name, author_first_name, author_last_name
+- book: title, author_first_name, author_last_name, saga, saga_volume,
+  publish_date, summary, isbn, language, genres (a list, or names separated
+  by "|" in CSV)
+
+A JSON Lines line that is not a JSON object is read as an InvalidRecord,
+rejected with its line number like the records that do not validate.
+
+Authors, sagas, genres and languages are referenced by name through lookup
+maps held in memory, and the missing ones are created with the batch that
+references them.
+"""
+import csv
+import json
+from collections import Counter
+from .bulk import create_validated, format_errors
+from .models import Author, Book, BookSaga, Genre, Language
+
+AUTHOR_FIELDS = ('year_of_birth', 'year_of_death', 'biography', 'social_media')
+BOOK_FIELDS = ('publish_date', 'summary', 'isbn')
+GENRE_SEPARATOR = '|'
+
+
+class InvalidRecord:
+    """
+    Line of a JSON Lines file that is not a record, with the reason.
+    """
+    def __init__(self, message):
+        self.message = message
+
+def _parse_line(line, number):
+    """
+    Returns the record of a JSON Lines line, or an InvalidRecord.
+    """
+    try:
+        record = json.loads(line)
+    except ValueError as error:
+        return InvalidRecord(f'Line {number}: not valid JSON ({error})')
+    if not isinstance(record, dict):
+        return InvalidRecord(f'Line {number}: not a JSON object')
+    return record
+
+def read_records(path, file_format=None):
+    """
+    Yield the records of a JSON Lines (.jsonl) or CSV (.csv) file one at a
+    time. The format is guessed from the extension if not given.
+    """
+    file_format = file_format or ('csv' if str(path).lower().endswith('.csv') else 'jsonl')
+    with open(path, newline='', encoding='utf-8') as input_file:
+        if file_format == 'csv':
+            yield from csv.DictReader(input_file)
+        else:
+            for number, line in enumerate(input_file, start=1):
+                if line.strip():
+                    yield _parse_line(line, number)
+
+def _value(record, name):
+    """
+    Returns a field of a record, None if it is missing or blank.
+    """
+    value = record.get(name)
+    if isinstance(value, str):
+        value = value.strip()
+    return None if value in ('', None) else value
+
+def _names(value):
+    """
+    Returns the list of names of a genre field.
+    """
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.split(GENRE_SEPARATOR)
+    return [name.strip() for name in value if name and name.strip()]
+
+class CatalogImporter:
+    """
+    Import batches of records, keeping the maps from names to ids of the
+    referenced objects across batches. If a batch fails, the maps may hold
+    ids of rolled back rows, so a new importer must be used.
+    """
+    def __init__(self):
+        self.authors = {(first_name, last_name): pk for pk, first_name, last_name in
+                        Author.objects.values_list('pk', 'first_name', 'last_name')}
+        self.sagas = {(name, author_id): pk for pk, name, author_id in
+                      BookSaga.objects.values_list('pk', 'name', 'author_id')}
+        self.genres = {name.lower(): pk for pk, name in Genre.objects.values_list('pk', 'name')}
+        self.languages = {name.lower(): pk for pk, name in
+                          Language.objects.values_list('pk', 'name')}
+        self.created = Counter()
+
+    @staticmethod
+    def _author_key(record_type, record):
+        prefix = '' if record_type == 'author' else 'author_'
+        return (_value(record, f'{prefix}first_name') or '',
+                _value(record, f'{prefix}last_name') or '')
+
+    @staticmethod
+    def _saga_name(record_type, record):
+        return _value(record, 'name' if record_type == 'saga' else 'saga')
+
+    def _create_missing(self, model, objects, lookup, name):
+        """
+        Create the objects, by key, missing from the lookup map and add them to
+        it. Returns the error messages of the keys that could not be created.
+        """
+        keys = [key for key in objects if key not in lookup]
+        created, errors = create_validated(model, [objects[key] for key in keys])
+        valid = [key for index, key in enumerate(keys) if index not in errors]
+        for key, obj in zip(valid, created):
+            lookup[key] = obj.pk
+        self.created[name] += len(created)
+        return {keys[index]: [f'{name}: {message}' for message in format_errors(error)]
+                for index, error in errors.items()}
+
+    def _import_authors(self, records):
+        authors = {}
+        for record_type, record in records:
+            key = self._author_key(record_type, record)
+            if record_type == 'author':
+                authors[key] = Author(first_name=key[0], last_name=key[1],
+                                      **{name: _value(record, name) for name in AUTHOR_FIELDS})
+            else:
+                authors.setdefault(key, Author(first_name=key[0], last_name=key[1]))
+        return self._create_missing(Author, authors, self.authors, 'author')
+
+    def _import_sagas(self, records):
+        sagas = {}
+        for record_type, record in records:
+            name = self._saga_name(record_type, record)
+            author_id = self.authors.get(self._author_key(record_type, record))
+            if record_type != 'author' and name and author_id:
+                sagas.setdefault((name, author_id), BookSaga(name=name, author_id=author_id))
+        return self._create_missing(BookSaga, sagas, self.sagas, 'saga')
+
+    def _import_languages(self, records):
+        languages = {}
+        for record_type, record in records:
+            name = _value(record, 'language')
+            if record_type == 'book' and name:
+                languages.setdefault(name.lower(), Language(name=name))
+        return self._create_missing(Language, languages, self.languages, 'language')
+
+    def _import_genres(self, records):
+        genres = {}
+        for record_type, record in records:
+            if record_type == 'book':
+                for name in _names(record.get('genres')):
+                    genres.setdefault(name.lower(), Genre(name=name))
+        return self._create_missing(Genre, genres, self.genres, 'genre')
+
+    def _build_book(self, record):
+        author_id = self.authors[self._author_key('book', record)]
+        saga_name = self._saga_name('book', record)
+        language = _value(record, 'language')
+        book = Book(title=_value(record, 'title') or '', author_id=author_id,
+                    saga_id=self.sagas[(saga_name, author_id)] if saga_name else None,
+                    saga_volume=_value(record, 'saga_volume'),
+                    language_id=self.languages[language.lower()] if language else None,
+                    **{name: _value(record, name) for name in BOOK_FIELDS})
+        book.genre_ids = {self.genres[name.lower()] for name in _names(record.get('genres'))}
+        return book
+
+    def import_batch(self, records):
+        """
+        Import a list of (number, record) pairs. Returns the list of
+        (number, messages) of the records that were not imported.
+        """
+        errors = {}
+        typed = {}
+        for number, record in records:
+            if isinstance(record, InvalidRecord):
+                errors[number] = [record.message]
+                continue
+            record_type = _value(record, 'type') or 'book'
+            if record_type in ('author', 'saga', 'book'):
+                typed[number] = (record_type, record)
+            else:
+                errors[number] = [f'Unknown record type "{record_type}"']
+        author_errors = self._import_authors(typed.values())
+        saga_errors = self._import_sagas(typed.values())
+        language_errors = self._import_languages(typed.values())
+        genre_errors = self._import_genres(typed.values())
+
+        new_books = []
+        for number, (record_type, record) in typed.items():
+            author_key = self._author_key(record_type, record)
+            messages = list(author_errors.get(author_key, []))
+            messages += saga_errors.get(
+                (self._saga_name(record_type, record), self.authors.get(author_key)), [])
+            if record_type == 'book':
+                language = _value(record, 'language')
+                messages += language_errors.get(language.lower() if language else None, [])
+                for name in _names(record.get('genres')):
+                    messages += genre_errors.get(name.lower(), [])
+            if messages:
+                errors[number] = messages
+            elif record_type == 'book':
+                new_books.append((number, self._build_book(record)))
+
+        created, book_errors = create_validated(Book, [book for number, book in new_books])
+        self.created['book'] += len(created)
+        for index, error in book_errors.items():
+            errors[new_books[index][0]] = format_errors(error)
+        Book.genre.through.objects.bulk_create([
+            Book.genre.through(book_id=book.pk, genre_id=genre_id)
+            for book in created for genre_id in book.genre_ids])
+        return sorted(errors.items())
@@ -0,0 +1,202 @@
+"""
+Queue of the tasks run outside of the requests (image derivatives, large
+shelf imports).
+
+The jobs are rows of the Job table, created in the same transaction as the
+changes that need them, so they survive restarts and are never run before
+their data is committed. The worker of the run_jobs command claims the due
+jobs with a single UPDATE and runs them in a pool of processes, at most
+CONCURRENCY[task] at a time for each task. A failed job is retried after
+RETRY_DELAY, doubled at every attempt, until its max_attempts.
+"""
+import logging
+import multiprocessing
+import os
+import time
+import traceback
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+import django
+from django.db import connections
+from django.db.models import Count, F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Function run by each task, called with the args of the job
+TASKS = {
+    'image_derivatives': 'book_catalog.images.build_derivatives',
+    'shelf_import': 'book_catalog.goodreads.run_shelf_import',
+}
+# Maximum number of jobs of a task running at the same time in all the
+# workers, the tasks not listed are only limited by the processes
+CONCURRENCY = {
+    'shelf_import': 2,
+}
+RETRY_DELAY = timedelta(seconds=30)
+# Jobs still running after this time are considered lost (e.g. the worker
+# was killed) and run again
+STALE_AFTER = timedelta(hours=1)
+# Seconds between two checks of the queue when there is nothing to do
+POLL_INTERVAL = 1.0
+
+
+def enqueue(task, *args, unique=False, max_attempts=3):
+    """
+    Create a pending job of a task with the given arguments. With unique, the
+    pending job with the same arguments is returned instead if there is one.
+    """
+    if task not in TASKS:
+        raise ValueError(f'Unknown task "{task}"')
+    args = list(args)
+    if unique:
+        job = Job.objects.filter(task=task, args=args, status='p').first()
+        if job is not None:
+            return job
+    return Job.objects.create(task=task, args=args, max_attempts=max_attempts)
+
+def requeue_stale():
+    """
+    Make pending again the jobs running for more than STALE_AFTER. Returns
+    their number.
+    """
+    return Job.objects.filter(status='r', started__lt=timezone.now() - STALE_AFTER).update(
+        status='p', claimed_by='')
+
+def claim(limit):
+    """
+    Mark as running up to limit due jobs, in order, without exceeding the
+    CONCURRENCY of their tasks, and return them.
+    """
+    if limit <= 0:
+        return []
+    now = timezone.now()
+    running = dict(Job.objects.filter(status='r', task__in=CONCURRENCY).order_by()
+                   .values_list('task').annotate(Count('pk')))
+    free = {task: maximum - running.get(task, 0) for task, maximum in CONCURRENCY.items()}
+    due = Job.objects.filter(status='p', run_after__lte=now).exclude(
+        task__in=[task for task, slots in free.items() if slots <= 0])
+    ids = []
+    for pk, task in due.order_by('run_after', 'pk').values_list('pk', 'task').iterator():
+        if task in free:
+            if free[task] <= 0:
+                continue
+            free[task] -= 1
+        ids.append(pk)
+        if len(ids) == limit:
+            break
+    if not ids:
+        return []
+    # Another worker may claim some of them first, the token tells ours
+    token = uuid.uuid4().hex
+    Job.objects.filter(pk__in=ids, status='p').update(
+        status='r', claimed_by=token, started=now, attempts=F('attempts') + 1)
+    return list(Job.objects.filter(claimed_by=token, status='r').order_by('run_after', 'pk'))
+
+def _record_failure(job_id, error):
+    """
+    Make a failed job pending again after its retry delay, or failed if it
+    has no attempts left. Returns its new status.
+    """
+    job = Job.objects.get(pk=job_id)
+    changes = {'claimed_by': '', 'error': error}
+    if job.attempts < job.max_attempts:
+        changes.update(status='p',
+                       run_after=timezone.now() + RETRY_DELAY * 2 ** (job.attempts - 1))
+    else:
+        changes.update(status='f', finished=timezone.now())
+    Job.objects.filter(pk=job_id).update(**changes)
+    return changes['status']
+
+def run_job(job_id):
+    """
+    Run a claimed job and record its result. Returns its new status.
+    """
+    job = Job.objects.get(pk=job_id)
+    try:
+        import_string(TASKS[job.task])(*job.args)
+    except Exception:
+        logger.exception('Job %s failed', job.pk)
+        return _record_failure(job_id, traceback.format_exc())
+    Job.objects.filter(pk=job_id).update(status='d', finished=timezone.now(), error='')
+    return 'd'
+
+
+class Worker:
+    """
+    Run the due jobs in a pool of processes, or in the current process if
+    processes is 0. report, if given, is called with every job run and its
+    new status.
+    """
+    def __init__(self, processes=None, poll_interval=POLL_INTERVAL, report=None):
+        self.processes = (os.cpu_count() or 1) if processes is None else processes
+        self.poll_interval = poll_interval
+        self.report = report
+        self.results = {'d': 0, 'p': 0, 'f': 0}
+
+    def _finished(self, job, status):
+        self.results[status] += 1
+        if self.report:
+            self.report(job, status)
+
+    def _idle(self, drain):
+        """
+        Wait for new jobs. Returns False if the queue is drained.
+        """
+        if drain and not Job.objects.filter(status='p').exists():
+            return False
+        time.sleep(self.poll_interval)
+        return True
+
+    def run(self, drain=False):
+        """
+        Run the jobs until interrupted or, with drain, until there are no
+        pending jobs left, including the ones waiting for a retry.
+        """
+        requeue_stale()
+        if not self.processes:
+            while True:
+                jobs = claim(1)
+                if jobs:
+                    self._finished(jobs[0], run_job(jobs[0].pk))
+                elif not self._idle(drain):
+                    return
+        # The processes open their own connections
+        connections.close_all()
+        context = multiprocessing.get_context('spawn')
+        executor = ProcessPoolExecutor(self.processes, mp_context=context,
+                                       initializer=django.setup)
+        running = {}
+        try:
+            while True:
+                for job in claim(self.processes - len(running)):
+                    running[executor.submit(run_job, job.pk)] = job
+                if not running:
+                    if not self._idle(drain):
+                        return
+                    continue
+                finished, _ = wait(running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                broken = False
+                for future in finished:
+                    job = running.pop(future)
+                    try:
+                        status = future.result()
+                    except Exception as error:
+                        # The process died (e.g. out of memory) before
+                        # recording the result
+                        broken = broken or isinstance(error, BrokenProcessPool)
+                        status = _record_failure(job.pk, repr(error))
+                    self._finished(job, status)
+                if broken:
+                    executor.shutdown(cancel_futures=True)
+                    executor = ProcessPoolExecutor(self.processes, mp_context=context,
+                                                   initializer=django.setup)
+        finally:
+            executor.shutdown(cancel_futures=True)
+            # The jobs interrupted or never started are run again later
+            Job.objects.filter(pk__in=[job.pk for job in running.values()], status='r').update(
+                status='p', claimed_by='', attempts=F('attempts') - 1)
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from PIL import Image
+from book_catalog import images
+
+
+class Command(BaseCommand):
+    """
+    Generate the resized copies and placeholders of the existing covers and
+    photos.
+    """
+    help = 'Generates the missing derivatives of the book covers and author photos'
+
+    def _objects_with_image(self, model):
+        field = images.IMAGE_FIELDS[model]
+        objs = model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+        return objs.only('pk', field, *images.PLACEHOLDER_FIELDS[model]).iterator()
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Generate the derivatives again even if they exist')
+        parser.add_argument('--queue', action='store_true',
+                            help='Queue the images for the run_jobs worker instead, which '
+                                 'uses all the processors')
+
+    def handle(self, *args, **kwargs):
+        if kwargs['queue']:
+            queued = 0
+            for model in images.IMAGE_FIELDS:
+                for obj in self._objects_with_image(model):
+                    queued += images.queue_derivatives(obj) is not None
+            self.stdout.write(self.style.SUCCESS(
+                f'Derivatives queued for {queued} images, run "manage.py run_jobs --drain" '
+                'to generate them'))
+            return
+        generated = skipped = failed = 0
+        for model, field in images.IMAGE_FIELDS.items():
+            for obj in self._objects_with_image(model):
+                image = getattr(obj, field)
+                if not kwargs['force'] and not images.needs_derivatives(obj):
+                    skipped += 1
+                    continue
+                try:
+                    images.generate_derivatives(image)
+                except (OSError, Image.DecompressionBombError) as error:
+                    failed += 1
+                    self.stderr.write(f'{image.name}: {error}')
+                    continue
+                generated += 1
+                if kwargs['verbosity'] > 1:
+                    self.stdout.write(image.name)
+        self.stdout.write(self.style.SUCCESS(
+            f'Derivatives generated for {generated} images, {skipped} already had them, '
+            f'{failed} failed'))
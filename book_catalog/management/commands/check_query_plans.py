@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from book_catalog import query_plans
+
+
+class Command(BaseCommand):
+    """
+    Check that the queries of the views do not scan whole tables.
+    """
+    help = 'Runs EXPLAIN QUERY PLAN on the queries of the views and flags full table scans'
+
+    def handle(self, *args, **kwargs):
+        if not query_plans.is_available():
+            self.stdout.write(self.style.WARNING('Query plans can only be checked in SQLite'))
+            return
+        queries = query_plans.get_view_queries()
+        failures = []
+        for name, query in queries:
+            plan = query_plans.get_plan(query)
+            if kwargs['verbosity'] > 1:
+                self.stdout.write(name)
+                for step in plan:
+                    self.stdout.write(f'    {step}')
+            failures.extend(f'{name}: {step}' for step in query_plans.find_full_scans(plan))
+        if failures:
+            raise CommandError('Full table scans found:\n' + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS(f'No full table scans in {len(queries)} queries'))
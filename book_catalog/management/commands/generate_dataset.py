@@ -0,0 +1,63 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from book_catalog.dataset import PASSWORD, PROFILES, DatasetGenerator
+
+
+class Command(BaseCommand):
+    """
+    Generate a synthetic dataset of users, authors, sagas, books and shelves
+    for load tests and benchmarks.
+    """
+    help = 'Generates a synthetic dataset of the given size profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', choices=list(PROFILES), default='small',
+                            help='Size of the dataset')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Seed of the random generators')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Number of rows inserted per query batch')
+        for name in PROFILES['small']:
+            parser.add_argument(f'--{name}', type=int,
+                                help=f'Number of {name}, overriding the profile')
+
+    def _step(self, description, function, *args):
+        start = time.monotonic()
+        result = function(*args)
+        self.stdout.write(f'{description} in {time.monotonic() - start:.1f}s')
+        return result
+
+    def handle(self, *args, **kwargs):
+        sizes = {name: kwargs[name] if kwargs[name] is not None else size
+                 for name, size in PROFILES[kwargs['profile']].items()}
+        if kwargs['batch_size'] < 1 or min(sizes.values()) < 0:
+            raise CommandError('The batch size must be positive and the sizes not negative')
+        if sizes['relations'] and not (sizes['users'] and sizes['books']):
+            raise CommandError('Relations need at least one user and one book')
+        if sizes['books'] and not sizes['authors']:
+            raise CommandError('Books need at least one author')
+        generator = DatasetGenerator(seed=kwargs['seed'], batch_size=kwargs['batch_size'], **sizes)
+        start = time.monotonic()
+
+        try:
+            with transaction.atomic():
+                users = self._step('Users created', generator.generate_users)
+        except IntegrityError as error:
+            raise CommandError(f'{error}. The usernames depend only on the seed, use another '
+                               'seed or an empty data base') from error
+        authors = self._step('Authors created', generator.generate_authors)
+        books, sagas = self._step('Books created', generator.generate_books)
+
+        def progress(created):
+            if kwargs['verbosity'] > 1 or created == sizes['relations']:
+                rate = created / max(time.monotonic() - relations_start, 1e-6)
+                self.stdout.write(f'{created} relations created ({rate:.0f} relations/s)')
+        relations_start = time.monotonic()
+        relations = self._step('Relations created', generator.generate_relations, progress)
+        self._step('Statistics and search index rebuilt', generator.finish)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Dataset generated in {time.monotonic() - start:.1f}s: {users} users, '
+            f'{authors} authors, {sagas} sagas, {books} books, {relations} relations. '
+            f'The password of every user is "{PASSWORD}"'))
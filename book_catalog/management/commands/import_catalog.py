@@ -0,0 +1,92 @@
+import csv
+import json
+import os
+import time
+from itertools import islice
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from book_catalog.importer import CatalogImporter, read_records
+
+
+class Command(BaseCommand):
+    """
+    Import authors, sagas and books from a JSON Lines or CSV file.
+
+    The file is read as a stream and written in batches, each one in its own
+    transaction. The number of committed records is saved in a checkpoint
+    file after every batch, so an import stopped by a failed batch can be
+    resumed with --resume.
+    """
+    help = 'Imports a catalog of authors, sagas and books from a JSON Lines or CSV file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='JSON Lines (.jsonl) or CSV (.csv) file')
+        parser.add_argument('--format', choices=['jsonl', 'csv'],
+                            help='File format, guessed from the extension by default')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of records written per transaction')
+        parser.add_argument('--checkpoint',
+                            help='Checkpoint file, <path>.checkpoint by default')
+        parser.add_argument('--resume', action='store_true',
+                            help='Skip the records committed by a previous run')
+
+    def _read_checkpoint(self, path):
+        try:
+            with open(path, encoding='utf-8') as checkpoint:
+                return json.load(checkpoint)['records']
+        except FileNotFoundError:
+            return 0
+
+    def _write_checkpoint(self, path, records):
+        with open(path, 'w', encoding='utf-8') as checkpoint:
+            json.dump({'records': records}, checkpoint)
+
+    def handle(self, *args, **kwargs):
+        path = kwargs['path']
+        batch_size = kwargs['batch_size']
+        if batch_size < 1:
+            raise CommandError('The batch size must be positive')
+        checkpoint = kwargs['checkpoint'] or f'{path}.checkpoint'
+        committed = self._read_checkpoint(checkpoint) if kwargs['resume'] else 0
+        # The file is opened and read by the first batch
+        records = enumerate(read_records(path, kwargs['format']), start=1)
+        if committed:
+            self.stdout.write(f'Resuming after {committed} records')
+            records = islice(records, committed, None)
+
+        importer = CatalogImporter()
+        failed = 0
+        processed = 0
+        start = time.monotonic()
+        while True:
+            try:
+                batch = list(islice(records, batch_size))
+            except (OSError, UnicodeDecodeError, csv.Error) as error:
+                raise CommandError(
+                    f'Cannot read {path} after record {committed}: {error}') from error
+            if not batch:
+                break
+            try:
+                with transaction.atomic():
+                    errors = importer.import_batch(batch)
+            except Exception as error:
+                raise CommandError(
+                    f'Batch of records {batch[0][0]} to {batch[-1][0]} failed: {error}. '
+                    f'Fix the input and rerun with --resume to continue after record '
+                    f'{committed}') from error
+            committed = batch[-1][0]
+            self._write_checkpoint(checkpoint, committed)
+            for number, messages in errors:
+                for message in messages:
+                    self.stderr.write(f'Record {number}: {message}')
+            failed += len(errors)
+            processed += len(batch)
+            rate = processed / max(time.monotonic() - start, 1e-6)
+            self.stdout.write(f'{committed} records processed ({rate:.0f} records/s)')
+
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        created = ', '.join(f'{importer.created[name]} {name}s'
+                            for name in ('author', 'saga', 'book', 'genre', 'language'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Catalog imported: {created} created, {failed} records rejected'))
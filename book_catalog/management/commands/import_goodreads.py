@@ -0,0 +1,39 @@
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from book_catalog.goodreads import BATCH_SIZE, ShelfImporter, read_goodreads
+
+
+class Command(BaseCommand):
+    """
+    Import a Goodreads export file into the shelf of a user.
+    """
+    help = 'Imports a Goodreads export (CSV) into the shelf of a user'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Goodreads export file')
+        parser.add_argument('--user', required=True, help='Username of the owner of the shelf')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help='Number of relations written per transaction')
+
+    def handle(self, *args, **kwargs):
+        try:
+            user = User.objects.get(username=kwargs['user'])
+        except User.DoesNotExist as error:
+            raise CommandError(f"Unknown user {kwargs['user']}") from error
+        importer = ShelfImporter(user, batch_size=kwargs['batch_size'])
+        start = time.monotonic()
+
+        def progress():
+            rate = importer.rows / max(time.monotonic() - start, 1e-6)
+            self.stdout.write(f'{importer.rows} rows read ({rate:.0f} rows/s)')
+        try:
+            with open(kwargs['path'], 'rb') as binary_file:
+                importer.import_rows(read_goodreads(binary_file), progress)
+        except (OSError, ValueError) as error:
+            raise CommandError(error) from error
+        for row in importer.unmatched:
+            self.stderr.write(f"Row {row['row']}: {row['title']} ({row['author']}): {row['reason']}")
+        self.stdout.write(self.style.SUCCESS(
+            f'{importer.imported} of {importer.rows} rows imported, '
+            f'{len(importer.unmatched)} not imported'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from book_catalog.models import Book
+
+
+class Command(BaseCommand):
+    """
+    Recompute the stored rating and review statistics of every book.
+    """
+    help = 'Rebuilds the rating and review statistics stored on each book'
+
+    def handle(self, *args, **kwargs):
+        updated = Book.objects.all().refresh_rating_stats()
+        self.stdout.write(self.style.SUCCESS(f'Rating statistics rebuilt for {updated} books'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from book_catalog import search
+
+
+class Command(BaseCommand):
+    """
+    Rebuild the full text search index of the books.
+    """
+    help = 'Rebuilds the full text search index of the books'
+
+    def handle(self, *args, **kwargs):
+        if not search.is_available():
+            self.stdout.write(self.style.WARNING('Full text search is not available in this data base'))
+            return
+        indexed = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'Search index rebuilt with {indexed} books'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from book_catalog import images
+
+
+class Command(BaseCommand):
+    """
+    Move the covers and photos uploaded before the content-addressed storage
+    to the names given by their content.
+    """
+    help = 'Renames the existing covers and photos by the hash of their content'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=images.REHASH_BATCH_SIZE,
+                            help='Objects whose new name is saved at a time')
+        parser.add_argument('--delete-old', action='store_true',
+                            help='Delete the old files once they are no longer used')
+
+    def handle(self, *args, **kwargs):
+        def progress(counts):
+            if kwargs['verbosity'] > 1:
+                self.stdout.write(f"{model._meta.verbose_name_plural}: {counts['renamed']} renamed")
+        for model in images.IMAGE_FIELDS:
+            counts = images.rehash_images(model, kwargs['batch_size'], kwargs['delete_old'],
+                                          progress)
+            self.stdout.write(self.style.SUCCESS(
+                f"{model._meta.verbose_name_plural.capitalize()}: {counts['renamed']} images "
+                f"renamed, {counts['duplicates']} of them duplicates, "
+                f"{counts['missing']} files missing"))
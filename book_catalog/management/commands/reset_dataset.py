@@ -0,0 +1,28 @@
+import time
+from django.core.management.base import BaseCommand
+from book_catalog.dataset import reset
+
+
+class Command(BaseCommand):
+    """
+    Delete the catalog, the users and their shelves with one statement per
+    table, e.g. between the runs of a benchmark.
+    """
+    help = 'Deletes every book, author, user and shelf and resets the id sequences'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vacuum', action='store_true',
+                            help='Rebuild the data base file to give the free space back')
+        parser.add_argument('--noinput', '--no-input', action='store_false', dest='interactive',
+                            help='Do not ask for confirmation')
+
+    def handle(self, *args, **kwargs):
+        if kwargs['interactive']:
+            answer = input('This deletes every book, author, user and shelf. Type "yes" to continue: ')
+            if answer != 'yes':
+                self.stdout.write('Reset cancelled')
+                return
+        start = time.monotonic()
+        tables = reset(vacuum=kwargs['vacuum'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(tables)} tables emptied in {time.monotonic() - start:.1f}s'))
@@ -0,0 +1,34 @@
+import os
+from django.core.management.base import BaseCommand
+from book_catalog import jobs
+
+
+class Command(BaseCommand):
+    """
+    Run the queued jobs (image derivatives, large shelf imports) outside of
+    the web server, in a pool of processes.
+    """
+    help = 'Runs the queued jobs in a pool of processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                            help='Number of jobs run at the same time, 0 runs them in this '
+                                 'process (default: number of processors)')
+        parser.add_argument('--drain', action='store_true',
+                            help='Stop when the queue is empty instead of waiting for new jobs')
+        parser.add_argument('--poll-interval', type=float, default=jobs.POLL_INTERVAL,
+                            help='Seconds between two checks of an empty queue')
+
+    def handle(self, *args, **kwargs):
+        def report(job, status):
+            self.stdout.write(f'Job {job.pk} {job.task}{tuple(job.args)}: '
+                              f'{dict(job.STATUS_CHOICES)[status]}')
+        worker = jobs.Worker(kwargs['processes'], kwargs['poll_interval'],
+                             report if kwargs['verbosity'] > 1 else None)
+        try:
+            worker.run(drain=kwargs['drain'])
+        except KeyboardInterrupt:
+            self.stdout.write('Worker stopped, the unfinished jobs are pending again')
+        self.stdout.write(self.style.SUCCESS(
+            f"Jobs run: {worker.results['d']} done, {worker.results['p']} to retry, "
+            f"{worker.results['f']} failed"))
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.9 on 2026-10-18 04:00
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_rating_stats(apps, schema_editor):
+    Book = apps.get_model("book_catalog", "Book")
+    UserBookRelation = apps.get_model("book_catalog", "UserBookRelation")
+    relations = UserBookRelation.objects.filter(book=OuterRef("pk")).order_by().values("book")
+    ratings = relations.filter(rating__isnull=False)
+    reviews = relations.filter(review__isnull=False).exclude(review="")
+    Book.objects.update(
+        rating_sum=Coalesce(Subquery(ratings.annotate(total=Sum("rating")).values("total")), 0),
+        rating_count=Coalesce(Subquery(ratings.annotate(total=Count("pk")).values("total")), 0),
+        review_count=Coalesce(Subquery(reviews.annotate(total=Count("pk")).values("total")), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("book_catalog", "0020_alter_book_genre"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="book",
+            name="rating_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="rating_sum",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="review_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_rating_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.9 on 2026-10-18 05:10
+
+from django.db import migrations
+
+
+FTS_TABLE = "book_catalog_book_fts"
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        "title, summary, saga, author, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+    schema_editor.execute(
+        f"INSERT INTO {FTS_TABLE} (rowid, title, summary, saga, author) "
+        "SELECT b.id, b.title, COALESCE(b.summary, ''), COALESCE(s.name, ''), "
+        "a.first_name || ' ' || a.last_name "
+        "FROM book_catalog_book AS b "
+        "INNER JOIN book_catalog_author AS a ON a.id = b.author_id "
+        "LEFT OUTER JOIN book_catalog_booksaga AS s ON s.id = b.saga_id"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("book_catalog", "0021_book_rating_stats"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.9 on 2026-10-18 06:20
+
+from django.db import migrations, models
+from django.db.models import Avg, OuterRef, Subquery
+
+
+def fill_rating_average(apps, schema_editor):
+    Book = apps.get_model("book_catalog", "Book")
+    UserBookRelation = apps.get_model("book_catalog", "UserBookRelation")
+    ratings = UserBookRelation.objects.filter(book=OuterRef("pk"), rating__isnull=False)
+    Book.objects.update(
+        rating_average=Subquery(
+            ratings.order_by().values("book").annotate(average=Avg("rating")).values("average")
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("book_catalog", "0022_book_search_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="book",
+            name="rating_average",
+            field=models.FloatField(db_index=True, editable=False, null=True),
+        ),
+        migrations.RunPython(fill_rating_average, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.9 on 2026-10-18 07:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("book_catalog", "0023_book_rating_average"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="userbookrelation",
+            index=models.Index(
+                fields=["book", "-review_date"], name="relation_book_review_date_idx"
+            ),
+        ),
+    ]
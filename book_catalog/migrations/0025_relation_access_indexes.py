@@ -0,0 +1,32 @@
+# Generated by Django 4.2.9 on 2026-10-18 07:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("book_catalog", "0024_userbookrelation_review_index"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="book",
+            name="publish_date",
+            field=models.DateField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="userbookrelation",
+            index=models.Index(
+                fields=["user", "status", "read_date"], name="relation_user_status_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="userbookrelation",
+            index=models.Index(
+                condition=models.Q(("rating__isnull", False)),
+                fields=["book", "rating"],
+                name="relation_book_rating_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.9 on 2026-10-18 08:15
+
+import uuid
+
+from django.db import migrations, models
+
+
+def copy_ids_to_uuid(apps, schema_editor):
+    """
+    Keep the current UUID keys as the public ids of the relations.
+    """
+    UserBookRelation = apps.get_model("book_catalog", "UserBookRelation")
+    UserBookRelation.objects.update(uuid=models.F("id"))
+
+
+def renumber_ids(apps, schema_editor):
+    """
+    Replace the UUID keys by sequential integers in insertion order, which
+    the following AlterField converts to an integer primary key.
+    """
+    if schema_editor.connection.vendor != "sqlite":
+        raise RuntimeError("This migration only supports SQLite")
+    table = apps.get_model("book_catalog", "UserBookRelation")._meta.db_table
+    schema_editor.execute(f"UPDATE {table} SET id = rowid")
+
+
+def restore_uuid_ids(apps, schema_editor):
+    UserBookRelation = apps.get_model("book_catalog", "UserBookRelation")
+    UserBookRelation.objects.update(id=models.F("uuid"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("book_catalog", "0025_relation_access_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="userbookrelation",
+            name="uuid",
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.RunPython(copy_ids_to_uuid, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="userbookrelation",
+            name="uuid",
+            field=models.UUIDField(
+                default=uuid.uuid4,
+                editable=False,
+                help_text="Public ID for this particular book",
+                unique=True,
+            ),
+        ),
+        migrations.RunPython(renumber_ids, restore_uuid_ids),
+        migrations.AlterField(
+            model_name="userbookrelation",
+            name="id",
+            field=models.BigAutoField(
+                auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+            ),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.9 on 2026-10-18 09:30
+
+import book_catalog.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("book_catalog", "0028_job"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="author",
+            name="photo",
+            field=models.ImageField(
+                blank=True,
+                null=True,
+                storage=book_catalog.storage.ContentAddressedStorage(),
+                upload_to="authors/",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="book",
+            name="cover_image",
+            field=models.ImageField(
+                blank=True,
+                null=True,
+                storage=book_catalog.storage.ContentAddressedStorage(),
+                upload_to="covers/",
+            ),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.9 on 2026-10-18 09:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("book_catalog", "0029_content_addressed_images"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="author",
+            name="photo_height",
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="author",
+            name="photo_placeholder",
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name="author",
+            name="photo_width",
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="cover_height",
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="cover_placeholder",
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="cover_width",
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.9 on 2026-10-18 06:13
+
+import book_catalog.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('book_catalog', '0031_author_name_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='shelfimport',
+            name='file',
+            field=models.FileField(blank=True, storage=book_catalog.storage.PrivateStorage(), upload_to='imports/'),
+        ),
+    ]
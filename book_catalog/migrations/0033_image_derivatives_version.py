@@ -0,0 +1,23 @@
+# Generated by Django 4.2.9 on 2026-10-18 06:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('book_catalog', '0032_private_shelf_imports'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='author',
+            name='photo_derivatives',
+            field=models.CharField(blank=True, editable=False, max_length=8),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='cover_derivatives',
+            field=models.CharField(blank=True, editable=False, max_length=8),
+        ),
+    ]
@@ -1,9 +1,15 @@
 import uuid
-from django.db import models
+from django.db import models, transaction
+from django.db.models import (Avg, Case, Count, F, FloatField, OuterRef, Q, Subquery, Sum,
+                              Value, When)
+from django.db.models.functions import Cast, Coalesce
 from django.urls import reverse
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from . import counts, object_cache
+from .storage import ContentAddressedStorage, PrivateStorage
 
 class Genre(models.Model):
     """
@@ -79,21 +85,71 @@ class Language(models.Model):
             )
         ]
 
+class BookQuerySet(models.QuerySet):
+    """
+    QuerySet for the Book model.
+    """
+    def refresh_rating_stats(self):
+        """
+        Recompute the stored rating and review statistics of the books from their
+        relations in a single UPDATE statement.
+        """
+        relations = UserBookRelation.objects.filter(book=OuterRef('pk')).order_by().values('book')
+        ratings = relations.filter(rating__isnull=False)
+        reviews = relations.filter(review__isnull=False).exclude(review='')
+        return self.update(
+            rating_sum=Coalesce(Subquery(ratings.annotate(total=Sum('rating')).values('total')), 0),
+            rating_count=Coalesce(Subquery(ratings.annotate(total=Count('pk')).values('total')), 0),
+            rating_average=Subquery(ratings.annotate(average=Avg('rating')).values('average')),
+            review_count=Coalesce(Subquery(reviews.annotate(total=Count('pk')).values('total')), 0),
+        )
+
+    def apply_rating_delta(self, rating_sum=0, rating_count=0, review_count=0):
+        """
+        Add the given increments to the stored statistics of the books.
+        """
+        if not (rating_sum or rating_count or review_count):
+            return 0
+        # Every expression of the UPDATE reads the values prior to the update
+        rating_average = Case(
+            When(rating_count__gt=-rating_count,
+                 then=Cast(F('rating_sum') + rating_sum, FloatField())
+                 / (F('rating_count') + rating_count)),
+            default=Value(None), output_field=FloatField())
+        return self.update(rating_sum=F('rating_sum') + rating_sum,
+                           rating_count=F('rating_count') + rating_count,
+                           rating_average=rating_average,
+                           review_count=F('review_count') + review_count)
+
 class Book(models.Model):
     """
     Model representing a book (but not a specific copy of a book).
     """
+    RATING_STATS_FIELDS = ('rating_sum', 'rating_count', 'rating_average', 'review_count')
+
     title = models.CharField(max_length=200,)
     saga = models.ForeignKey('BookSaga', on_delete=models.CASCADE, null=True, blank=True)
     saga_volume = models.IntegerField(null=True, blank=True)
     author = models.ForeignKey('Author', on_delete=models.CASCADE, null=False)
-    publish_date = models.DateField(null=True, blank=True)
+    publish_date = models.DateField(null=True, blank=True, db_index=True)
     summary = models.TextField(max_length=1000, null=True, blank=True)
     isbn = models.CharField(max_length=13,
             help_text='13 Character <a href="https://www.isbn-international.org/content/what-isbn">ISBN number</a>', null=True, blank=True)
     genre = models.ManyToManyField(Genre)
     language = models.ForeignKey('Language', on_delete=models.SET_NULL, null=True, blank=True)
-    cover_image = models.ImageField(upload_to='covers/', null=True, blank=True)
+    cover_image = models.ImageField(upload_to='covers/', storage=ContentAddressedStorage(),
+                                    null=True, blank=True)
+    # Set by the job generating the derivatives of the cover (see images.py)
+    cover_placeholder = models.TextField(blank=True, editable=False)
+    cover_width = models.PositiveIntegerField(null=True, editable=False)
+    cover_height = models.PositiveIntegerField(null=True, editable=False)
+    cover_derivatives = models.CharField(max_length=8, blank=True, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_average = models.FloatField(null=True, editable=False, db_index=True)
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = BookQuerySet.as_manager()
 
     class Meta:
         """
@@ -136,37 +192,26 @@ class Book(models.Model):
         """
         Returns the number of ratings of the book.
         """
-        ratings = UserBookRelation.objects.filter(book=self).values_list('rating')
-        ratings = [rating[0] for rating in ratings if rating[0] is not None]
-        return len(ratings)
+        return self.rating_count
 
     def number_of_reviews(self):
         """
         Returns the number of reviews of the book.
         """
-        reviews = UserBookRelation.objects.filter(book=self).values_list('review')
-        reviews = [review[0] for review in reviews if review[0] is not None]
-        return len(reviews)
+        return self.review_count
 
     def average_rating(self):
         """
         Returns the average rating of the book.
         """
-        ratings = UserBookRelation.objects.filter(book=self).values_list('rating')
-        ratings = [rating[0] for rating in ratings if rating[0] is not None]
-        if len(ratings)>0:
-            return sum(ratings) / len(ratings)
-        return None
+        return self.rating_average
 
     def get_reviews(self):
         """
-        Returns the reviews of the book.
+        Returns the reviews of the book, most recent first.
         """
-        reviews = UserBookRelation.objects.filter(book=self).filter(review__isnull=False).order_by('-review_date')
-        reviews = [review for review in reviews if review.review not in (None, '')]
-        if reviews:
-            return reviews
-        return None
+        return UserBookRelation.objects.filter(book=self, review__isnull=False).exclude(
+            review='').select_related('user').order_by('-review_date', '-pk')
 
     def clean(self):
         if (self.saga is not None) and (self.saga_volume is None):
@@ -181,7 +226,7 @@ class Book(models.Model):
             if self.publish_date > timezone.now().date():
                 raise ValidationError("Publish date cannot be in the future")
         if self.saga is not None:
-            if self.saga.author != self.author:
+            if self.saga.author_id != self.author_id:
                 raise ValidationError("Saga author must be the same as the book author")
         if (self.isbn is not None) and (len(self.isbn) != 13):
             raise ValidationError(f"ISBN must have 13 characters, current length is {len(self.isbn)}")
@@ -191,8 +236,106 @@ class Book(models.Model):
     def save(self, *args, **kwargs):
         # self.clean()
         self.full_clean()
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # The rating statistics are maintained by the relations, never
+            # overwrite them with the (possibly stale) values of this instance.
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key
+                                       and field.name not in self.RATING_STATS_FIELDS]
         super().save(*args, **kwargs)
 
+def book_stats_aggregates(prefix=''):
+    """
+    Aggregates over a set of books: mean of the book average ratings, total
+    of ratings, total of reviews and number of books. The prefix is the
+    lookup path from the aggregated model to the books (e.g. 'book__').
+    """
+    return {
+        'rating_average': Avg(f'{prefix}rating_average'),
+        'ratings_total': Coalesce(Sum(f'{prefix}rating_count'), 0),
+        'reviews_total': Coalesce(Sum(f'{prefix}review_count'), 0),
+        'books_total': Count(f'{prefix}id'),
+    }
+
+def _get_book_set_stats(instance, books):
+    """
+    Returns the book statistics annotated on the instance, or computes them
+    over the given books in a single aggregate query.
+    """
+    aggregates = book_stats_aggregates()
+    if all(hasattr(instance, name) for name in aggregates):
+        return {name: getattr(instance, name) for name in aggregates}
+    return books.order_by().aggregate(**aggregates)
+
+class StatsQuerySet(models.QuerySet):
+    """
+    QuerySet for models grouping books (authors and sagas) that annotates
+    the statistics of their books in a single SQL aggregate.
+    """
+    def with_stats(self):
+        """
+        Annotate rating_average, ratings_total, reviews_total and books_total.
+        """
+        return self.annotate(**book_stats_aggregates('book__'))
+
+class UserBookRelationQuerySet(models.QuerySet):
+    """
+    QuerySet for the UserBookRelation model. Bulk operations do not send model
+    signals, so they refresh the rating statistics of the affected books here.
+    Updates of the status or the read date alone do not look up the users
+    they change, their callers forget the counts of the shelves (see
+    counts.invalidate_shelf_counts).
+    """
+    RATING_FIELDS = {'book', 'book_id', 'rating', 'review'}
+
+    def bulk_create(self, objs, *args, refresh_stats=True, **kwargs):
+        """
+        Insert the relations and refresh the statistics of their books.
+        Callers inserting many batches may pass refresh_stats=False and
+        refresh the statistics of all the books once at the end.
+        """
+        objs = list(objs)
+        with transaction.atomic(using=self.db):
+            created = super().bulk_create(objs, *args, **kwargs)
+            if not refresh_stats:
+                book_ids = set()
+            elif kwargs.get('update_conflicts'):
+                book_ids = {obj.book_id for obj in objs}
+            else:
+                # New relations without rating or review leave the statistics unchanged
+                book_ids = {obj.book_id for obj in objs if obj.rating is not None or obj.review}
+            if book_ids:
+                Book.objects.filter(pk__in=book_ids).refresh_rating_stats()
+        invalidate_book_caches(*book_ids)
+        counts.invalidate_shelf_counts(*(obj.user_id for obj in objs))
+        invalidate_reviewer_stats(*{obj.user_id for obj in objs})
+        return created
+
+    def reviewer_stats(self):
+        """
+        Returns the number of reviews and the average rating of each user,
+        grouped by user_id.
+        """
+        return self.order_by().values('user_id').annotate(
+            review_count=Count('id', filter=Q(review__isnull=False) & ~Q(review='')),
+            average_rating=Avg('rating'))
+
+    def update(self, **kwargs):
+        if not self.RATING_FIELDS.intersection(kwargs):
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db):
+            matched = list(self.values_list('book_id', 'user_id'))
+            book_ids = {book_id for book_id, user_id in matched}
+            user_ids = {user_id for book_id, user_id in matched}
+            rows = super().update(**kwargs)
+            for name in ('book', 'book_id'):
+                if name in kwargs:
+                    book_ids.add(getattr(kwargs[name], 'pk', kwargs[name]))
+            Book.objects.filter(pk__in=book_ids).refresh_rating_stats()
+        invalidate_book_caches(*book_ids)
+        invalidate_reviewer_stats(*user_ids)
+        return rows
+
 class UserBookRelation(models.Model):
     """
     Model representing a book state (e.g. read, to read, reading).
@@ -202,27 +345,65 @@ class UserBookRelation(models.Model):
         ('t', 'To read'),
         ('i', 'Reading'),
     )
+    STATUS_DISPLAY = {
+        'r': 'Read',
+        't': 'To Read',
+        'i': 'Reading',
+    }
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     book = models.ForeignKey(Book, on_delete=models.CASCADE)
     status = models.CharField(max_length=1, choices=STATUS_CHOICES, null=True, blank=True)
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, help_text='Unique ID for this particular book',)
+    uuid = models.UUIDField(default=uuid.uuid4, unique=True, editable=False,
+                            help_text='Public ID for this particular book')
     reading_date = models.DateField(null=True, blank=True)
     read_date = models.DateField(null=True, blank=True)
     rating = models.PositiveIntegerField(choices=[(i, str(i)) for i in range(1, 6)], null=True, blank=True)  # Por ejemplo, 1 a 5 estrellas
     review = models.TextField(max_length=1000, null=True, blank=True)
     review_date = models.DateField(null=True, blank=True)
 
+    objects = UserBookRelationQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_rating_state()
+        return instance
+
     def __str__(self):
         """
         String for representing the Model object.
         """
         return f'{self.user.username} ({self.book.title})'
 
+    def rating_state(self):
+        """
+        Returns the contribution of the relation to the statistics of its book,
+        or None if it cannot be known without querying the data base.
+        """
+        if self.get_deferred_fields().intersection({'book_id', 'rating', 'review'}):
+            return None
+        return (self.book_id, self.rating, bool(self.review))
+
+    def remember_rating_state(self):
+        """
+        Store the current contribution of the relation, which is the one saved
+        in the data base.
+        """
+        self._saved_rating_state = self.rating_state()
+
     class Meta:
         """
         Metadata for the model.
         """
         unique_together = ('user', 'book')
+        indexes = [
+            models.Index(fields=['book', '-review_date'], name='relation_book_review_date_idx'),
+            # Shelves by status, and books read in a given year
+            models.Index(fields=['user', 'status', 'read_date'], name='relation_user_status_idx'),
+            # Ratings of a book, e.g. to recompute its statistics
+            models.Index(fields=['book', 'rating'], condition=Q(rating__isnull=False),
+                         name='relation_book_rating_idx'),
+        ]
 
     def clean(self):
         if self.status not in ['r', 't', 'i', None]:
@@ -239,18 +420,58 @@ class UserBookRelation(models.Model):
 
     def save(self, *args, **kwargs):
         self.full_clean()
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
     def display_status(self):
         """
         Creates a string for the status. This is required to display status in Admin.
         """
-        if self.status == 'r':
-            return "Read"
-        if self.status == 't':
-            return "To Read"
-        if self.status == 'i':
-            return "Reading"
+        return self.STATUS_DISPLAY.get(self.status)
+
+REVIEWER_STATS_TIMEOUT = 60 * 60
+
+def _reviewer_stats_key(user_id):
+    return f'book_catalog:reviewer:{user_id}'
+
+def get_reviewer_stats(user_ids, use_cache=True):
+    """
+    Returns a dict mapping each user id to the number of reviews and the
+    average rating of the user. The users missing from the cache are computed
+    together in a single grouped query.
+    """
+    keys = {_reviewer_stats_key(user_id): user_id for user_id in set(user_ids)}
+    cached = cache.get_many(keys) if use_cache else {}
+    stats = {keys[key]: value for key, value in cached.items()}
+    missing = [user_id for key, user_id in keys.items() if key not in cached]
+    if missing:
+        computed = {user_id: {'review_count': 0, 'average_rating': None} for user_id in missing}
+        rows = UserBookRelation.objects.filter(user_id__in=missing).reviewer_stats()
+        for row in rows:
+            computed[row.pop('user_id')] = row
+        if use_cache:
+            cache.set_many({_reviewer_stats_key(user_id): value
+                            for user_id, value in computed.items()}, REVIEWER_STATS_TIMEOUT)
+        stats.update(computed)
+    return stats
+
+def invalidate_reviewer_stats(*user_ids):
+    """
+    Forget the cached reviewer statistics of the given users.
+    """
+    cache.delete_many([_reviewer_stats_key(user_id) for user_id in user_ids])
+
+def invalidate_book_caches(*book_ids):
+    """
+    Forget the cached values (see object_cache.py) of the given books and of
+    their authors and sagas, which show their statistics.
+    """
+    if not book_ids:
+        return
+    parents = list(Book.objects.filter(pk__in=book_ids).values_list('author_id', 'saga_id'))
+    object_cache.bump_version(Book, *book_ids)
+    object_cache.bump_version(Author, *(author_id for author_id, _ in parents))
+    object_cache.bump_version(BookSaga, *(saga_id for _, saga_id in parents))
 
 class Author(models.Model):
     """
@@ -260,15 +481,27 @@ class Author(models.Model):
     last_name = models.CharField(max_length=100)
     year_of_birth = models.IntegerField(null = True, blank = True)
     year_of_death = models.IntegerField(null = True, blank = True)
-    photo = models.ImageField(upload_to='authors/', null=True, blank=True)
+    photo = models.ImageField(upload_to='authors/', storage=ContentAddressedStorage(),
+                              null=True, blank=True)
+    # Set by the job generating the derivatives of the photo (see images.py)
+    photo_placeholder = models.TextField(blank=True, editable=False)
+    photo_width = models.PositiveIntegerField(null=True, editable=False)
+    photo_height = models.PositiveIntegerField(null=True, editable=False)
+    photo_derivatives = models.CharField(max_length=8, blank=True, editable=False)
     social_media = models.URLField(max_length=200, null=True, blank=True)
     biography = models.TextField(max_length=1000, null=True, blank=True)
 
+    objects = StatsQuerySet.as_manager()
+
     class Meta:
         """
         Metadata for the model.
         """
         ordering = ['last_name', 'first_name']
+        indexes = [
+            # Author list, and counts and searches of the authors by name
+            models.Index(fields=['last_name', 'first_name'], name='author_name_idx'),
+        ]
 
     def get_absolute_url(self):
         """
@@ -282,31 +515,36 @@ class Author(models.Model):
         """
         return f'{self.first_name} {self.last_name}'
 
+    def get_stats(self):
+        """
+        Returns the statistics of the author's books, taken from the
+        annotations of Author.objects.with_stats() when available.
+        """
+        return _get_book_set_stats(self, Book.objects.filter(author=self))
+
     def average_rating(self):
         """
         Returns the average rating of the author.
         """
-        books = Book.objects.filter(author=self)
-        ratings = [book.average_rating() for book in books if book.average_rating() is not None]
-        if ratings:
-            return sum(ratings) / len(ratings)
-        return None
+        return self.get_stats()['rating_average']
 
     def number_of_ratings(self):
         """
         Returns the number of ratings of the author.
         """
-        books = Book.objects.filter(author=self)
-        ratings = [book.number_of_ratings() for book in books]
-        return sum(ratings)
+        return self.get_stats()['ratings_total']
 
     def number_of_reviews(self):
         """
         Returns the number of reviews of the author.
         """
-        books = Book.objects.filter(author=self)
-        reviews = [book.number_of_reviews() for book in books]
-        return sum(reviews)
+        return self.get_stats()['reviews_total']
+
+    def number_of_books(self):
+        """
+        Returns the number of books of the author.
+        """
+        return self.get_stats()['books_total']
 
     def _check_year_of_birth(self):
         """
@@ -357,21 +595,26 @@ class BookSaga(models.Model):
     author = models.ForeignKey(Author, on_delete=models.CASCADE, related_name='saga', null = False)
     description = models.TextField(max_length=1000, null=True, blank=True)
 
+    objects = StatsQuerySet.as_manager()
+
     def __str__(self):
         """
         String for representing the Model object.
         """
         return str(self.name)
 
+    def get_stats(self):
+        """
+        Returns the statistics of the saga's books, taken from the
+        annotations of BookSaga.objects.with_stats() when available.
+        """
+        return _get_book_set_stats(self, Book.objects.filter(saga=self))
+
     def average_rating(self):
         """
-        Returns the average rating of the author.
+        Returns the average rating of the saga.
         """
-        books = Book.objects.filter(saga=self)
-        ratings = [book.average_rating() for book in books if book.average_rating() is not None]
-        if ratings:
-            return sum(ratings) / len(ratings)
-        return None
+        return self.get_stats()['rating_average']
 
     def average_rating_over_100(self):
         """
@@ -381,19 +624,15 @@ class BookSaga(models.Model):
 
     def number_of_ratings(self):
         """
-        Returns the number of ratings of the author.
+        Returns the number of ratings of the saga.
         """
-        books = Book.objects.filter(saga=self)
-        ratings = [book.number_of_ratings() for book in books]
-        return sum(ratings)
+        return self.get_stats()['ratings_total']
 
     def number_of_reviews(self):
         """
-        Returns the number of reviews of the author.
+        Returns the number of reviews of the saga.
         """
-        books = Book.objects.filter(saga=self)
-        reviews = [book.number_of_reviews() for book in books]
-        return sum(reviews)
+        return self.get_stats()['reviews_total']
 
     def get_absolute_url(self):
         """
@@ -417,3 +656,78 @@ class BookSaga(models.Model):
 
     class Meta:
         unique_together = ('name', 'author')
+
+class ShelfImport(models.Model):
+    """
+    Model representing the import of a Goodreads export file into the shelf
+    of a user, with its progress and the rows that could not be imported.
+    """
+    STATUS_CHOICES = (
+        ('p', 'Pending'),
+        ('r', 'Running'),
+        ('d', 'Done'),
+        ('f', 'Failed'),
+    )
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Deleted when the import finishes (see goodreads.run_shelf_import)
+    file = models.FileField(upload_to='imports/', storage=PrivateStorage(), blank=True)
+    status = models.CharField(max_length=1, choices=STATUS_CHOICES, default='p')
+    created = models.DateTimeField(auto_now_add=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    rows = models.PositiveIntegerField(default=0)
+    imported = models.PositiveIntegerField(default=0)
+    unmatched = models.JSONField(default=list, blank=True)
+    error = models.TextField(blank=True)
+
+    def __str__(self):
+        """
+        String for representing the Model object.
+        """
+        return f'{self.user.username} ({self.created:%Y-%m-%d %H:%M})'
+
+    def get_absolute_url(self):
+        """
+        Returns the url to access the progress and report of the import.
+        """
+        return reverse('shelf-import-detail', args=[str(self.id)])
+
+    def is_finished(self):
+        """
+        Returns True if the import is done or failed.
+        """
+        return self.status in ('d', 'f')
+
+
+class Job(models.Model):
+    """
+    Model representing a task run outside of the requests by the worker of
+    the run_jobs command (see jobs.py), with its retries.
+    """
+    STATUS_CHOICES = (
+        ('p', 'Pending'),
+        ('r', 'Running'),
+        ('d', 'Done'),
+        ('f', 'Failed'),
+    )
+    task = models.CharField(max_length=50)
+    args = models.JSONField(default=list, blank=True)
+    status = models.CharField(max_length=1, choices=STATUS_CHOICES, default='p')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    claimed_by = models.CharField(max_length=32, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        """
+        String for representing the Model object.
+        """
+        return f'{self.task}{tuple(self.args)} ({self.get_status_display()})'
@@ -0,0 +1,154 @@
+"""
+Versioned cache of the values computed for a model instance.
+
+The values of an object are stored under keys holding its model, its
+primary key and its current version, e.g.
+book_catalog:object:book_catalog.book:42:v1760772000000000000:context. The
+model signals (see signals.py) bump the version of an object when it or
+something it shows changes, which makes all its cached values unreachable
+at once; they expire after OBJECT_TIMEOUT. A bump deletes the version, and
+the next read starts a new one from the clock, so an evicted version can
+never address old values.
+
+The values listing objects of the whole catalog (e.g. the recent books) are
+stored under the version of the catalog instead, bumped when any book,
+author or saga changes, see get_or_set_catalog().
+
+The templates cache their fragments with the {% cache %} tag varying on
+the same versions, given in their context as object_version and
+catalog_version.
+
+The hits and misses of every kind of value are counted in the cache, so
+the counts of the server processes, the workers and the commands add up,
+see get_stats().
+"""
+import time
+from django.core.cache import cache
+from django.db import transaction
+
+OBJECT_TIMEOUT = 15 * 60
+CATALOG_VERSION_KEY = 'book_catalog:version:catalog'
+# Labels of the counted kinds of values, and the prefix of their counters
+STATS_LABELS_KEY = 'book_catalog:stats:labels'
+STATS_KEY_PREFIX = 'book_catalog:stats'
+_MISSING = object()
+
+
+def _version_key(model, pk):
+    return f'book_catalog:version:{model._meta.label_lower}:{pk}'
+
+def _get_version(key):
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(key, version, None):
+            # Another process started a version first
+            version = cache.get(key, version)
+    return version
+
+def _delete_versions(keys):
+    """
+    Delete version keys now and again once the current transaction is
+    committed, in case a value computed from the old rows was cached
+    meanwhile.
+    """
+    if keys:
+        cache.delete_many(keys)
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+def _stats_key(label, outcome):
+    return f'{STATS_KEY_PREFIX}:{outcome}:{label}'
+
+def _register_label(label):
+    """
+    Add a label to the list of the counted labels if it is not there.
+    """
+    labels = cache.get(STATS_LABELS_KEY, set())
+    if label not in labels:
+        cache.set(STATS_LABELS_KEY, labels | {label}, None)
+
+def _count(label, outcome):
+    """
+    Add one to the hits or misses of a label. The label is registered when
+    its counter is created, i.e. the first time or after a reset.
+    """
+    key = _stats_key(label, outcome)
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+            return
+        except ValueError:
+            # The counter was reset meanwhile
+            cache.add(key, 1, None)
+    _register_label(label)
+
+def _get_or_set(label, key, compute, timeout):
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        _count(label, 'hits')
+        return value
+    _count(label, 'misses')
+    value = compute()
+    cache.set(key, value, timeout)
+    return value
+
+def get_version(model, pk):
+    """
+    Returns the current version of an object.
+    """
+    return _get_version(_version_key(model, pk))
+
+def bump_version(model, *pks):
+    """
+    Forget the cached values of the objects of a model with the given
+    primary keys.
+    """
+    _delete_versions([_version_key(model, pk) for pk in set(pks) if pk is not None])
+
+def get_or_set(model, pk, name, compute, timeout=OBJECT_TIMEOUT):
+    """
+    Returns the value with the given name of an object, computed by calling
+    compute if it is not cached for the current version of the object.
+    """
+    key = f'book_catalog:object:{model._meta.label_lower}:{pk}:v{get_version(model, pk)}:{name}'
+    return _get_or_set(f'{model._meta.model_name}:{name}', key, compute, timeout)
+
+def get_catalog_version():
+    """
+    Returns the current version of the catalog.
+    """
+    return _get_version(CATALOG_VERSION_KEY)
+
+def bump_catalog_version():
+    """
+    Forget the cached values listing objects of the whole catalog.
+    """
+    _delete_versions([CATALOG_VERSION_KEY])
+
+def get_or_set_catalog(name, compute, timeout=OBJECT_TIMEOUT):
+    """
+    Returns the value of the catalog with the given name, computed by calling
+    compute if it is not cached for the current version of the catalog.
+    """
+    key = f'book_catalog:catalog:v{get_catalog_version()}:{name}'
+    return _get_or_set(f'catalog:{name}', key, compute, timeout)
+
+def get_stats():
+    """
+    Returns the hits and misses of all the processes for every kind of
+    value, e.g. {'book:context': {'hits': 10, 'misses': 2}}.
+    """
+    labels = sorted(cache.get(STATS_LABELS_KEY, set()))
+    counts = cache.get_many([_stats_key(label, outcome) for label in labels
+                             for outcome in ('hits', 'misses')])
+    return {label: {outcome: counts.get(_stats_key(label, outcome), 0)
+                    for outcome in ('hits', 'misses')}
+            for label in labels}
+
+def reset_stats():
+    """
+    Set the hit and miss counters to zero.
+    """
+    labels = cache.get(STATS_LABELS_KEY, set())
+    cache.delete_many([STATS_LABELS_KEY] + [_stats_key(label, outcome) for label in labels
+                                            for outcome in ('hits', 'misses')])
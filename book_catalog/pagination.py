@@ -0,0 +1,185 @@
+"""
+Keyset (seek) pagination.
+
+Pages are addressed by an opaque cursor holding the ordering values of the
+first or last row of the adjacent page, so fetching any page costs a single
+indexed range query however deep it is.
+"""
+import json
+import base64
+import binascii
+from operator import attrgetter
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import JsonResponse
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def encode_cursor(values, direction):
+    """
+    Returns the opaque token for the given ordering values and direction.
+    """
+    data = json.dumps([direction, values], cls=DjangoJSONEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, size):
+    """
+    Returns the (direction, values) of a token, or None if it is not valid.
+    """
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, values = json.loads(data)
+    except (binascii.Error, ValueError, TypeError):
+        return None
+    if direction not in (NEXT, PREVIOUS) or not isinstance(values, list) or len(values) != size:
+        return None
+    return direction, values
+
+def _get_field(model, path):
+    """
+    Returns the model field designated by a lookup path such as 'book__title'.
+    """
+    *relations, name = path.split('__')
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return model._meta.pk if name == 'pk' else model._meta.get_field(name)
+
+class KeysetPage:
+    """
+    A page of results with the cursors of its neighbour pages.
+    """
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+class KeysetPaginator:
+    """
+    Paginate a queryset by the given ordering, which must identify the rows
+    uniquely (the primary key is appended if it is missing). Fields prefixed
+    with '-' are sorted in descending order.
+    """
+    def __init__(self, queryset, ordering, per_page):
+        ordering = list(ordering)
+        if not {'pk', '-pk', 'id', '-id'}.intersection(ordering):
+            ordering.append('pk')
+        self.queryset = queryset
+        self.ordering = ordering
+        self.per_page = per_page
+        self.fields = [field.lstrip('-') for field in ordering]
+        self.model_fields = [_get_field(queryset.model, field) for field in self.fields]
+
+    def _get_values(self, obj):
+        return [attrgetter(field.replace('__', '.'))(obj) for field in self.fields]
+
+    def _clean_values(self, values):
+        """
+        Returns the values of a cursor converted to the types of their fields,
+        or None if any of them is not a valid value of its field.
+        """
+        cleaned = []
+        for field, value in zip(self.model_fields, values):
+            if value is None or isinstance(value, (dict, list)):
+                return None
+            try:
+                cleaned.append(field.to_python(value))
+            except (ValidationError, ValueError, TypeError):
+                return None
+        return cleaned
+
+    def _seek_condition(self, values, direction):
+        """
+        Returns the condition selecting the rows after (or before) the values.
+        """
+        condition = Q()
+        for position, (field, value) in enumerate(zip(self.ordering, values)):
+            descending = field.startswith('-')
+            lookup = 'lt' if descending == (direction == NEXT) else 'gt'
+            equal = {name: previous for name, previous in zip(self.fields[:position], values)}
+            condition |= Q(**equal, **{f'{self.fields[position]}__{lookup}': value})
+        return condition
+
+    def get_page(self, cursor=None):
+        """
+        Returns the page designated by the cursor, the first page if the
+        cursor is missing or not valid.
+        """
+        decoded = decode_cursor(cursor, len(self.fields)) if cursor else None
+        direction, values = decoded if decoded else (NEXT, None)
+        if values is not None:
+            values = self._clean_values(values)
+            if values is None:
+                direction = NEXT
+        if direction == NEXT:
+            ordering = self.ordering
+        else:
+            ordering = [field[1:] if field.startswith('-') else f'-{field}'
+                        for field in self.ordering]
+        queryset = self.queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self._seek_condition(values, direction))
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == PREVIOUS:
+            rows.reverse()
+        if not rows:
+            return KeysetPage(rows, None, None)
+        has_next = has_more if direction == NEXT else True
+        has_previous = values is not None if direction == NEXT else has_more
+        next_cursor = encode_cursor(self._get_values(rows[-1]), NEXT) if has_next else None
+        previous_cursor = (encode_cursor(self._get_values(rows[0]), PREVIOUS)
+                           if has_previous else None)
+        return KeysetPage(rows, next_cursor, previous_cursor)
+
+class KeysetPaginationMixin:
+    """
+    Mixin for list views that paginates by cursor instead of page number.
+    The page is returned as JSON when the request has ?format=json, each row
+    being built by the serialize_object() method of the view.
+    """
+    paginate_by = 25
+    keyset_ordering = None
+    cursor_kwarg = 'cursor'
+
+    def get_keyset_ordering(self):
+        return self.keyset_ordering or self.model._meta.ordering
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, self.get_keyset_ordering(), page_size)
+        page = paginator.get_page(self.request.GET.get(self.cursor_kwarg))
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+    def serialize_object(self, obj):
+        return {'id': obj.pk}
+
+    def render_to_response(self, context, **response_kwargs):
+        if self.request.GET.get('format') == 'json':
+            page = context['page_obj']
+            return JsonResponse({
+                'results': [self.serialize_object(obj) for obj in page],
+                'next': page.next_cursor,
+                'previous': page.previous_cursor,
+            })
+        return super().render_to_response(context, **response_kwargs)
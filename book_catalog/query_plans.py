@@ -0,0 +1,126 @@
+"""
+Query plan checks of the queries issued by the views.
+
+get_view_queries() requests the pages of the catalog with the test client,
+as a logged-in user, and records the SELECT queries they run, so the
+checked queries are always those of the current views. The requests run
+in a transaction rolled back at the end, on a sample author, saga, book,
+user and relation created for them, and without the cache, which would
+hide the queries of the cached values. SQLite reports a scan of a whole
+table without an index as "SCAN <table>", which is what the
+check_query_plans command flags.
+"""
+import re
+import uuid
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from . import pagination
+from .models import Author, Book, BookSaga, User, UserBookRelation
+
+FULL_SCAN_RE = re.compile(r'^SCAN (?!CONSTANT ROW)\S+$')
+# Settings of the requests: the test client host and no cache
+REQUEST_SETTINGS = {
+    'ALLOWED_HOSTS': ['testserver'],
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+}
+# Order of the rating column of the data tables, and a search
+DATA_TABLE_PARAMS = {'draw': 1, 'start': 0, 'length': 10, 'order[0][column]': 4,
+                     'order[0][dir]': 'desc', 'search[value]': 'sample'}
+
+
+def is_available():
+    """
+    Returns True if the query plans of the data base can be checked.
+    """
+    return connection.vendor == 'sqlite'
+
+class _Rollback(Exception):
+    pass
+
+def _create_sample():
+    """
+    Create the objects requested by get_view_queries(), with names not used
+    by the existing rows.
+    """
+    name = f'sample {uuid.uuid4().hex}'
+    user = User.objects.create(username=name[:150])
+    author = Author.objects.create(first_name='Sample', last_name=name)
+    saga = BookSaga.objects.create(name=name, author=author)
+    book = Book.objects.create(title=name, author=author, saga=saga, saga_volume=1)
+    UserBookRelation.objects.create(user=user, book=book, status='r', rating=5,
+                                    review='Sample review', review_date=timezone.now().date())
+    return user, author, saga, book
+
+def _get_requests(author, saga, book):
+    """
+    Returns the list of (name, url, params) of the requested pages, with
+    cursors after the sample objects for the keyset pages.
+    """
+    def cursor(*values):
+        return {'cursor': pagination.encode_cursor(list(values), pagination.NEXT)}
+    return [
+        ('index', reverse('index'), {}),
+        ('books', reverse('books'), {}),
+        ('books: next page', reverse('books'), cursor(book.title, book.author_id, book.pk)),
+        ('books: data table', reverse('books-data'), DATA_TABLE_PARAMS),
+        ('authors', reverse('authors'), {}),
+        ('authors: next page', reverse('authors'),
+         cursor(author.last_name, author.first_name, author.pk)),
+        ('authors: data table', reverse('authors-data'), DATA_TABLE_PARAMS),
+        ('my books', reverse('my-books'), {}),
+        ('my books: next page', reverse('my-books'), cursor(book.title, book.pk)),
+        ('my books: data table', reverse('my-books-data'), DATA_TABLE_PARAMS),
+        ('my books: export', reverse('export-shelf'), {}),
+        ('book detail', reverse('book-detail', args=[book.pk]), {}),
+        ('book detail: reviews', reverse('book-reviews', args=[book.pk]), {'page': 1}),
+        ('author detail', reverse('author-detail', args=[author.pk]), {}),
+        ('saga detail', reverse('saga-detail', args=[saga.pk]), {}),
+        ('search', reverse('search'), {'query': 'sample'}),
+        ('search: all books', reverse('search'), {}),
+    ]
+
+def get_view_queries():
+    """
+    Returns the list of (name, sql) of the distinct SELECT queries run by
+    the views, named by the first page running them.
+    """
+    queries = {}
+    try:
+        with override_settings(**REQUEST_SETTINGS), transaction.atomic():
+            user, author, saga, book = _create_sample()
+            client = Client()
+            client.force_login(user)
+            for name, url, params in _get_requests(author, saga, book):
+                with CaptureQueriesContext(connection) as captured:
+                    response = client.get(url, params)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                for number, query in enumerate(captured, start=1):
+                    if query['sql'].lstrip().upper().startswith('SELECT'):
+                        queries.setdefault(query['sql'], f'{name}: query {number}')
+            raise _Rollback
+    except _Rollback:
+        pass
+    return [(name, sql) for sql, name in queries.items()]
+
+def get_plan(query):
+    """
+    Returns the list of the steps of the query plan of a queryset or of an
+    SQL query.
+    """
+    if isinstance(query, str):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {query}')
+            # Every row is (id, parent, unused, detail)
+            return [row[3] for row in cursor.fetchall()]
+    # Every line is "<id> <parent> <unused> <detail>"
+    return [line.split(' ', 3)[3] for line in query.explain().splitlines()]
+
+def find_full_scans(plan):
+    """
+    Returns the steps of a query plan that scan a whole table.
+    """
+    return [step for step in plan if FULL_SCAN_RE.match(step)]
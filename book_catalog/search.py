@@ -0,0 +1,220 @@
+"""
+Full text search of the book catalog.
+
+Books are indexed in an SQLite FTS5 virtual table whose rowid is the book id
+and whose columns hold the book title, summary, saga name and author name.
+The index is kept in sync by the model signals (see signals.py) and can be
+rebuilt with the rebuild_search_index command.
+"""
+import re
+from operator import and_
+from functools import reduce
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from .models import Author, Book, BookSaga
+
+FTS_TABLE = 'book_catalog_book_fts'
+
+# bm25 weights of the title, summary, saga and author columns
+RANK_WEIGHTS = (10.0, 1.0, 5.0, 5.0)
+
+# Ids are sent to SQLite in chunks to stay below its limit of query parameters
+CHUNK_SIZE = 500
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def is_available():
+    """
+    Returns True if the data base supports the full text search index.
+    """
+    return connection.vendor == 'sqlite'
+
+def _index_books_where(where, params):
+    """
+    (Re)index the books matching the given SQL condition on the book table.
+    """
+    book_table = Book._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid IN '
+            f'(SELECT id FROM {book_table} AS b WHERE {where})', params)
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, summary, saga, author) '
+            f"SELECT b.id, b.title, COALESCE(b.summary, ''), COALESCE(s.name, ''), "
+            f"a.first_name || ' ' || a.last_name "
+            f'FROM {book_table} AS b '
+            f'INNER JOIN {Author._meta.db_table} AS a ON a.id = b.author_id '
+            f'LEFT OUTER JOIN {BookSaga._meta.db_table} AS s ON s.id = b.saga_id '
+            f'WHERE {where}', params)
+
+def index_books(book_ids):
+    """
+    (Re)index the books with the given ids.
+    """
+    if not is_available():
+        return
+    book_ids = list(book_ids)
+    for start in range(0, len(book_ids), CHUNK_SIZE):
+        chunk = book_ids[start:start + CHUNK_SIZE]
+        _index_books_where(f"b.id IN ({', '.join(['%s'] * len(chunk))})", chunk)
+
+def index_author_books(author_id):
+    """
+    Reindex the books of an author, e.g. after the author is renamed.
+    """
+    if is_available():
+        _index_books_where('b.author_id = %s', [author_id])
+
+def index_saga_books(saga_id):
+    """
+    Reindex the books of a saga, e.g. after the saga is renamed.
+    """
+    if is_available():
+        _index_books_where('b.saga_id = %s', [saga_id])
+
+def unindex_books(book_ids):
+    """
+    Remove the books with the given ids from the index.
+    """
+    if not is_available():
+        return
+    book_ids = list(book_ids)
+    with connection.cursor() as cursor:
+        for start in range(0, len(book_ids), CHUNK_SIZE):
+            chunk = book_ids[start:start + CHUNK_SIZE]
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({', '.join(['%s'] * len(chunk))})",
+                           chunk)
+
+def clear_index():
+    """
+    Remove every book from the index. The table is dropped and created again
+    from its stored definition, which is much faster than deleting its rows.
+    """
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = %s",
+                       [FTS_TABLE])
+        definition = cursor.fetchone()[0]
+        cursor.execute(f'DROP TABLE {FTS_TABLE}')
+        cursor.execute(definition)
+
+def rebuild_index():
+    """
+    Rebuild the whole index from the book table. Returns the number of
+    indexed books.
+    """
+    if not is_available():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        _index_books_where('1 = 1', [])
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT COUNT(*) FROM {FTS_TABLE}')
+        return cursor.fetchone()[0]
+
+def build_match_expression(query):
+    """
+    Translate a user query into an FTS5 MATCH expression in which every word
+    must appear as a prefix of some indexed word. Returns None if the query
+    has no words.
+    """
+    tokens = TOKEN_RE.findall(query)
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+def search_book_ids(query, offset=0, limit=None):
+    """
+    Returns the ids of the books matching the query, best match first, from
+    the given offset and up to limit of them if given.
+    """
+    if not is_available():
+        return _search_book_ids_without_index(query, offset, limit)
+    expression = build_match_expression(query)
+    if expression is None:
+        return []
+    weights = ', '.join(str(weight) for weight in RANK_WEIGHTS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT f.rowid FROM {FTS_TABLE} AS f '
+            f'INNER JOIN {Book._meta.db_table} AS b ON b.id = f.rowid '
+            f'WHERE {FTS_TABLE} MATCH %s '
+            f'ORDER BY bm25({FTS_TABLE}, {weights}), b.title, b.id '
+            f'LIMIT %s OFFSET %s', [expression, -1 if limit is None else limit, offset])
+        return [row[0] for row in cursor.fetchall()]
+
+def count_books(query):
+    """
+    Returns the number of books matching the query.
+    """
+    if not is_available():
+        return Book.objects.filter(_book_search_condition_without_index(query)).count()
+    expression = build_match_expression(query)
+    if expression is None:
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT COUNT(*) FROM {FTS_TABLE} AS f '
+            f'INNER JOIN {Book._meta.db_table} AS b ON b.id = f.rowid '
+            f'WHERE {FTS_TABLE} MATCH %s', [expression])
+        return cursor.fetchone()[0]
+
+
+class SearchResults:
+    """
+    Ids of the books matching a query, best match first, for a Paginator:
+    the matches are counted with count_books() and only the slice of the
+    page is fetched.
+    """
+    def __init__(self, query):
+        self.query = query
+
+    def count(self):
+        return count_books(self.query)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice) or index.step is not None:
+            raise TypeError('Search results only support slices without step')
+        start = index.start or 0
+        limit = None if index.stop is None else max(index.stop - start, 0)
+        return search_book_ids(self.query, start, limit)
+
+
+def book_search_condition(query, prefix=''):
+    """
+    Returns a Q object selecting the books (or the rows related to the books
+    through the lookup prefix, e.g. 'book__') that match the query, without
+    ranking.
+    """
+    if not is_available():
+        return _book_search_condition_without_index(query, prefix)
+    expression = build_match_expression(query)
+    if expression is None:
+        return Q(**{f'{prefix}pk__in': []})
+    return Q(**{f'{prefix}pk__in': RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [expression])})
+
+def _book_search_condition_without_index(query, prefix=''):
+    """
+    Search condition for data bases without FTS5 support.
+    """
+    query_parts = query.split()
+    if not query_parts:
+        return Q(**{f'{prefix}pk__in': []})
+    author_conditions = [Q(**{f'{prefix}author__first_name__icontains': part})
+                         | Q(**{f'{prefix}author__last_name__icontains': part})
+                         for part in query_parts]
+    return (Q(**{f'{prefix}title__icontains': query})
+            | Q(**{f'{prefix}saga__name__icontains': query})
+            | reduce(and_, author_conditions))
+
+def _search_book_ids_without_index(query, offset=0, limit=None):
+    """
+    Unranked search for data bases without FTS5 support.
+    """
+    condition = _book_search_condition_without_index(query)
+    ids = Book.objects.filter(condition).order_by('title', 'id').values_list('id', flat=True)
+    return list(ids[offset:None if limit is None else offset + limit])
@@ -0,0 +1,115 @@
+"""
+Operations on the shelves of the users shared by the views, the admin and
+other callers.
+"""
+import uuid
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.utils import timezone
+from . import counts
+from .models import Book, UserBookRelation, invalidate_book_caches, invalidate_reviewer_stats
+
+# Status given to the change views to remove the status of a book
+REMOVE_STATUS = 'd'
+
+
+def set_saga_status(user, saga, status):
+    """
+    Set the status of every book of a saga for a user, or remove it if status
+    is REMOVE_STATUS. The existing relations are read once, validated in
+    memory and the differences written in bulk in a single transaction.
+    Returns the number of created and of updated relations.
+    """
+    new_status = None if status == REMOVE_STATUS else status
+    book_ids = list(saga.book_set.order_by().values_list('id', flat=True))
+    with transaction.atomic():
+        relations = {relation.book_id: relation for relation in
+                     UserBookRelation.objects.filter(user=user, book_id__in=book_ids)}
+        updated = []
+        for relation in relations.values():
+            if relation.status != new_status:
+                relation.status = new_status
+                relation.clean()
+                updated.append(relation)
+        created = []
+        if new_status is not None:
+            for book_id in book_ids:
+                if book_id not in relations:
+                    relation = UserBookRelation(user=user, book_id=book_id, status=new_status)
+                    relation.clean()
+                    created.append(relation)
+        if updated:
+            UserBookRelation.objects.bulk_update(updated, ['status'])
+        if created:
+            UserBookRelation.objects.bulk_create(created)
+    if updated:
+        counts.invalidate_shelf_counts(user.pk)
+    return len(created), len(updated)
+
+def _upsert_relation(user, book, values, updates):
+    """
+    Insert the relation of the user and the book with the given column
+    values or, if it exists, apply the given SQL assignments to it, in a
+    single INSERT ... ON CONFLICT DO UPDATE statement. In the assignments,
+    "excluded" holds the values that would have been inserted.
+    """
+    meta = UserBookRelation._meta
+    values = {
+        'user_id': user.pk,
+        'book_id': book.pk,
+        'uuid': meta.get_field('uuid').get_db_prep_value(uuid.uuid4(), connection),
+        **values,
+    }
+    columns = ', '.join(values)
+    placeholders = ', '.join(['%s'] * len(values))
+    assignments = ', '.join(f'{column} = {expression}' for column, expression in updates.items())
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {meta.db_table} ({columns}) VALUES ({placeholders}) '
+            f'ON CONFLICT (user_id, book_id) DO UPDATE SET {assignments}',
+            list(values.values()))
+    counts.invalidate_shelf_counts(user.pk)
+
+def set_book_status(user, book, status):
+    """
+    Set the status of a book for a user, or remove it with its dates if status
+    is REMOVE_STATUS, in a single statement. The read date (or reading date)
+    defaults to today when the book is marked as read (or being read).
+    """
+    if status == REMOVE_STATUS:
+        UserBookRelation.objects.filter(user=user, book=book).update(
+            status=None, read_date=None, reading_date=None)
+        counts.invalidate_shelf_counts(user.pk)
+        return
+    if status not in UserBookRelation.STATUS_DISPLAY:
+        raise ValidationError("Invalid status, must be 'r', 't' or 'i'")
+    today = timezone.now().date()
+    table = UserBookRelation._meta.db_table
+    _upsert_relation(user, book, {
+        'status': status,
+        'read_date': today if status == 'r' else None,
+        'reading_date': today if status == 'i' else None,
+    }, {
+        'status': 'excluded.status',
+        'read_date': f'COALESCE({table}.read_date, excluded.read_date)',
+        'reading_date': f'COALESCE({table}.reading_date, excluded.reading_date)',
+    })
+
+def rate_book(user, book, rating):
+    """
+    Set the rating of a book for a user, or remove it if the book already has
+    that rating, in a single statement, and refresh the statistics of the
+    book. The raw statement sends no signal, so the cached pages showing the
+    statistics are forgotten here.
+    """
+    if rating not in range(1, 6):
+        raise ValidationError('Invalid rating, must be between 1 and 5')
+    table = UserBookRelation._meta.db_table
+    with transaction.atomic():
+        _upsert_relation(user, book, {'rating': rating}, {
+            'rating': f'CASE WHEN {table}.rating = excluded.rating THEN NULL '
+                      'ELSE excluded.rating END',
+        })
+        Book.objects.filter(pk=book.pk).refresh_rating_stats()
+    invalidate_book_caches(book.pk)
+    invalidate_reviewer_stats(user.pk)
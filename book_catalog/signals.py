@@ -0,0 +1,246 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from .models import (Author, Book, BookSaga, Genre, Language, UserBookRelation,
+                     invalidate_book_caches, invalidate_reviewer_stats)
+from . import counts, images, object_cache, search
+
+
+def _rating_contribution(state):
+    """
+    Returns the (rating sum, rating count, review count) a relation state adds
+    to the statistics of its book.
+    """
+    _, rating, has_review = state
+    return (rating or 0, int(rating is not None), int(has_review))
+
+def _apply_rating_state_change(old_state, new_state):
+    """
+    Update the statistics of the books affected by a relation that changed
+    from old_state to new_state. A state of None is an empty contribution.
+    """
+    old_book = old_state[0] if old_state else None
+    new_book = new_state[0] if new_state else None
+    old = _rating_contribution(old_state) if old_state else (0, 0, 0)
+    new = _rating_contribution(new_state) if new_state else (0, 0, 0)
+    if old_book == new_book:
+        Book.objects.filter(pk=new_book).apply_rating_delta(
+            *[new_value - old_value for new_value, old_value in zip(new, old)])
+        return
+    if old_book is not None:
+        Book.objects.filter(pk=old_book).apply_rating_delta(*[-value for value in old])
+    if new_book is not None:
+        Book.objects.filter(pk=new_book).apply_rating_delta(*new)
+
+@receiver(post_save, sender=UserBookRelation)
+def update_book_rating_stats_on_save(sender, instance, created, raw, **kwargs):
+    """
+    Keep the rating statistics of the book in sync when a relation is saved.
+    """
+    if raw:
+        return
+    new_state = instance.rating_state()
+    old_state = None if created else getattr(instance, '_saved_rating_state', None)
+    if new_state is None or (old_state is None and not created):
+        # The previous values are unknown, recompute the book from scratch.
+        Book.objects.filter(pk=instance.book_id).refresh_rating_stats()
+    else:
+        _apply_rating_state_change(old_state, new_state)
+    instance.remember_rating_state()
+
+@receiver(post_delete, sender=UserBookRelation)
+def update_book_rating_stats_on_delete(sender, instance, **kwargs):
+    """
+    Keep the rating statistics of the book in sync when a relation is deleted.
+    """
+    old_state = getattr(instance, '_saved_rating_state', None)
+    if old_state is None:
+        Book.objects.filter(pk=instance.book_id).refresh_rating_stats()
+    else:
+        _apply_rating_state_change(old_state, None)
+
+@receiver(post_save, sender=Book)
+def index_book_on_save(sender, instance, **kwargs):
+    """
+    Keep the full text search index in sync when a book is saved.
+    """
+    search.index_books([instance.pk])
+
+@receiver(post_delete, sender=Book)
+def unindex_book_on_delete(sender, instance, **kwargs):
+    """
+    Remove a deleted book from the full text search index.
+    """
+    search.unindex_books([instance.pk])
+
+@receiver(post_save, sender=Author)
+def index_author_books_on_save(sender, instance, created, **kwargs):
+    """
+    Reindex the books of an author, whose name is part of the book index.
+    """
+    if not created:
+        search.index_author_books(instance.pk)
+
+@receiver(post_save, sender=BookSaga)
+def index_saga_books_on_save(sender, instance, created, **kwargs):
+    """
+    Reindex the books of a saga, whose name is part of the book index.
+    """
+    if not created:
+        search.index_saga_books(instance.pk)
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def invalidate_book_count(sender, instance, created=True, **kwargs):
+    """
+    Forget the cached number of books when a book is created or deleted.
+    """
+    if created:
+        counts.invalidate_count('books')
+
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+def invalidate_author_count(sender, instance, created=True, **kwargs):
+    """
+    Forget the cached number of authors when an author is created or deleted.
+    """
+    if created:
+        counts.invalidate_count('authors')
+
+@receiver(post_save, sender=UserBookRelation)
+@receiver(post_delete, sender=UserBookRelation)
+def invalidate_shelf_count(sender, instance, **kwargs):
+    """
+    Forget the cached counts of the shelf of the user of a changed relation,
+    whose status or read date may have changed.
+    """
+    counts.invalidate_shelf_counts(instance.user_id)
+
+@receiver(post_save, sender=UserBookRelation)
+@receiver(post_delete, sender=UserBookRelation)
+def invalidate_reviewer_stats_on_change(sender, instance, **kwargs):
+    """
+    Forget the cached reviewer statistics of the user of a changed relation.
+    """
+    invalidate_reviewer_stats(instance.user_id)
+
+@receiver(pre_save, sender=Book)
+def remember_book_parents(sender, instance, raw, **kwargs):
+    """
+    Remember the saved author and saga of a changed book, whose cached pages
+    list it.
+    """
+    if not raw and not instance._state.adding:
+        instance._saved_parents = Book.objects.filter(pk=instance.pk).values_list(
+            'author_id', 'saga_id').first()
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def invalidate_book_cache(sender, instance, **kwargs):
+    """
+    Forget the cached values of a changed or deleted book, of its old and
+    new author and saga, and of the catalog.
+    """
+    parents = [(instance.author_id, instance.saga_id)]
+    if getattr(instance, '_saved_parents', None):
+        parents.append(instance._saved_parents)
+    object_cache.bump_version(Book, instance.pk)
+    object_cache.bump_version(Author, *(author_id for author_id, _ in parents))
+    object_cache.bump_version(BookSaga, *(saga_id for _, saga_id in parents))
+    object_cache.bump_catalog_version()
+
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+def invalidate_author_cache(sender, instance, created=True, **kwargs):
+    """
+    Forget the cached values of a changed or deleted author, of the catalog,
+    and of the books and sagas of a changed one, which show its name.
+    """
+    object_cache.bump_version(Author, instance.pk)
+    object_cache.bump_catalog_version()
+    if not created:
+        object_cache.bump_version(
+            Book, *Book.objects.filter(author=instance).values_list('pk', flat=True))
+        object_cache.bump_version(
+            BookSaga, *BookSaga.objects.filter(author=instance).values_list('pk', flat=True))
+
+@receiver(post_save, sender=BookSaga)
+@receiver(post_delete, sender=BookSaga)
+def invalidate_saga_cache(sender, instance, created=True, **kwargs):
+    """
+    Forget the cached values of a changed or deleted saga, of its author, of
+    the catalog, and of the books of a changed one, which show its name.
+    """
+    object_cache.bump_version(BookSaga, instance.pk)
+    object_cache.bump_version(Author, instance.author_id)
+    object_cache.bump_catalog_version()
+    if not created:
+        object_cache.bump_version(
+            Book, *Book.objects.filter(saga=instance).values_list('pk', flat=True))
+
+@receiver(post_save, sender=UserBookRelation)
+@receiver(post_delete, sender=UserBookRelation)
+def invalidate_relation_book_cache(sender, instance, **kwargs):
+    """
+    Forget the cached values of the book of a changed relation, whose ratings
+    and reviews they show.
+    """
+    invalidate_book_caches(instance.book_id)
+
+@receiver(m2m_changed, sender=Book.genre.through)
+def invalidate_book_cache_on_genres_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Forget the cached values of the books whose genres are added, removed or
+    cleared, from the book or from the genre side.
+    """
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            object_cache.bump_version(Book, instance.pk)
+    elif action == 'pre_clear':
+        instance._cleared_book_ids = list(instance.book_set.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        object_cache.bump_version(Book, *getattr(instance, '_cleared_book_ids', []))
+    elif action in ('post_add', 'post_remove'):
+        object_cache.bump_version(Book, *pk_set)
+
+@receiver(pre_delete, sender=Genre)
+@receiver(pre_delete, sender=Language)
+def remember_named_books(sender, instance, **kwargs):
+    """
+    Remember the books of a deleted genre or language, whose links to it are
+    removed without signals.
+    """
+    instance._book_ids = list(instance.book_set.values_list('pk', flat=True))
+
+@receiver(post_save, sender=Genre)
+@receiver(post_save, sender=Language)
+@receiver(post_delete, sender=Genre)
+@receiver(post_delete, sender=Language)
+def invalidate_named_books_cache(sender, instance, created=False, **kwargs):
+    """
+    Forget the cached values of the books of a renamed or deleted genre or
+    language, which show its name.
+    """
+    if created:
+        return
+    book_ids = getattr(instance, '_book_ids', None)
+    if book_ids is None:
+        book_ids = instance.book_set.values_list('pk', flat=True)
+    object_cache.bump_version(Book, *book_ids)
+
+@receiver(pre_save, sender=Book)
+@receiver(pre_save, sender=Author)
+def reset_image_placeholder(sender, instance, raw, **kwargs):
+    """
+    Forget the placeholder of a removed or replaced cover or photo.
+    """
+    if not raw:
+        images.reset_placeholder(instance)
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Author)
+def queue_image_derivatives(sender, instance, raw, **kwargs):
+    """
+    Queue the generation of the resized copies of a new cover or photo.
+    """
+    if not raw:
+        images.queue_derivatives(instance)
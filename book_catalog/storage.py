@@ -0,0 +1,109 @@
+"""
+Content-addressed storage of the book covers and author photos.
+
+A file is named by the SHA-256 of its content instead of the name it was
+uploaded with (covers/dune.png is stored as covers/3a/3a7bd3e2...png), so
+an image uploaded twice is stored once, and the content of a name never
+changes, which lets browsers cache it forever (see media_cache_control).
+
+Uploads that must not be served, e.g. the Goodreads exports holding the
+private reviews of a user, are stored by PrivateStorage outside of
+MEDIA_ROOT, in PRIVATE_MEDIA_ROOT.
+"""
+import hashlib
+import os
+import re
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+from django.utils.functional import cached_property
+
+# Root of a content-addressed name, maybe followed by the suffix of a
+# derivative (see images.derivative_name)
+HASHED_NAME_RE = re.compile(r'(^|/)(?P<digest>[0-9a-f]{64})(\.[a-z]+(-[0-9a-f]+)?)*\.[a-z0-9]+$')
+# Characters of the digest used as subdirectory, to keep directories small
+SHARD_LENGTH = 2
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def content_hash(content):
+    """
+    Returns the hexadecimal SHA-256 of a file.
+    """
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+def is_content_addressed(name):
+    """
+    Returns True if a storage name is named by its content or is derived
+    from such a name.
+    """
+    return HASHED_NAME_RE.search(name) is not None
+
+def media_cache_control(name):
+    """
+    Returns the Cache-Control header to serve a media file with, or None to
+    keep the default.
+    """
+    return IMMUTABLE_CACHE_CONTROL if is_content_addressed(name) else None
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage saving every file under the hash of its content, in
+    the directory of the given name. Saving a content already stored only
+    returns its name.
+    """
+    def hashed_name(self, name, content):
+        """
+        Returns the storage name of a content given with the name name.
+        """
+        directory = os.path.dirname(name)
+        digest = content_hash(content)
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(directory, digest[:SHARD_LENGTH], digest + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            return name
+        # Two uploads of the same new content at the same time store it
+        # twice, the second one with the random suffix of get_available_name
+        return super().save(name, content, max_length)
+
+    def save_as(self, name, content):
+        """
+        Save content under the given name, replacing the existing file. For
+        the files derived from a stored one, e.g. its resized copies.
+        """
+        if self.exists(name):
+            self.delete(name)
+        return super().save(name, content)
+
+
+@deconstructible
+class PrivateStorage(FileSystemStorage):
+    """
+    File system storage in PRIVATE_MEDIA_ROOT, which is not served, so its
+    files have no URL.
+    """
+    def _clear_cached_properties(self, setting, **kwargs):
+        super()._clear_cached_properties(setting, **kwargs)
+        if setting == 'PRIVATE_MEDIA_ROOT':
+            self.__dict__.pop('base_location', None)
+            self.__dict__.pop('location', None)
+
+    @cached_property
+    def base_location(self):
+        return self._value_or_setting(self._location, settings.PRIVATE_MEDIA_ROOT)
+
+    def url(self, name):
+        raise ValueError('Private files are not served')
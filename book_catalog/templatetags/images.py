@@ -0,0 +1,13 @@
+from django import template
+from book_catalog import images
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(image, alt, sizes, css_class='', style='', loading='lazy'):
+    """
+    Show an image field file with its derivatives, e.g.
+    {% responsive_image book.cover_image book.title "50px" "img-fluid" %}
+    """
+    return images.picture_html(image, alt, sizes, css_class, style, loading)
@@ -0,0 +1,75 @@
+from django.test import TestCase
+from book_catalog import search
+from book_catalog.bulk import create_validated, format_errors, validate_batch
+from book_catalog.models import Author, Book, BookSaga, Language
+
+
+class CreateValidatedTest(TestCase):
+    """
+    Test the validated bulk creation
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='Sara', last_name='Trueman')
+        cls.other_author = Author.objects.create(first_name='Big', last_name='Bob')
+        cls.saga = BookSaga.objects.create(name='The Saga', author=cls.author)
+        Book.objects.create(title='The Book', author=cls.author, saga=cls.saga, saga_volume=1)
+        Language.objects.create(name='English')
+
+    def test_valid_books_are_created(self):
+        """
+        Test if the valid rows are created and indexed with a number of
+        queries that does not depend on the size of the batch
+        """
+        books = [Book(title=f'Book {number}', author_id=self.author.pk) for number in range(50)]
+        with self.assertNumQueries(7):
+            created, errors = create_validated(Book, books)
+        self.assertEqual(errors, {})
+        self.assertEqual(len(created), 50)
+        self.assertEqual(Book.objects.count(), 51)
+        self.assertEqual(search.search_book_ids('Book 42'), [created[42].pk])
+
+    def test_invalid_rows_are_reported(self):
+        """
+        Test if every invalid row is reported with its errors and the others
+        are created
+        """
+        created, errors = create_validated(Book, [
+            Book(title='The Book', author_id=self.author.pk),
+            Book(title='New Book', author_id=self.author.pk),
+            Book(title='Lost Book', author_id=999),
+            Book(title='Other Book', author_id=self.other_author.pk, saga_id=self.saga.pk,
+                 saga_volume=2),
+            Book(title='Second Book', author_id=self.author.pk, saga_id=self.saga.pk,
+                 saga_volume=1),
+            Book(title='', author_id=self.author.pk),
+        ])
+        self.assertEqual([book.title for book in created], ['New Book'])
+        self.assertEqual(list(errors), [0, 2, 3, 4, 5])
+        self.assertEqual(format_errors(errors[0]),
+                         ['Book with this Title and Author already exists.'])
+        self.assertEqual(format_errors(errors[2]),
+                         ['author: author instance with id 999 does not exist.'])
+        self.assertEqual(format_errors(errors[3]),
+                         ['Saga author must be the same as the book author'])
+        self.assertIn('Book with this Saga and Saga volume already exists.',
+                      format_errors(errors[4]))
+
+    def test_duplicates_in_batch(self):
+        """
+        Test if a row repeating a previous row of the batch is reported
+        """
+        errors = validate_batch(Book, [Book(title='New Book', author_id=self.author.pk),
+                                       Book(title='New Book', author_id=self.author.pk)])
+        self.assertEqual(list(errors), [1])
+
+    def test_case_insensitive_language(self):
+        """
+        Test if the case insensitive constraint of the languages is checked
+        """
+        created, errors = create_validated(Language, [
+            Language(name='english'), Language(name='French'), Language(name='FRENCH')])
+        self.assertEqual([language.name for language in created], ['French'])
+        self.assertEqual(format_errors(errors[0]),
+                         ['Language already exists (case insensitive match)'])
+        self.assertEqual(list(errors), [0, 2])
@@ -0,0 +1,22 @@
+from django.test import SimpleTestCase, override_settings
+from book_catalog.checks import check_shared_cache
+
+
+class SharedCacheCheckTest(SimpleTestCase):
+    """
+    Test the check of the cache shared by the processes
+    """
+    def test_shared_cache(self):
+        """
+        Test if a file cache passes the check
+        """
+        self.assertEqual(check_shared_cache(None), [])
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_local_memory_cache(self):
+        """
+        Test if a cache in the memory of each process is reported
+        """
+        self.assertEqual([error.id for error in check_shared_cache(None)],
+                         ['book_catalog.W001'])
@@ -0,0 +1,483 @@
+import csv
+import json
+import os
+import tempfile
+from datetime import date
+from io import StringIO
+from unittest.mock import patch
+from django.test import TestCase
+from django.contrib.auth.models import Permission
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError, connection, transaction
+from book_catalog import dataset, query_plans, search
+from book_catalog.importer import CatalogImporter
+from book_catalog.models import Author, Book, BookSaga, Genre, Language, User, UserBookRelation
+
+
+class RebuildBookStatsCommandTest(TestCase):
+    """
+    Test the rebuild_book_stats command
+    """
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name='Sara', last_name='Trueman')
+        cls.book = Book.objects.create(title='The Book', author=author)
+        user = User.objects.create_user(username='testuser', password='12345')
+        UserBookRelation.objects.create(user=user, book=cls.book, rating=4, review='Great book')
+
+    def test_rebuild_book_stats(self):
+        """
+        Test if the statistics are recomputed from the relations
+        """
+        Book.objects.update(rating_sum=0, rating_count=7, review_count=3)
+        out = StringIO()
+        call_command('rebuild_book_stats', stdout=out)
+        self.assertIn('Rating statistics rebuilt for 1 books', out.getvalue())
+        book = Book.objects.get(pk=self.book.pk)
+        self.assertEqual((book.rating_sum, book.rating_count, book.review_count), (4, 1, 1))
+
+class RebuildSearchIndexCommandTest(TestCase):
+    """
+    Test the rebuild_search_index command
+    """
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name='Sara', last_name='Trueman')
+        cls.book = Book.objects.create(title='The Book', author=author)
+
+    def test_rebuild_search_index(self):
+        """
+        Test if the index is rebuilt from the book table
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {search.FTS_TABLE}')
+        self.assertEqual(search.search_book_ids('trueman'), [])
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Search index rebuilt with 1 books', out.getvalue())
+        self.assertEqual(search.search_book_ids('trueman'), [self.book.pk])
+
+class CheckQueryPlansCommandTest(TestCase):
+    """
+    Test the check_query_plans command
+    """
+    def test_check_query_plans(self):
+        """
+        Test if the queries of the views use the indexes
+        """
+        out = StringIO()
+        call_command('check_query_plans', stdout=out)
+        self.assertIn('No full table scans in', out.getvalue())
+
+    def test_view_queries_are_captured(self):
+        """
+        Test if the checked queries are those run by the views, on sample
+        rows which are rolled back
+        """
+        authors = Author.objects.count()
+        queries = dict(query_plans.get_view_queries())
+        sql = '\n'.join(queries.values())
+        self.assertIn('MATCH', sql)
+        self.assertIn('bm25', sql)
+        self.assertIn('"book_catalog_book"."author_id" > ', sql)
+        self.assertIn('"book_catalog_book"."rating_average" DESC NULLS LAST', sql)
+        self.assertIn('AS "books_total"', sql)
+        self.assertIn('books: next page: query 1', queries)
+        self.assertEqual(Author.objects.count(), authors)
+
+    def test_full_scan_is_flagged(self):
+        """
+        Test if a query without a usable index is flagged
+        """
+        plan = query_plans.get_plan(UserBookRelation.objects.filter(review='Great book'))
+        self.assertEqual(query_plans.find_full_scans(plan), ['SCAN book_catalog_userbookrelation'])
+
+    def test_full_scan_fails_the_command(self):
+        """
+        Test if the command fails when a view query scans a whole table
+        """
+        queries = [('reviews', UserBookRelation.objects.filter(review='Great book'))]
+        with patch.object(query_plans, 'get_view_queries', return_value=queries):
+            with self.assertRaisesMessage(CommandError, 'reviews: SCAN book_catalog_userbookrelation'):
+                call_command('check_query_plans', stdout=StringIO())
+
+class ImportCatalogCommandTest(TestCase):
+    """
+    Test the import_catalog command
+    """
+    RECORDS = [
+        {'type': 'author', 'first_name': 'Sara', 'last_name': 'Trueman', 'year_of_birth': 1970},
+        {'type': 'saga', 'name': 'The Saga', 'author_first_name': 'Sara',
+         'author_last_name': 'Trueman'},
+        {'title': 'First Book', 'author_first_name': 'Sara', 'author_last_name': 'Trueman',
+         'saga': 'The Saga', 'saga_volume': 1, 'language': 'English',
+         'genres': ['Fantasy', 'Drama']},
+        {'title': 'Second Book', 'author_first_name': 'Sara', 'author_last_name': 'Trueman',
+         'saga': 'The Saga', 'saga_volume': 2, 'language': 'english', 'genres': ['fantasy']},
+        {'title': 'Other Book', 'author_first_name': 'John', 'author_last_name': 'Doe'},
+    ]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write_jsonl(self, records):
+        path = os.path.join(self.directory, 'catalog.jsonl')
+        with open(path, 'w', encoding='utf-8') as output:
+            for record in records:
+                output.write(json.dumps(record) + '\n')
+        return path
+
+    def import_catalog(self, path, **options):
+        out = StringIO()
+        err = StringIO()
+        call_command('import_catalog', path, stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_import_jsonl(self):
+        """
+        Test if authors, sagas, books, languages and genres are imported
+        """
+        out, err = self.import_catalog(self.write_jsonl(self.RECORDS), batch_size=2)
+        self.assertEqual(err, '')
+        self.assertIn('2 authors, 1 sagas, 3 books, 2 genres, 1 languages created', out)
+        author = Author.objects.get(last_name='Trueman')
+        self.assertEqual(author.year_of_birth, 1970)
+        saga = BookSaga.objects.get(name='The Saga', author=author)
+        self.assertQuerysetEqual(saga.book_set.order_by('saga_volume'),
+                                 ['First Book', 'Second Book'], transform=str)
+        second = Book.objects.get(title='Second Book')
+        self.assertEqual(second.language, Language.objects.get(name='English'))
+        self.assertEqual(list(second.genre.values_list('name', flat=True)), ['Fantasy'])
+        self.assertEqual(Book.objects.get(title='First Book').genre.count(), 2)
+        self.assertEqual(search.search_book_ids('second'), [second.pk])
+
+    def test_import_csv(self):
+        """
+        Test if books are imported from a CSV file with genres separated by |
+        """
+        path = os.path.join(self.directory, 'catalog.csv')
+        with open(path, 'w', newline='', encoding='utf-8') as output:
+            writer = csv.writer(output)
+            writer.writerow(['title', 'author_first_name', 'author_last_name', 'genres',
+                             'publish_date'])
+            writer.writerow(['The Book', 'Sara', 'Trueman', 'Fantasy|Drama', '2001-02-03'])
+        out, _ = self.import_catalog(path)
+        self.assertIn('1 books', out)
+        book = Book.objects.get(title='The Book')
+        self.assertEqual(str(book.publish_date), '2001-02-03')
+        self.assertEqual(set(book.genre.values_list('name', flat=True)), {'Fantasy', 'Drama'})
+
+    def test_invalid_records_are_reported(self):
+        """
+        Test if invalid records are reported while the others are imported
+        """
+        Genre.objects.create(name='Fantasy')
+        records = self.RECORDS + [
+            {'title': 'First Book', 'author_first_name': 'Sara', 'author_last_name': 'Trueman'},
+            {'author_first_name': 'Sara', 'author_last_name': 'Trueman'},
+            {'type': 'movie', 'title': 'The Movie'},
+        ]
+        out, err = self.import_catalog(self.write_jsonl(records))
+        self.assertIn('Record 6: Book with this Title and Author already exists.', err)
+        self.assertIn('Record 7: title: This field cannot be blank.', err)
+        self.assertIn('Record 8: Unknown record type "movie"', err)
+        self.assertIn('3 books, 1 genres', out)
+        self.assertIn('3 records rejected', out)
+        self.assertEqual(Genre.objects.count(), 2)
+
+    def test_malformed_lines_are_reported(self):
+        """
+        Test if lines that are not JSON objects are reported with their line
+        number while the other records of their batch and of the file are
+        imported
+        """
+        path = self.write_jsonl(self.RECORDS[:3])
+        with open(path, 'a', encoding='utf-8') as output:
+            output.write('{"title": "Broken\n\n["x"]\n')
+            output.write(json.dumps(self.RECORDS[3]) + '\n')
+        out, err = self.import_catalog(path, batch_size=2)
+        self.assertIn('Record 4: Line 4: not valid JSON', err)
+        self.assertIn('Record 5: Line 6: not a JSON object', err)
+        self.assertIn('2 books', out)
+        self.assertIn('2 records rejected', out)
+        self.assertTrue(Book.objects.filter(title='Second Book').exists())
+
+    def test_missing_file(self):
+        """
+        Test if a missing file is reported as a command error
+        """
+        path = os.path.join(self.directory, 'missing.jsonl')
+        with self.assertRaisesMessage(CommandError, f'Cannot read {path} after record 0'):
+            self.import_catalog(path)
+
+    def test_undecodable_file(self):
+        """
+        Test if a file that is not UTF-8 is reported as a command error after
+        the records committed before the error
+        """
+        path = self.write_jsonl(self.RECORDS[:1])
+        with open(path, 'ab') as output:
+            output.write(b'\xff\xfe\n' * 10000)
+        with self.assertRaisesMessage(CommandError, "'utf-8' codec can't decode"):
+            self.import_catalog(path, batch_size=1)
+
+    def test_failed_batch_can_be_resumed(self):
+        """
+        Test if a failed batch keeps the records committed before it and the
+        import can be resumed after them
+        """
+        path = self.write_jsonl(self.RECORDS)
+        import_batch = CatalogImporter.import_batch
+
+        def fail_on_books(importer, records):
+            if records[0][0] > 2:
+                raise DatabaseError('disk I/O error')
+            return import_batch(importer, records)
+
+        with patch.object(CatalogImporter, 'import_batch', autospec=True,
+                          side_effect=fail_on_books):
+            with self.assertRaisesMessage(CommandError, 'rerun with --resume'):
+                self.import_catalog(path, batch_size=2)
+        self.assertEqual(Book.objects.count(), 0)
+        self.assertTrue(BookSaga.objects.filter(name='The Saga').exists())
+        with open(f'{path}.checkpoint', encoding='utf-8') as checkpoint:
+            self.assertEqual(json.load(checkpoint), {'records': 2})
+
+        out, _ = self.import_catalog(path, batch_size=2, resume=True)
+        self.assertIn('Resuming after 2 records', out)
+        self.assertIn('1 authors, 0 sagas, 3 books', out)
+        self.assertEqual(Book.objects.filter(saga__name='The Saga').count(), 2)
+        self.assertFalse(os.path.exists(f'{path}.checkpoint'))
+
+class GenerateDatasetCommandTest(TestCase):
+    """
+    Test the generate_dataset command
+    """
+    SIZES = {'users': 5, 'authors': 10, 'books': 100, 'relations': 60}
+
+    def generate(self, seed):
+        """
+        Returns the usernames, book titles and shelves generated with a seed,
+        rolling the data back.
+        """
+        with transaction.atomic():
+            call_command('generate_dataset', seed=seed, stdout=StringIO(), **self.SIZES)
+            result = (list(User.objects.order_by('pk').values_list('username', flat=True)),
+                      list(Book.objects.order_by('pk').values_list('title', flat=True)),
+                      list(UserBookRelation.objects.order_by('pk').values_list(
+                          'user__username', 'book__title', 'status', 'rating')))
+            transaction.set_rollback(True)
+        return result
+
+    def test_generate_dataset(self):
+        """
+        Test if the requested number of objects is created with consistent
+        statistics and search index
+        """
+        out = StringIO()
+        call_command('generate_dataset', stdout=out, **self.SIZES)
+        self.assertIn('5 users, 10 authors, 2 sagas', out.getvalue())
+        self.assertEqual(User.objects.count(), 5)
+        self.assertEqual(Book.objects.count(), 100)
+        self.assertEqual(UserBookRelation.objects.count(), 60)
+        self.assertTrue(Book.objects.filter(saga__isnull=False).exists())
+        self.assertFalse(Book.objects.filter(genre__isnull=True).exists())
+        self.assertTrue(User.objects.first().check_password(dataset.PASSWORD))
+        for book in Book.objects.all():
+            ratings = UserBookRelation.objects.filter(book=book, rating__isnull=False)
+            self.assertEqual(book.rating_count, ratings.count())
+        book = Book.objects.first()
+        self.assertIn(book.pk, search.search_book_ids(book.title))
+
+    def test_same_seed_same_dataset(self):
+        """
+        Test if the same seed generates the same dataset and another seed a
+        different one
+        """
+        self.assertEqual(self.generate(1), self.generate(1))
+        self.assertNotEqual(self.generate(1), self.generate(2))
+
+    def test_used_seed_fails(self):
+        """
+        Test if generating twice with the same seed fails before creating the
+        catalog
+        """
+        call_command('generate_dataset', stdout=StringIO(), **self.SIZES)
+        with self.assertRaisesMessage(CommandError, 'use another seed'):
+            call_command('generate_dataset', stdout=StringIO(), **self.SIZES)
+        self.assertEqual(Book.objects.count(), 100)
+
+    def test_shelf_sizes_are_skewed(self):
+        """
+        Test if the shelf sizes add up to the relations, with a few large
+        shelves limited to a share of the catalog
+        """
+        sizes = dataset._shelf_sizes(dataset.random.Random(0), 100, 1000, 5000)
+        self.assertEqual(sum(sizes), 5000)
+        self.assertLessEqual(max(sizes), 1000 * dataset.MAX_SHELF_SHARE)
+        self.assertGreater(max(sizes), 5 * min(sizes))
+
+class ResetDatasetCommandTest(TestCase):
+    """
+    Test the reset_dataset command
+    """
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name='Sara', last_name='Trueman')
+        book = Book.objects.create(title='The Book', author=author)
+        user = User.objects.create_user(username='testuser', password='12345')
+        UserBookRelation.objects.create(user=user, book=book, rating=4, review='Great book')
+
+    def test_reset_dataset(self):
+        """
+        Test if the catalog, the users and the search index are emptied and
+        the ids start again
+        """
+        out = StringIO()
+        call_command('reset_dataset', interactive=False, stdout=out)
+        self.assertIn(f'{len(dataset.get_reset_models())} tables emptied', out.getvalue())
+        self.assertFalse(UserBookRelation.objects.exists())
+        self.assertFalse(Book.objects.exists())
+        self.assertFalse(User.objects.exists())
+        self.assertTrue(Permission.objects.exists())
+        self.assertEqual(search.search_book_ids('trueman'), [])
+        self.assertEqual(Author.objects.create(first_name='John', last_name='Doe').pk, 1)
+
+    def test_reset_order(self):
+        """
+        Test if every table is emptied before the tables it references
+        """
+        models = dataset.get_reset_models()
+        self.assertLess(models.index(UserBookRelation), models.index(Book))
+        self.assertLess(models.index(Book), models.index(Author))
+        self.assertLess(models.index(UserBookRelation), models.index(User))
+        self.assertNotIn(Permission, models)
+
+    def test_reset_is_confirmed(self):
+        """
+        Test if nothing is deleted unless the reset is confirmed
+        """
+        out = StringIO()
+        with patch('builtins.input', return_value='no'):
+            call_command('reset_dataset', stdout=out)
+        self.assertIn('Reset cancelled', out.getvalue())
+        self.assertTrue(Book.objects.exists())
+
+GOODREADS_COLUMNS = ['Book Id', 'Title', 'Author', 'ISBN', 'ISBN13', 'My Rating', 'Date Read',
+                     'Date Added', 'Exclusive Shelf', 'My Review']
+
+def write_goodreads(path, rows):
+    """
+    Write a Goodreads export with the given rows, dicts of some columns.
+    """
+    with open(path, 'w', newline='', encoding='utf-8') as output:
+        writer = csv.DictWriter(output, fieldnames=GOODREADS_COLUMNS, restval='')
+        writer.writeheader()
+        writer.writerows(rows)
+
+class ImportGoodreadsCommandTest(TestCase):
+    """
+    Test the import_goodreads command
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', password='12345')
+        author = Author.objects.create(first_name='Sara', last_name='Trueman')
+        cls.first = Book.objects.create(title='The First Book', author=author,
+                                        isbn='9780439023481')
+        cls.second = Book.objects.create(title='Él Segundo: Libro', author=author)
+        cls.third = Book.objects.create(title='The Third Book', author=author)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'goodreads_library_export.csv')
+
+    def import_goodreads(self, rows, **options):
+        write_goodreads(self.path, rows)
+        out = StringIO()
+        err = StringIO()
+        call_command('import_goodreads', self.path, user='testuser', stdout=out, stderr=err,
+                     **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_import_goodreads(self):
+        """
+        Test if books are matched by ISBN or by title and author and the
+        unmatched rows reported
+        """
+        out, err = self.import_goodreads([
+            {'Title': 'Another title', 'Author': 'Someone', 'ISBN': '="0439023483"',
+             'ISBN13': '="9780439023481"', 'My Rating': '5', 'Date Read': '2023/05/12',
+             'Exclusive Shelf': 'read', 'My Review': 'Loved it'},
+            {'Title': 'El segundo libro (La Saga, #2)', 'Author': 'Sara  Trueman',
+             'My Rating': '0', 'Date Added': '2024/01/02', 'Exclusive Shelf': 'currently-reading'},
+            {'Title': 'Unknown Book', 'Author': 'Sara Trueman', 'Exclusive Shelf': 'to-read'},
+            {'Title': 'The Third Book', 'Author': 'Sara Trueman', 'Exclusive Shelf': 'abandoned'},
+        ], batch_size=1)
+        self.assertIn('2 of 4 rows imported, 2 not imported', out)
+        self.assertIn('Row 3: Unknown Book (Sara Trueman): Book not found', err)
+        self.assertIn('Row 4: The Third Book (Sara Trueman): Unknown shelf "abandoned"', err)
+        first = UserBookRelation.objects.get(user=self.user, book=self.first)
+        self.assertEqual((first.status, first.rating, first.review, str(first.read_date)),
+                         ('r', 5, 'Loved it', '2023-05-12'))
+        second = UserBookRelation.objects.get(user=self.user, book=self.second)
+        self.assertEqual((second.status, second.rating, str(second.reading_date)),
+                         ('i', None, '2024-01-02'))
+        self.assertEqual(Book.objects.get(pk=self.first.pk).rating_count, 1)
+
+    def test_existing_relations_are_updated(self):
+        """
+        Test if existing relations are updated without losing the values
+        missing from the file
+        """
+        relation = UserBookRelation.objects.create(user=self.user, book=self.third, status='t',
+                                                   rating=3, review='Nice')
+        self.import_goodreads([
+            {'Title': 'The Third Book', 'Author': 'Sara Trueman', 'Date Read': '2023/05/12',
+             'Exclusive Shelf': 'read'},
+        ])
+        relation = UserBookRelation.objects.get(pk=relation.pk)
+        self.assertEqual((relation.status, relation.rating, relation.review),
+                         ('r', 3, 'Nice'))
+        self.assertEqual(str(relation.read_date), '2023-05-12')
+
+    def test_dates_are_checked_with_existing_relations(self):
+        """
+        Test if a row whose read date is before the reading date of the
+        existing relation is reported and the relation left unchanged
+        """
+        relation = UserBookRelation.objects.create(
+            user=self.user, book=self.third, status='i', reading_date=date(2024, 1, 2))
+        out, err = self.import_goodreads([
+            {'Title': 'The Third Book', 'Author': 'Sara Trueman', 'Date Read': '2023/05/12',
+             'Exclusive Shelf': 'read'},
+            {'Title': 'The First Book', 'Author': 'Sara Trueman', 'Date Read': '2023/05/12',
+             'Exclusive Shelf': 'read'},
+        ])
+        self.assertIn('1 of 2 rows imported, 1 not imported', out)
+        self.assertIn('Row 1: The Third Book (Sara Trueman): Read date cannot be before reading '
+                      'date', err)
+        relation = UserBookRelation.objects.get(pk=relation.pk)
+        self.assertEqual((relation.status, relation.read_date), ('i', None))
+        self.assertTrue(UserBookRelation.objects.filter(user=self.user, book=self.first,
+                                                        status='r').exists())
+
+    def test_invalid_rows_are_reported(self):
+        """
+        Test if rows with invalid values are reported and not a Goodreads
+        file fails
+        """
+        _, err = self.import_goodreads([
+            {'Title': 'The Third Book', 'Author': 'Sara Trueman', 'Date Read': '2999/01/01',
+             'Exclusive Shelf': 'read'},
+        ])
+        self.assertIn('Row 1: The Third Book (Sara Trueman): Read date cannot be in the future',
+                      err)
+        with open(self.path, 'w', encoding='utf-8') as output:
+            output.write('Title,Author\nThe Book,Sara\n')
+        with self.assertRaisesMessage(CommandError, 'missing columns: Exclusive Shelf'):
+            call_command('import_goodreads', self.path, user='testuser', stdout=StringIO())
@@ -0,0 +1,344 @@
+import os
+import tempfile
+from io import BytesIO, StringIO
+from unittest.mock import patch
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from my_library.views import serve_media
+from book_catalog import images, jobs, storage
+from book_catalog.models import Author, Book, Job, User
+
+
+def image_upload(name='cover.png', size=(1000, 1500), mode='RGBA', image_format='PNG'):
+    """
+    Returns an uploaded image file of the given size.
+    """
+    buffer = BytesIO()
+    Image.new(mode, size, 'red').save(buffer, image_format)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+class MediaTestCase(TestCase):
+    """
+    Test case storing the uploaded files in a temporary directory
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='Sara', last_name='Trueman')
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.media_root = directory.name
+        media = override_settings(MEDIA_ROOT=directory.name)
+        media.enable()
+        self.addCleanup(media.disable)
+
+
+class ImageDerivativesTest(MediaTestCase):
+    """
+    Test the derivatives of the covers and photos
+    """
+
+    def run_jobs(self):
+        jobs.Worker(processes=0).run(drain=True)
+
+    def open_derivative(self, image, size, extension):
+        return Image.open(os.path.join(self.media_root,
+                                       images.derivative_name(image.name, size, extension)))
+
+    def test_derivatives_are_queued_on_upload(self):
+        """
+        Test if the upload only queues the derivatives, shown once the job is
+        run
+        """
+        book = Book.objects.create(title='The Book', author=self.author,
+                                   cover_image=image_upload())
+        book.save()
+        job = Job.objects.get()
+        self.assertEqual((job.task, job.args), ('image_derivatives', ['book_catalog.Book', book.pk]))
+        self.assertFalse(images.has_derivatives(book.cover_image))
+        self.assertNotIn('<picture>', images.picture_html(book.cover_image, 'The Book', '50px'))
+        self.run_jobs()
+        self.assertEqual(Job.objects.get().status, 'd')
+        self.assertIn('<picture>', images.picture_html(book.cover_image, 'The Book', '50px'))
+
+    def test_derivatives_are_generated(self):
+        """
+        Test if every size is written in WebP and JPEG next to the original
+        """
+        book = Book.objects.create(title='The Book', author=self.author,
+                                   cover_image=image_upload())
+        self.run_jobs()
+        self.assertTrue(images.has_derivatives(book.cover_image))
+        for size, width in images.DERIVATIVE_SIZES.items():
+            with self.open_derivative(book.cover_image, size, 'webp') as derivative:
+                self.assertEqual(derivative.format, 'WEBP')
+                self.assertEqual(derivative.size, (width, width * 3 // 2))
+            with self.open_derivative(book.cover_image, size, 'jpg') as derivative:
+                self.assertEqual(derivative.format, 'JPEG')
+        self.assertEqual(os.path.dirname(images.derivative_name(book.cover_image.name, 'thumb',
+                                                                'jpg')),
+                         os.path.dirname(book.cover_image.name))
+
+    def test_small_images_are_not_enlarged(self):
+        """
+        Test if images narrower than a size keep their width
+        """
+        self.author.photo = image_upload('photo.jpg', (80, 100), 'RGB', 'JPEG')
+        self.author.save()
+        self.run_jobs()
+        with self.open_derivative(self.author.photo, 'detail', 'jpg') as derivative:
+            self.assertEqual(derivative.size, (80, 100))
+
+    def test_metadata_is_removed(self):
+        """
+        Test if the derivatives are rotated as the original and have no EXIF
+        """
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x010f] = 'Camera'
+        buffer = BytesIO()
+        Image.new('RGB', (400, 200), 'blue').save(buffer, 'JPEG', exif=exif)
+        book = Book.objects.create(title='The Book', author=self.author,
+                                   cover_image=SimpleUploadedFile('photo.jpg', buffer.getvalue()))
+        self.run_jobs()
+        with self.open_derivative(book.cover_image, 'carousel', 'jpg') as derivative:
+            self.assertEqual(derivative.size, (200, 400))
+            self.assertEqual(len(derivative.getexif()), 0)
+
+    def test_invalid_image_is_shown_as_original(self):
+        """
+        Test if a file that cannot be read keeps the original image
+        """
+        book = Book.objects.create(title='The Book', author=self.author,
+                                   cover_image=SimpleUploadedFile('cover.png', b'not an image'))
+        with self.assertLogs('book_catalog.images', 'WARNING'):
+            self.run_jobs()
+        self.assertFalse(images.has_derivatives(book.cover_image))
+        html = images.picture_html(book.cover_image, 'The Book', '50px')
+        self.assertEqual(html, f'<img src="{book.cover_image.url}" alt="The Book" class="" style="" '
+                               'loading="lazy">')
+
+    def test_picture_html(self):
+        """
+        Test if the picture lists the derivatives of both encodings
+        """
+        book = Book.objects.create(title='The Book', author=self.author,
+                                   cover_image=image_upload())
+        self.run_jobs()
+        html = images.picture_html(book.cover_image, 'The Book', '50px', 'img-fluid')
+        root = book.cover_image.url.rsplit('.', 1)[0]
+        version = images.derivative_version()
+        self.assertIn(f'<source type="image/webp" srcset="{root}.thumb-{version}.webp 100w, '
+                      f'{root}.carousel-{version}.webp 300w, '
+                      f'{root}.detail-{version}.webp 600w" sizes="50px">', html)
+        self.assertIn(f'<img src="{root}.detail-{version}.jpg" '
+                      f'srcset="{root}.thumb-{version}.jpg 100w', html)
+        self.assertEqual(images.picture_html(Book(title='No cover').cover_image, 'No cover', '50px'), '')
+
+    def test_placeholder(self):
+        """
+        Test if the job stores a small placeholder and the size of the
+        image, shown while it is lazily loaded
+        """
+        book = Book.objects.create(title='The Book', author=self.author,
+                                   cover_image=image_upload())
+        self.assertEqual(book.cover_placeholder, '')
+        self.run_jobs()
+        book.refresh_from_db()
+        self.assertTrue(book.cover_placeholder.startswith('data:image/webp;base64,'))
+        self.assertLess(len(book.cover_placeholder), 1000)
+        self.assertEqual((book.cover_width, book.cover_height), (600, 900))
+        html = images.picture_html(book.cover_image, 'The Book', '50px', style='width: 50px;')
+        self.assertIn(f'style="width: 50px; background: url({book.cover_placeholder}) center / '
+                      'cover no-repeat;" width="600" height="900" loading="lazy"', html)
+        self.assertIn('loading="eager"', images.picture_html(book.cover_image, 'The Book', '50px',
+                                                              loading='eager'))
+
+    def test_placeholder_is_reset_with_the_image(self):
+        """
+        Test if a new upload forgets the placeholder of the previous image
+        until its job is run
+        """
+        book = Book.objects.create(title='The Book', author=self.author,
+                                   cover_image=image_upload())
+        self.run_jobs()
+        book.refresh_from_db()
+        book.summary = 'New summary'
+        book.save()
+        self.assertNotEqual(book.cover_placeholder, '')
+        book.cover_image = image_upload(size=(200, 100))
+        book.save()
+        self.assertEqual((book.cover_placeholder, book.cover_width), ('', None))
+        self.run_jobs()
+        book.refresh_from_db()
+        self.assertEqual((book.cover_width, book.cover_height), (200, 100))
+
+    def test_placeholder_of_a_stored_image(self):
+        """
+        Test if the placeholder of an upload whose derivatives already exist
+        is made from them
+        """
+        Book.objects.create(title='The Book', author=self.author, cover_image=image_upload())
+        self.run_jobs()
+        copy = Book.objects.create(title='The Copy', author=self.author,
+                                   cover_image=image_upload())
+        with patch.object(images, 'generate_derivatives') as generate_derivatives:
+            self.run_jobs()
+        generate_derivatives.assert_not_called()
+        copy.refresh_from_db()
+        self.assertTrue(copy.cover_placeholder)
+        self.assertEqual((copy.cover_width, copy.cover_height), (600, 900))
+
+    def test_templates_use_derivatives(self):
+        """
+        Test if the book list and the data table show the derivatives
+        """
+        Book.objects.create(title='The Book', author=self.author, cover_image=image_upload())
+        self.run_jobs()
+        User.objects.create_user(username='testuser', password='12345')
+        self.client.login(username='testuser', password='12345')
+        response = self.client.get(reverse('books'))
+        thumbnail = f'.thumb-{images.derivative_version()}.webp 100w'
+        self.assertContains(response, thumbnail)
+        self.assertContains(response, 'data:image/webp;base64,')
+        self.assertContains(response, 'loading="lazy"')
+        self.assertIn(thumbnail, self.client.get(reverse('books-data')).json()['data'][0][0])
+
+    def test_build_image_derivatives(self):
+        """
+        Test if the command generates the missing derivatives
+        """
+        book = Book.objects.create(title='The Book', author=self.author,
+                                   cover_image=image_upload())
+        self.run_jobs()
+        os.remove(os.path.join(self.media_root,
+                               images.derivative_name(book.cover_image.name, 'detail', 'jpg')))
+        out = StringIO()
+        call_command('build_image_derivatives', stdout=out)
+        self.assertIn('Derivatives generated for 1 images, 0 already had them, 0 failed',
+                      out.getvalue())
+        self.assertTrue(images.has_derivatives(book.cover_image))
+        out = StringIO()
+        call_command('build_image_derivatives', force=True, stdout=out)
+        self.assertIn('Derivatives generated for 1 images', out.getvalue())
+
+    def test_build_image_derivatives_queue(self):
+        """
+        Test if the command queues the missing derivatives for the worker
+        """
+        Book.objects.create(title='The Book', author=self.author, cover_image=image_upload())
+        Job.objects.all().delete()
+        out = StringIO()
+        call_command('build_image_derivatives', queue=True, stdout=out)
+        call_command('build_image_derivatives', queue=True, stdout=out)
+        self.assertIn('Derivatives queued for 1 images', out.getvalue())
+        self.assertEqual(Job.objects.filter(task='image_derivatives').count(), 1)
+
+
+class ContentAddressedStorageTest(MediaTestCase):
+    """
+    Test the storage of the covers and photos by the hash of their content
+    """
+    def write_legacy(self, name, content):
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as legacy_file:
+            legacy_file.write(content)
+
+    def test_identical_uploads_are_stored_once(self):
+        """
+        Test if the same image uploaded twice is stored once, named by its
+        content
+        """
+        first = Book.objects.create(title='The Book', author=self.author,
+                                    cover_image=image_upload('first.png'))
+        second = Book.objects.create(title='The Copy', author=self.author,
+                                     cover_image=image_upload('second.png'))
+        other = Book.objects.create(title='Other', author=self.author,
+                                    cover_image=image_upload(size=(10, 10)))
+        self.assertEqual(first.cover_image.name, second.cover_image.name)
+        self.assertNotEqual(first.cover_image.name, other.cover_image.name)
+        with first.cover_image.open('rb') as content:
+            digest = storage.content_hash(content)
+        self.assertEqual(first.cover_image.name, f'covers/{digest[:2]}/{digest}.png')
+        self.assertEqual(len(os.listdir(os.path.join(self.media_root, 'covers', digest[:2]))), 1)
+
+    def test_immutable_cache_control(self):
+        """
+        Test if only the files named by their content are served as
+        immutable
+        """
+        book = Book.objects.create(title='The Book', author=self.author,
+                                   cover_image=image_upload())
+        jobs.Worker(processes=0).run(drain=True)
+        self.write_legacy('covers/legacy.png', b'legacy')
+        request = RequestFactory().get('/media/')
+        for name, cache_control in ((book.cover_image.name, storage.IMMUTABLE_CACHE_CONTROL),
+                                    (images.derivative_name(book.cover_image.name, 'thumb',
+                                                            'webp'),
+                                     storage.IMMUTABLE_CACHE_CONTROL),
+                                    ('covers/legacy.png', None)):
+            response = serve_media(request, name, document_root=self.media_root)
+            self.assertEqual(response.get('Cache-Control'), cache_control)
+
+    def test_new_settings_give_new_derivative_names(self):
+        """
+        Test if changing the encoding settings renames the derivatives, which
+        are served as immutable, instead of overwriting them, and shows the
+        original until the new ones are written
+        """
+        book = Book.objects.create(title='The Book', author=self.author,
+                                   cover_image=image_upload())
+        jobs.Worker(processes=0).run(drain=True)
+        thumbnail = images.derivative_name(book.cover_image.name, 'thumb', 'webp')
+        self.assertTrue(images.has_derivatives(book.cover_image))
+        with patch.object(images, 'QUALITY', 60):
+            new_thumbnail = images.derivative_name(book.cover_image.name, 'thumb', 'webp')
+            self.assertNotEqual(new_thumbnail, thumbnail)
+            self.assertTrue(storage.is_content_addressed(new_thumbnail))
+            self.assertFalse(images.has_derivatives(book.cover_image))
+            book.refresh_from_db()
+            self.assertTrue(images.needs_derivatives(book))
+            html = images.picture_html(book.cover_image, 'The Book', '50px')
+            self.assertNotIn('<picture>', html)
+            self.assertNotIn(thumbnail, html)
+            self.assertIn(f'src="{book.cover_image.url}"', html)
+            images.generate_derivatives(book.cover_image)
+            self.assertTrue(book.cover_image.storage.exists(new_thumbnail))
+            html = images.picture_html(book.cover_image, 'The Book', '50px')
+            self.assertIn(new_thumbnail, html)
+        self.assertTrue(book.cover_image.storage.exists(thumbnail))
+
+    def test_rehash_media(self):
+        """
+        Test if the command moves the old files and their derivatives to
+        their content-addressed names
+        """
+        content = image_upload().read()
+        self.write_legacy('covers/old.png', content)
+        old_thumbnail = images.derivative_name('covers/old.png', 'thumb', 'webp')
+        self.write_legacy(old_thumbnail, b'thumbnail')
+        self.write_legacy('covers/copy.png', content)
+        books = [Book.objects.create(title=title, author=self.author)
+                 for title in ('The Book', 'The Copy', 'Missing')]
+        for book, name in zip(books, ('covers/old.png', 'covers/copy.png', 'covers/missing.png')):
+            Book.objects.filter(pk=book.pk).update(cover_image=name)
+        out = StringIO()
+        call_command('rehash_media', batch_size=1, delete_old=True, stdout=out)
+        self.assertIn('Books: 2 images renamed, 1 of them duplicates, 1 files missing',
+                      out.getvalue())
+        for book in books:
+            book.refresh_from_db()
+        self.assertEqual(books[0].cover_image.name, books[1].cover_image.name)
+        self.assertTrue(storage.is_content_addressed(books[0].cover_image.name))
+        self.assertEqual(books[0].cover_image.read(), content)
+        thumbnail = images.derivative_name(books[0].cover_image.name, 'thumb', 'webp')
+        self.assertTrue(books[0].cover_image.storage.exists(thumbnail))
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'covers', 'old.png')))
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, old_thumbnail)))
+        self.assertEqual(books[2].cover_image.name, 'covers/missing.png')
@@ -0,0 +1,122 @@
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from book_catalog import jobs
+from book_catalog.models import Job
+
+CALLS = []
+
+
+def record_task(*args):
+    CALLS.append(args)
+
+def failing_task(*args):
+    raise RuntimeError('Task failed')
+
+
+@patch.dict(jobs.TASKS, {'record': 'book_catalog.tests.test_jobs.record_task',
+                         'fail': 'book_catalog.tests.test_jobs.failing_task'})
+class JobQueueTest(TestCase):
+    """
+    Test the queue of jobs and its worker
+    """
+    def setUp(self):
+        CALLS.clear()
+
+    def test_enqueue(self):
+        """
+        Test if unique jobs are only queued once while pending
+        """
+        job = jobs.enqueue('record', 1, 'a', unique=True)
+        self.assertEqual(jobs.enqueue('record', 1, 'a', unique=True), job)
+        self.assertNotEqual(jobs.enqueue('record', 1, 'a'), job)
+        self.assertNotEqual(jobs.enqueue('record', 2, 'a', unique=True), job)
+        with self.assertRaises(ValueError):
+            jobs.enqueue('unknown')
+
+    def test_claim_in_order(self):
+        """
+        Test if the due jobs are claimed in order, once
+        """
+        later = jobs.enqueue('record', 1)
+        later.run_after = timezone.now() + timedelta(minutes=1)
+        later.save()
+        first, second = jobs.enqueue('record', 2), jobs.enqueue('record', 3)
+        self.assertEqual(jobs.claim(5), [first, second])
+        self.assertEqual(jobs.claim(5), [])
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.attempts), ('r', 1))
+
+    def test_claim_concurrency(self):
+        """
+        Test if the jobs of a task with a concurrency limit wait for the
+        running ones
+        """
+        limited = [jobs.enqueue('fail', number) for number in range(3)]
+        other = jobs.enqueue('record', 1)
+        with patch.dict(jobs.CONCURRENCY, {'fail': 2}):
+            self.assertEqual(jobs.claim(10), limited[:2] + [other])
+            self.assertEqual(jobs.claim(10), [])
+            Job.objects.filter(pk=limited[0].pk).update(status='d')
+            self.assertEqual(jobs.claim(10), [limited[2]])
+
+    def test_worker_runs_jobs(self):
+        """
+        Test if the worker runs every job with its arguments and drains the
+        queue
+        """
+        jobs.enqueue('record', 1, 'a')
+        jobs.enqueue('record', 2, 'b')
+        worker = jobs.Worker(processes=0)
+        worker.run(drain=True)
+        self.assertEqual(CALLS, [(1, 'a'), (2, 'b')])
+        self.assertEqual(worker.results, {'d': 2, 'p': 0, 'f': 0})
+        self.assertFalse(Job.objects.exclude(status='d').exists())
+
+    def test_retries(self):
+        """
+        Test if a failing job is retried after a growing delay until it has
+        no attempts left
+        """
+        job = jobs.enqueue('fail', max_attempts=3)
+        delays = []
+        with self.assertLogs('book_catalog.jobs', 'ERROR'):
+            for _ in range(3):
+                job = jobs.claim(1)[0]
+                start = timezone.now()
+                jobs.run_job(job.pk)
+                job.refresh_from_db()
+                delays.append(job.run_after - start)
+                Job.objects.filter(pk=job.pk).update(run_after=start)
+        self.assertEqual(job.status, 'f')
+        self.assertEqual(job.attempts, 3)
+        self.assertIn('Task failed', job.error)
+        self.assertGreaterEqual(delays[0], jobs.RETRY_DELAY)
+        self.assertGreaterEqual(delays[1], jobs.RETRY_DELAY * 2)
+
+    def test_stale_jobs_are_requeued(self):
+        """
+        Test if the jobs of a worker that died are run again
+        """
+        job = jobs.enqueue('record', 1)
+        jobs.claim(1)
+        Job.objects.filter(pk=job.pk).update(started=timezone.now() - jobs.STALE_AFTER * 2)
+        jobs.Worker(processes=0).run(drain=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('d', 2))
+        self.assertEqual(CALLS, [(1,)])
+
+    def test_run_jobs_command(self):
+        """
+        Test if the command drains the queue and reports the results
+        """
+        jobs.enqueue('record', 1)
+        jobs.enqueue('fail', max_attempts=1)
+        out = StringIO()
+        with self.assertLogs('book_catalog.jobs', 'ERROR'):
+            call_command('run_jobs', processes=0, drain=True, verbosity=2, stdout=out)
+        self.assertIn("record(1,): Done", out.getvalue())
+        self.assertIn('Jobs run: 1 done, 0 to retry, 1 failed', out.getvalue())
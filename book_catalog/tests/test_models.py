@@ -1,3 +1,4 @@
+import uuid
 from django.test import TestCase
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
@@ -400,6 +401,30 @@ class AuthorModelTest(TestCase):
         user.delete()
         relation.delete()
 
+    def test_author_with_stats(self):
+        """
+        Test the statistics annotated by Author.objects.with_stats()
+        """
+        book_1 = Book.objects.create(title='Big Book', author=self.author)
+        book_2 = Book.objects.create(title='Small Book', author=self.author)
+        Book.objects.create(title='Unrated Book', author=self.author)
+        user_1 = User.objects.create_user(username='testuser', password='12345')
+        user_2 = User.objects.create_user(username='otheruser', password='12345')
+        UserBookRelation.objects.create(user=user_1, book=book_1, rating=5, review='Great book')
+        UserBookRelation.objects.create(user=user_2, book=book_1, rating=3)
+        UserBookRelation.objects.create(user=user_1, book=book_2, rating=1)
+        with self.assertNumQueries(1):
+            author = Author.objects.with_stats().get(pk=self.author.pk)
+            self.assertEqual(author.average_rating(), 2.5)
+            self.assertEqual(author.number_of_ratings(), 3)
+            self.assertEqual(author.number_of_reviews(), 1)
+            self.assertEqual(author.number_of_books(), 3)
+        self.assertEqual(self.author.average_rating(), 2.5)
+        author = Author.objects.with_stats().get(pk=1)
+        self.assertIsNone(author.average_rating())
+        self.assertEqual(author.number_of_ratings(), 0)
+        self.assertEqual(author.number_of_books(), 0)
+
 class BookSagaModelTest(TestCase):
     """
     Test the BookSaga model
@@ -536,6 +561,21 @@ class BookSagaModelTest(TestCase):
         user.delete()
         relation.delete()
 
+    def test_saga_with_stats(self):
+        """
+        Test the statistics annotated by BookSaga.objects.with_stats()
+        """
+        book = Book.objects.create(title='Big Book', author=self.author,
+                                   saga=self.saga, saga_volume=1)
+        user = User.objects.create_user(username='testuser', password='12345')
+        UserBookRelation.objects.create(user=user, book=book, rating=4, review='Great book')
+        with self.assertNumQueries(1):
+            saga = BookSaga.objects.with_stats().get(pk=self.saga.pk)
+            self.assertEqual(saga.average_rating(), 4)
+            self.assertEqual(saga.average_rating_over_100(), 80)
+            self.assertEqual(saga.number_of_ratings(), 1)
+            self.assertEqual(saga.number_of_reviews(), 1)
+
 
 class BookModelTest(TestCase):
     """
@@ -932,6 +972,17 @@ class UserBookRelationModelTest(TestCase):
         user_book_relation = UserBookRelation.objects.filter(user=user, book=book).first()
         self.assertEqual(str(user_book_relation), 'testuser (Big Book)')
 
+    def test_user_book_relation_keys(self):
+        """
+        Test if the primary key is an integer and the public id a unique UUID
+        """
+        relation = UserBookRelation.objects.get(user=self.user)
+        self.assertIsInstance(relation.pk, int)
+        self.assertIsInstance(relation.uuid, uuid.UUID)
+        other = UserBookRelation.objects.get(user__username='testuser')
+        self.assertNotEqual(relation.uuid, other.uuid)
+        self.assertEqual(UserBookRelation.objects.get(uuid=relation.uuid), relation)
+
     def test_user_book_relation_update(self):
         """
         Change the user book relation
@@ -974,3 +1025,101 @@ class UserBookRelationModelTest(TestCase):
             UserBookRelation.objects.create(user=self.user, book=self.book, status='r')
         self.assertIn("User book relation with this User and Book already exists",
                       e.exception.message_dict['__all__'][0])
+
+class BookRatingStatsTest(TestCase):
+    """
+    Test the rating statistics stored on the Book model
+    """
+    @classmethod
+    def setUpTestData(cls):
+        """
+        Set up the permanent data
+        """
+        author = Author.objects.create(first_name='Big', last_name='Bob')
+        cls.book = Book.objects.create(title='Big Book', author=author)
+        cls.other_book = Book.objects.create(title='Small Book', author=author)
+        cls.user = User.objects.create_user(username='testuser', password='12345')
+        cls.other_user = User.objects.create_user(username='otheruser', password='12345')
+
+    def assertStats(self, book, rating_sum, rating_count, review_count):
+        """
+        Check the statistics saved in the data base for the book
+        """
+        book.refresh_from_db()
+        self.assertEqual((book.rating_sum, book.rating_count, book.review_count),
+                         (rating_sum, rating_count, review_count))
+
+    def test_stats_on_create(self):
+        """
+        Test the statistics after creating relations
+        """
+        UserBookRelation.objects.create(user=self.user, book=self.book, rating=4,
+                                        review='Great book')
+        UserBookRelation.objects.create(user=self.other_user, book=self.book, rating=1)
+        self.assertStats(self.book, 5, 2, 1)
+        self.assertEqual(self.book.average_rating(), 2.5)
+        self.assertEqual(self.book.number_of_ratings(), 2)
+        self.assertEqual(self.book.number_of_reviews(), 1)
+
+    def test_stats_on_update(self):
+        """
+        Test the statistics after changing the rating and the review
+        """
+        relation = UserBookRelation.objects.create(user=self.user, book=self.book, rating=4)
+        relation.rating = 2
+        relation.review = 'Not so great'
+        relation.save()
+        self.assertStats(self.book, 2, 1, 1)
+        relation = UserBookRelation.objects.get(pk=relation.pk)
+        relation.rating = None
+        relation.review = ''
+        relation.save()
+        self.assertStats(self.book, 0, 0, 0)
+        self.assertIsNone(self.book.average_rating())
+
+    def test_stats_on_book_change(self):
+        """
+        Test the statistics when a relation is moved to another book
+        """
+        relation = UserBookRelation.objects.create(user=self.user, book=self.book, rating=3)
+        relation.book = self.other_book
+        relation.save()
+        self.assertStats(self.book, 0, 0, 0)
+        self.assertStats(self.other_book, 3, 1, 0)
+
+    def test_stats_on_delete(self):
+        """
+        Test the statistics after deleting relations
+        """
+        relation = UserBookRelation.objects.create(user=self.user, book=self.book, rating=5,
+                                                   review='Great book')
+        UserBookRelation.objects.create(user=self.other_user, book=self.book, rating=3)
+        relation.delete()
+        self.assertStats(self.book, 3, 1, 0)
+        self.other_user.delete()
+        self.assertStats(self.book, 0, 0, 0)
+
+    def test_stats_on_bulk_operations(self):
+        """
+        Test the statistics after bulk operations on the relations
+        """
+        UserBookRelation.objects.bulk_create([
+            UserBookRelation(user=self.user, book=self.book, rating=5),
+            UserBookRelation(user=self.other_user, book=self.book, rating=2, review='Meh'),
+        ])
+        self.assertStats(self.book, 7, 2, 1)
+        UserBookRelation.objects.filter(book=self.book).update(rating=1)
+        self.assertStats(self.book, 2, 2, 1)
+        UserBookRelation.objects.filter(user=self.user).update(book=self.other_book)
+        self.assertStats(self.book, 1, 1, 1)
+        self.assertStats(self.other_book, 1, 1, 0)
+
+    def test_book_save_keeps_stats(self):
+        """
+        Test that saving a stale book instance does not overwrite the statistics
+        """
+        book = Book.objects.get(pk=self.book.pk)
+        UserBookRelation.objects.create(user=self.user, book=self.book, rating=4)
+        book.summary = 'New summary'
+        book.save()
+        self.assertStats(self.book, 4, 1, 0)
@@ -0,0 +1,164 @@
+import datetime
+from django.test import TestCase
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+from book_catalog.models import Author, Book, BookSaga, User, UserBookRelation
+from book_catalog.services import rate_book, set_book_status, set_saga_status
+
+
+class SetSagaStatusTest(TestCase):
+    """
+    Test the set_saga_status service
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', password='12345')
+        author = Author.objects.create(first_name='Sara', last_name='Trueman')
+        cls.saga = BookSaga.objects.create(name='The Saga', author=author)
+        cls.books = [Book.objects.create(title=f'The Book {volume}', author=author,
+                                         saga=cls.saga, saga_volume=volume)
+                     for volume in range(1, 16)]
+        UserBookRelation.objects.create(user=cls.user, book=cls.books[0], status='r', rating=4)
+        UserBookRelation.objects.create(user=cls.user, book=cls.books[1], status='i')
+
+    def _statuses(self):
+        return dict(UserBookRelation.objects.filter(user=self.user).values_list(
+            'book__saga_volume', 'status'))
+
+    def test_set_status(self):
+        """
+        Test if every book of the saga gets the status in a constant number of
+        queries
+        """
+        # Books, relations, one UPDATE and one INSERT, plus the savepoints
+        with self.assertNumQueries(8):
+            created, updated = set_saga_status(self.user, self.saga, 'r')
+        self.assertEqual((created, updated), (13, 1))
+        self.assertEqual(self._statuses(), {volume: 'r' for volume in range(1, 16)})
+        self.assertEqual(UserBookRelation.objects.get(book=self.books[0]).rating, 4)
+
+    def test_remove_status(self):
+        """
+        Test if the statuses are removed without creating relations
+        """
+        created, updated = set_saga_status(self.user, self.saga, 'd')
+        self.assertEqual((created, updated), (0, 2))
+        self.assertEqual(self._statuses(), {1: None, 2: None})
+
+    def test_invalid_status(self):
+        """
+        Test if an invalid status changes nothing
+        """
+        with self.assertRaises(ValidationError):
+            set_saga_status(self.user, self.saga, 'x')
+        self.assertEqual(self._statuses(), {1: 'r', 2: 'i'})
+
+    def test_other_users_are_not_changed(self):
+        """
+        Test if only the relations of the given user change
+        """
+        other = User.objects.create_user(username='other', password='12345')
+        UserBookRelation.objects.create(user=other, book=self.books[0], status='t')
+        set_saga_status(self.user, self.saga, 'i')
+        self.assertEqual(UserBookRelation.objects.get(user=other).status, 't')
+
+class SetBookStatusTest(TestCase):
+    """
+    Test the set_book_status service
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', password='12345')
+        author = Author.objects.create(first_name='Sara', last_name='Trueman')
+        cls.book = Book.objects.create(title='The Book', author=author)
+
+    def test_create_in_one_statement(self):
+        """
+        Test if a new relation is created by a single statement with today as
+        read date
+        """
+        with self.assertNumQueries(1):
+            set_book_status(self.user, self.book, 'r')
+        relation = UserBookRelation.objects.get(user=self.user, book=self.book)
+        self.assertEqual(relation.status, 'r')
+        self.assertEqual(relation.read_date, timezone.now().date())
+        self.assertIsNone(relation.reading_date)
+
+    def test_update_keeps_dates(self):
+        """
+        Test if an existing relation is updated keeping its dates
+        """
+        UserBookRelation.objects.create(user=self.user, book=self.book, status='i', rating=3,
+                                        reading_date=datetime.date(2022, 1, 1))
+        with self.assertNumQueries(1):
+            set_book_status(self.user, self.book, 'r')
+        set_book_status(self.user, self.book, 'i')
+        relation = UserBookRelation.objects.get(user=self.user, book=self.book)
+        self.assertEqual(relation.status, 'i')
+        self.assertEqual(relation.reading_date, datetime.date(2022, 1, 1))
+        self.assertEqual(relation.read_date, timezone.now().date())
+        self.assertEqual(relation.rating, 3)
+
+    def test_double_submit(self):
+        """
+        Test if setting the same status twice does not fail
+        """
+        set_book_status(self.user, self.book, 't')
+        set_book_status(self.user, self.book, 't')
+        self.assertEqual(UserBookRelation.objects.filter(user=self.user).count(), 1)
+
+    def test_remove_status(self):
+        """
+        Test if removing the status clears it with its dates
+        """
+        set_book_status(self.user, self.book, 'r')
+        set_book_status(self.user, self.book, 'd')
+        relation = UserBookRelation.objects.get(user=self.user, book=self.book)
+        self.assertEqual((relation.status, relation.read_date), (None, None))
+
+    def test_invalid_status(self):
+        """
+        Test if an invalid status is rejected
+        """
+        with self.assertRaises(ValidationError):
+            set_book_status(self.user, self.book, 'x')
+        self.assertFalse(UserBookRelation.objects.exists())
+
+class RateBookTest(TestCase):
+    """
+    Test the rate_book service
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', password='12345')
+        author = Author.objects.create(first_name='Sara', last_name='Trueman')
+        cls.book = Book.objects.create(title='The Book', author=author)
+
+    def test_rate_and_toggle(self):
+        """
+        Test if rating twice with the same value removes the rating, and the
+        statistics of the book follow
+        """
+        rate_book(self.user, self.book, 4)
+        self.assertEqual(Book.objects.get(pk=self.book.pk).average_rating(), 4)
+        rate_book(self.user, self.book, 2)
+        self.assertEqual(Book.objects.get(pk=self.book.pk).average_rating(), 2)
+        rate_book(self.user, self.book, 2)
+        self.assertIsNone(UserBookRelation.objects.get(user=self.user).rating)
+        self.assertIsNone(Book.objects.get(pk=self.book.pk).average_rating())
+
+    def test_rate_keeps_status(self):
+        """
+        Test if rating keeps the status of the book
+        """
+        set_book_status(self.user, self.book, 'r')
+        rate_book(self.user, self.book, 5)
+        relation = UserBookRelation.objects.get(user=self.user)
+        self.assertEqual((relation.status, relation.rating), ('r', 5))
+
+    def test_invalid_rating(self):
+        """
+        Test if an invalid rating is rejected
+        """
+        with self.assertRaises(ValidationError):
+            rate_book(self.user, self.book, 0)
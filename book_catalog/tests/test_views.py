@@ -1,8 +1,21 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import tempfile
+from unittest.mock import patch
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import Permission
 from django.urls import reverse
 from django.utils import timezone
-from book_catalog.models import Author, Book, User, BookSaga, UserBookRelation, Genre
+from book_catalog import goodreads, jobs, object_cache, pagination, search
+from book_catalog.models import (Author, Book, User, BookSaga, Job, ShelfImport,
+                                 UserBookRelation, Genre, Language)
+from book_catalog.services import set_book_status
 
 
 ################# List Views #################
@@ -20,6 +33,9 @@ class AuthorListViewTest(TestCase):
                 last_name=f'Trueman {author_num}',
             )
 
+    def setUp(self):
+        cache.clear()
+
     def test_view_url_exists_at_desired_location(self):
         """
         Test if view is accessible
@@ -56,6 +72,33 @@ class AuthorListViewTest(TestCase):
         response = self.client.get(reverse('authors')+'?page=3')
         self.assertEqual(response.status_code, 200)
 
+    def test_keyset_pagination(self):
+        """
+        Test if the authors are paginated by last and first name
+        """
+        response = self.client.get(reverse('authors'), {'format': 'json'})
+        data = response.json()
+        self.assertEqual(len(data['results']), 25)
+        self.assertEqual(data['results'][0]['last_name'], 'Trueman 0')
+        self.assertEqual(data['results'][0]['number_of_books'], 0)
+        self.assertIsNone(data['next'])
+
+    def test_data_table(self):
+        """
+        Test if the data table endpoint sorts and filters the authors
+        """
+        Book.objects.create(title='The Book', author=Author.objects.get(last_name='Trueman 3'))
+        response = self.client.get(reverse('authors-data'), {
+            'length': '2', 'order[0][column]': '3', 'order[0][dir]': 'desc'})
+        data = response.json()
+        self.assertEqual(data['recordsTotal'], 25)
+        self.assertIn('Trueman 3', data['data'][0][1])
+        self.assertEqual(data['data'][0][3], 1)
+        response = self.client.get(reverse('authors-data'), {'search[value]': 'sara 14'})
+        data = response.json()
+        self.assertEqual(data['recordsFiltered'], 1)
+        self.assertIn('Sara 14', data['data'][0][2])
+
 class BookListViewTest(TestCase):
     """
     Test if BookListView works correctly
@@ -72,6 +115,9 @@ class BookListViewTest(TestCase):
                 summary=f'Book {book_num} summary',
             )
 
+    def setUp(self):
+        cache.clear()
+
     def test_view_url_exists_at_desired_location(self):
         """
         Test if view is accessible
@@ -108,6 +154,117 @@ class BookListViewTest(TestCase):
         response = self.client.get(reverse('books')+'?page=3')
         self.assertEqual(response.status_code, 200)
 
+    def test_keyset_pagination(self):
+        """
+        Test if the cursors walk through every book forwards and backwards
+        """
+        Book.objects.create(title='The Book 99', author=Author.objects.get(id=1))
+        response = self.client.get(reverse('books'))
+        self.assertTrue(response.context['is_paginated'])
+        first_page = list(response.context['book_list'])
+        self.assertEqual(len(first_page), 25)
+        self.assertFalse(response.context['page_obj'].has_previous())
+        response = self.client.get(reverse('books'),
+                                   {'cursor': response.context['page_obj'].next_cursor})
+        self.assertEqual([book.title for book in response.context['book_list']], ['The Book 99'])
+        self.assertFalse(response.context['page_obj'].has_next())
+        response = self.client.get(reverse('books'),
+                                   {'cursor': response.context['page_obj'].previous_cursor})
+        self.assertEqual(list(response.context['book_list']), first_page)
+        self.assertFalse(response.context['page_obj'].has_previous())
+
+    def test_keyset_pagination_invalid_cursor(self):
+        """
+        Test if an invalid cursor shows the first page
+        """
+        response = self.client.get(reverse('books'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['book_list'][0].title, 'The Book 0')
+
+    def test_keyset_pagination_cursor_with_invalid_values(self):
+        """
+        Test if a cursor holding values of the wrong type shows the first page
+        of every keyset paginated list
+        """
+        User.objects.create_user(username='cursoruser', password='12345')
+        self.client.login(username='cursoruser', password='12345')
+        for values in (['The Book 1', 'z', 1], [{}, 1, 1], [None, 1, 1], ['The Book 1', 1, []]):
+            for direction in (pagination.NEXT, pagination.PREVIOUS):
+                cursor = pagination.encode_cursor(values, direction)
+                for name, size in (('books', 3), ('authors', 3), ('my-books', 2)):
+                    response = self.client.get(reverse(name),
+                                               {'cursor': pagination.encode_cursor(
+                                                   values[:size], direction)})
+                    self.assertEqual(response.status_code, 200, (name, values, direction))
+                response = self.client.get(reverse('books'), {'cursor': cursor})
+                self.assertEqual(response.context['book_list'][0].title, 'The Book 0')
+
+    def test_keyset_pagination_json(self):
+        """
+        Test if the pages are available as JSON
+        """
+        Book.objects.create(title='The Book 99', author=Author.objects.get(id=1))
+        response = self.client.get(reverse('books'), {'format': 'json'})
+        data = response.json()
+        self.assertEqual(len(data['results']), 25)
+        self.assertEqual(data['results'][0]['title'], 'The Book 0')
+        self.assertIsNone(data['previous'])
+        response = self.client.get(reverse('books'), {'format': 'json', 'cursor': data['next']})
+        data = response.json()
+        self.assertEqual([row['title'] for row in data['results']], ['The Book 99'])
+        self.assertIsNone(data['next'])
+        self.assertIsNotNone(data['previous'])
+
+    def test_data_table_window(self):
+        """
+        Test if the data table endpoint returns only the requested rows
+        """
+        response = self.client.get(reverse('books-data'), {
+            'draw': '3', 'start': '10', 'length': '5',
+            'order[0][column]': '1', 'order[0][dir]': 'asc'})
+        data = response.json()
+        self.assertEqual(data['draw'], 3)
+        self.assertEqual(data['recordsTotal'], 25)
+        self.assertEqual(data['recordsFiltered'], 25)
+        self.assertEqual(len(data['data']), 5)
+        self.assertIn('The Book 18', data['data'][0][1])
+
+    def test_data_table_order_by_rating(self):
+        """
+        Test if the data table sorts by average rating with unrated books last
+        """
+        user = User.objects.create_user(username='testuser', password='12345')
+        UserBookRelation.objects.create(user=user, book=Book.objects.get(title='The Book 7'),
+                                        status='r', rating=5)
+        UserBookRelation.objects.create(user=user, book=Book.objects.get(title='The Book 3'),
+                                        status='r', rating=2)
+        for direction, expected in (('desc', ['5.0', '2.0', '']), ('asc', ['2.0', '5.0', ''])):
+            response = self.client.get(reverse('books-data'), {
+                'length': '3', 'order[0][column]': '4', 'order[0][dir]': direction})
+            self.assertEqual([row[4] for row in response.json()['data']], expected)
+
+    def test_data_table_search(self):
+        """
+        Test if the data table filters the books by the search value
+        """
+        response = self.client.get(reverse('books-data'), {'search[value]': 'Trueman 12'})
+        data = response.json()
+        self.assertEqual(data['recordsTotal'], 25)
+        self.assertEqual(data['recordsFiltered'], 1)
+        self.assertIn('The Book 12', data['data'][0][1])
+
+    def test_data_table_cached_count(self):
+        """
+        Test if the total is cached and refreshed when a book is created
+        """
+        self.client.get(reverse('books-data'))
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('books-data'))
+        self.assertEqual(response.json()['recordsTotal'], 25)
+        Book.objects.create(title='The Book 99', author=Author.objects.get(id=1))
+        response = self.client.get(reverse('books-data'))
+        self.assertEqual(response.json()['recordsTotal'], 26)
+
 class UserBookRelationListViewTest(TestCase):
     """
     Test if UserBookRelationListView works correctly
@@ -137,6 +294,9 @@ class UserBookRelationListViewTest(TestCase):
                 status='r',
             )
 
+    def setUp(self):
+        cache.clear()
+
     def test_view_url_exists_at_desired_location_for_logged_in_user(self):
         """
         Test if view is accessible only for logged-in user
@@ -179,6 +339,259 @@ class UserBookRelationListViewTest(TestCase):
         self.assertTrue('userbookrelation_list' in response.context)
         self.assertTrue(len(response.context['userbookrelation_list']) == 1)
 
+    def test_lists_books_as_json(self):
+        """
+        Test if the shelf is available as JSON
+        """
+        self.client.login(username='testuser', password='12345')
+        response = self.client.get(reverse('my-books'), {'format': 'json'})
+        data = response.json()
+        self.assertEqual(len(data['results']), 1)
+        self.assertEqual(data['results'][0]['title'], 'The Book')
+        self.assertEqual(data['results'][0]['status'], 'Read')
+
+    def test_data_table(self):
+        """
+        Test if the data table endpoint returns the shelf of the current user
+        """
+        self.client.login(username='testuser', password='12345')
+        response = self.client.get(reverse('my-books-data'), {'draw': '1'})
+        data = response.json()
+        self.assertEqual(data['recordsTotal'], 1)
+        self.assertIn('The Book', data['data'][0][1])
+        self.assertEqual(data['data'][0][5], 'Read')
+        UserBookRelation.objects.create(user=self.user, book=Book.objects.get(title='The Book 0'),
+                                        status='t')
+        response = self.client.get(reverse('my-books-data'), {'search[value]': 'Book 0'})
+        data = response.json()
+        self.assertEqual(data['recordsTotal'], 2)
+        self.assertEqual(data['recordsFiltered'], 1)
+
+    def test_data_table_redirects_for_anonymous_user(self):
+        """
+        Test if the data table endpoint redirects an anonymous user
+        """
+        response = self.client.get(reverse('my-books-data'))
+        self.assertEqual(response.status_code, 302)
+
+class ExportShelfViewTest(TestCase):
+    """
+    Test if the books of a user are exported as CSV and JSON Lines
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', password='12345')
+        cls.other_user = User.objects.create_user(username='otheruser', password='12345')
+        cls.staff = User.objects.create_user(username='staffuser', password='12345',
+                                             is_staff=True)
+        author = Author.objects.create(first_name='Sara', last_name='Trueman')
+        saga = BookSaga.objects.create(name='The Saga', author=author)
+        book = Book.objects.create(title='The Book', author=author, saga=saga, saga_volume=1,
+                                   isbn='9781234567897')
+        other_book = Book.objects.create(title='Other Book', author=author)
+        cls.relation = UserBookRelation.objects.create(
+            user=cls.user, book=book, status='r', rating=4, review='Great, "really"',
+            read_date=timezone.now().date())
+        UserBookRelation.objects.create(user=cls.other_user, book=other_book, status='t')
+
+    def get_content(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_export_csv(self):
+        """
+        Test if the shelf of the current user is streamed as CSV
+        """
+        self.client.login(username='testuser', password='12345')
+        response = self.client.get(reverse('export-shelf'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('books-testuser.csv', response['Content-Disposition'])
+        lines = self.get_content(response).splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].startswith('id,title,author_first_name,author_last_name,saga'))
+        self.assertIn('The Book,Sara,Trueman,The Saga,1,9781234567897,r,', lines[1])
+        self.assertIn('"Great, ""really"""', lines[1])
+
+    def test_export_jsonl(self):
+        """
+        Test if the shelf is streamed as JSON Lines
+        """
+        self.client.login(username='testuser', password='12345')
+        response = self.client.get(reverse('export-shelf'), {'format': 'jsonl'})
+        rows = [json.loads(line) for line in self.get_content(response).splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['id'], str(self.relation.uuid))
+        self.assertEqual(rows[0]['rating'], 4)
+        self.assertEqual(rows[0]['read_date'], timezone.now().date().isoformat())
+
+    def test_export_gzip(self):
+        """
+        Test if the export is compressed when the client accepts gzip
+        """
+        self.client.login(username='testuser', password='12345')
+        response = self.client.get(reverse('export-shelf'), HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        content = gzip.decompress(b''.join(response.streaming_content)).decode()
+        self.assertIn('The Book', content)
+
+    def test_export_is_read_in_chunks(self):
+        """
+        Test if the relations are read with a single query, whatever the
+        size of the shelf
+        """
+        books = [Book.objects.create(title=f'Book {n}', author=self.relation.book.author)
+                 for n in range(5)]
+        UserBookRelation.objects.bulk_create(
+            [UserBookRelation(user=self.user, book=book, status='t') for book in books])
+        self.client.login(username='testuser', password='12345')
+        response = self.client.get(reverse('export-shelf'))
+        with self.assertNumQueries(1):
+            lines = self.get_content(response).splitlines()
+        self.assertEqual(len(lines), 7)
+
+    def test_staff_exports_other_user(self):
+        """
+        Test if staff can export the shelf of another user and other users
+        cannot
+        """
+        self.client.login(username='staffuser', password='12345')
+        response = self.client.get(reverse('export-shelf'), {'user': self.other_user.pk})
+        self.assertIn('Other Book', self.get_content(response))
+        self.assertEqual(self.client.get(reverse('export-shelf'), {'user': 'x'}).status_code, 404)
+        self.client.login(username='testuser', password='12345')
+        response = self.client.get(reverse('export-shelf'), {'user': self.other_user.pk})
+        self.assertEqual(response.status_code, 403)
+
+    def test_unknown_format(self):
+        """
+        Test if an unknown format is not found
+        """
+        self.client.login(username='testuser', password='12345')
+        response = self.client.get(reverse('export-shelf'), {'format': 'xml'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_redirects_for_anonymous_user(self):
+        """
+        Test if an anonymous user is redirected
+        """
+        response = self.client.get(reverse('export-shelf'))
+        self.assertEqual(response.status_code, 302)
+
+class ImportShelfViewTest(TestCase):
+    """
+    Test if a Goodreads export is imported into the shelf of the user
+    """
+    CONTENT = (b'Title,Author,ISBN13,My Rating,Date Read,Exclusive Shelf\n'
+               b'The Book,Sara Trueman,,4,2023/05/12,read\n'
+               b'Unknown Book,Sara Trueman,,,,to-read\n')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', password='12345')
+        User.objects.create_user(username='otheruser', password='12345')
+        author = Author.objects.create(first_name='Sara', last_name='Trueman')
+        cls.book = Book.objects.create(title='The Book', author=author)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.private_root = os.path.join(directory.name, 'private')
+        media = override_settings(MEDIA_ROOT=directory.name, PRIVATE_MEDIA_ROOT=self.private_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def upload(self):
+        return self.client.post(reverse('import-shelf'), {
+            'file': SimpleUploadedFile('goodreads_library_export.csv', self.CONTENT)})
+
+    def test_import_small_file(self):
+        """
+        Test if a small file is imported during the request and the report
+        shown
+        """
+        self.client.login(username='testuser', password='12345')
+        response = self.upload()
+        shelf_import = ShelfImport.objects.get(user=self.user)
+        self.assertRedirects(response, shelf_import.get_absolute_url())
+        self.assertEqual((shelf_import.status, shelf_import.rows, shelf_import.imported),
+                         ('d', 2, 1))
+        relation = UserBookRelation.objects.get(user=self.user, book=self.book)
+        self.assertEqual((relation.status, relation.rating), ('r', 4))
+        response = self.client.get(shelf_import.get_absolute_url())
+        self.assertContains(response, 'Unknown Book')
+        self.assertContains(response, 'Book not found')
+        self.assertNotContains(response, 'http-equiv="refresh"')
+
+    def test_uploaded_file_is_private_and_deleted(self):
+        """
+        Test if the uploaded file is stored outside of the served media and
+        deleted once imported
+        """
+        self.client.login(username='testuser', password='12345')
+        with patch.object(goodreads, 'INLINE_SIZE', 10):
+            self.upload()
+        shelf_import = ShelfImport.objects.get(user=self.user)
+        path = shelf_import.file.path
+        self.assertTrue(path.startswith(self.private_root))
+        self.assertTrue(os.path.exists(path))
+        self.assertFalse(os.path.exists(os.path.join(settings.MEDIA_ROOT, 'imports')))
+        with self.assertRaises(ValueError):
+            shelf_import.file.url
+        jobs.Worker(processes=0).run(drain=True)
+        shelf_import.refresh_from_db()
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(shelf_import.file.name, '')
+
+    def test_import_large_file_in_background(self):
+        """
+        Test if a large file is imported after the response, by the job
+        worker
+        """
+        self.client.login(username='testuser', password='12345')
+        with patch.object(goodreads, 'INLINE_SIZE', 10):
+            self.upload()
+        shelf_import = ShelfImport.objects.get(user=self.user)
+        self.assertEqual(shelf_import.status, 'p')
+        self.assertFalse(UserBookRelation.objects.exists())
+        job = Job.objects.get(task='shelf_import')
+        self.assertEqual((job.args, job.max_attempts), ([shelf_import.pk], 1))
+        response = self.client.get(shelf_import.get_absolute_url())
+        self.assertContains(response, 'http-equiv="refresh"')
+        jobs.Worker(processes=0).run(drain=True)
+        data = self.client.get(shelf_import.get_absolute_url(), {'format': 'json'}).json()
+        self.assertEqual((data['status'], data['imported']), ('Done', 1))
+        self.assertEqual(data['unmatched'][0]['title'], 'Unknown Book')
+
+    def test_invalid_file_fails(self):
+        """
+        Test if a file that is not a Goodreads export is reported as failed
+        """
+        self.client.login(username='testuser', password='12345')
+        self.client.post(reverse('import-shelf'), {
+            'file': SimpleUploadedFile('books.csv', b'name\nThe Book\n')})
+        shelf_import = ShelfImport.objects.get(user=self.user)
+        self.assertEqual(shelf_import.status, 'f')
+        self.assertIn('Not a Goodreads export', shelf_import.error)
+        self.assertEqual(shelf_import.file.name, '')
+        self.assertEqual(os.listdir(os.path.join(self.private_root, 'imports')), [])
+
+    def test_import_of_other_user_not_found(self):
+        """
+        Test if the import of another user is not found
+        """
+        self.client.login(username='testuser', password='12345')
+        self.upload()
+        shelf_import = ShelfImport.objects.get(user=self.user)
+        self.client.login(username='otheruser', password='12345')
+        self.assertEqual(self.client.get(shelf_import.get_absolute_url()).status_code, 404)
+
+    def test_redirects_for_anonymous_user(self):
+        """
+        Test if an anonymous user is redirected
+        """
+        self.assertEqual(self.client.get(reverse('import-shelf')).status_code, 302)
+
 ################# Detail Views #################
 
 class AuthorDetailViewTest(TestCase):
@@ -211,6 +624,9 @@ class AuthorDetailViewTest(TestCase):
                 summary=f'Book {book_num} summary',
             )
 
+    def setUp(self):
+        cache.clear()
+
     def test_view_url_exists_at_desired_location_for_logged_in_user(self):
         """
         Test if view is accessible only for logged-in user
@@ -253,6 +669,17 @@ class AuthorDetailViewTest(TestCase):
         self.assertTrue('books' in response.context)
         self.assertTrue(len(response.context['books']) == 25)
 
+    def test_number_of_queries_does_not_depend_on_books(self):
+        """
+        Test if the page costs the same number of queries for any number of books
+        """
+        self.client.login(username='testuser', password='12345')
+        with CaptureQueriesContext(connection) as queries_25_books:
+            self.client.get(reverse('author-detail', args=[1]))
+        with CaptureQueriesContext(connection) as queries_10_books:
+            self.client.get(reverse('author-detail', args=[2]))
+        self.assertEqual(len(queries_25_books), len(queries_10_books))
+
 class BookDetailViewTest(TestCase):
     """
     Test for BookDetailView    
@@ -275,6 +702,9 @@ class BookDetailViewTest(TestCase):
                                         review='Great book',
                                         review_date='2021-01-01')
 
+    def setUp(self):
+        cache.clear()
+
     def test_view_url_exists_at_desired_location_for_logged_in_user(self):
         """
         Test if view is accessible only for logged-in user
@@ -351,10 +781,87 @@ class BookDetailViewTest(TestCase):
         self.assertEqual(response.context['rating_range'], range(5,0,-1))
         self.assertEqual(response.context['total_reviews'], 1)
         self.assertEqual(response.context['book_reviews'], [self.relation])
-        self.assertEqual(response.context['book_reviews'][0].user.review_count, 1)
-        self.assertEqual(response.context['book_reviews'][0].user.average_rating, 1)
+        self.assertEqual(response.context['book_reviews'][0].reviewer_stats,
+                         {'review_count': 1, 'average_rating': 5})
         self.assertEqual(response.context['book_reviews'][0].rating_over_100, 100)
 
+    def test_reviewer_stats_are_those_of_the_reviewer(self):
+        """
+        Test if the statistics of each reviewer are their own and not those of
+        the logged-in user, and the number of queries does not depend on them
+        """
+        other_book = Book.objects.create(title='Other Book', author=Author.objects.get(id=1))
+        for number in range(3):
+            reviewer = User.objects.create_user(username=f'reviewer{number}', password='12345')
+            UserBookRelation.objects.create(user=reviewer, book=self.book, status='r',
+                                            rating=number + 1, review='Fine',
+                                            review_date='2021-01-02')
+            UserBookRelation.objects.create(user=reviewer, book=other_book, status='r', rating=5)
+        self.client.login(username='testuser', password='12345')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('book-detail', args=[1]))
+        stats = {review.user.username: review.reviewer_stats
+                 for review in response.context['book_reviews']}
+        self.assertEqual(stats['testuser'], {'review_count': 1, 'average_rating': 5})
+        self.assertEqual(stats['reviewer0'], {'review_count': 1, 'average_rating': 3})
+        self.assertEqual(stats['reviewer2'], {'review_count': 1, 'average_rating': 4})
+        UserBookRelation.objects.create(user=self.user, book=other_book, status='r', rating=1)
+        # Compare with the page computed again, not the cached one
+        cache.clear()
+        with self.assertNumQueries(len(queries)):
+            response = self.client.get(reverse('book-detail', args=[1]))
+        stats = {review.user.username: review.reviewer_stats
+                 for review in response.context['book_reviews']}
+        self.assertEqual(stats['testuser'], {'review_count': 1, 'average_rating': 3})
+
+    def _create_reviews(self, number):
+        for review_num in range(number):
+            reviewer = User.objects.create_user(username=f'reader{review_num}', password='12345')
+            UserBookRelation.objects.create(user=reviewer, book=self.book, status='r', rating=4,
+                                            review=f'Review {review_num}',
+                                            review_date=f'2022-01-{review_num + 1:02d}')
+
+    def test_reviews_are_paginated(self):
+        """
+        Test if only the first page of reviews is rendered, most recent first,
+        without the empty reviews
+        """
+        self._create_reviews(11)
+        UserBookRelation.objects.create(user=User.objects.create_user(username='silent'),
+                                        book=self.book, status='r', rating=3, review='')
+        self.client.login(username='testuser', password='12345')
+        response = self.client.get(reverse('book-detail', args=[1]))
+        reviews = response.context['book_reviews']
+        self.assertEqual(len(reviews), 10)
+        self.assertEqual(reviews[0].review, 'Review 10')
+        self.assertTrue(response.context['reviews_page'].has_next())
+        self.assertContains(response, reverse('book-reviews', args=[1]) + '?page=2')
+
+    def test_reviews_endpoint(self):
+        """
+        Test if the next pages of reviews are served as a fragment and as JSON
+        """
+        self._create_reviews(11)
+        self.client.login(username='testuser', password='12345')
+        response = self.client.get(reverse('book-reviews', args=[1]), {'page': 2})
+        self.assertTemplateUsed(response, 'book_catalog/book_review_items.html')
+        self.assertNotContains(response, '<h3>Reviews</h3>')
+        self.assertEqual([review.review for review in response.context['reviews_page']],
+                         ['Review 0', 'Great book'])
+        response = self.client.get(reverse('book-reviews', args=[1]),
+                                   {'page': 2, 'format': 'json'})
+        data = response.json()
+        self.assertEqual([row['username'] for row in data['results']], ['reader0', 'testuser'])
+        self.assertEqual(data['results'][1]['average_rating'], 5)
+        self.assertIsNone(data['next'])
+
+    def test_reviews_endpoint_redirects_for_anonymous_user(self):
+        """
+        Test if the reviews endpoint redirects an anonymous user
+        """
+        response = self.client.get(reverse('book-reviews', args=[1]))
+        self.assertEqual(response.status_code, 302)
+
 class BookSagaDetailViewTest(TestCase):
     """
     Test if BookSagaDetailView works correctly
@@ -381,6 +888,9 @@ class BookSagaDetailViewTest(TestCase):
                                                     status='r', rating=5,
                                                     review='Great book', review_date='2021-01-01')
 
+    def setUp(self):
+        cache.clear()
+
     def test_view_url_exists_at_desired_location_for_logged_in_user(self):
         """
         Test if view is accessible only for logged-in user
@@ -509,6 +1019,188 @@ class BookSagaDetailViewTest(TestCase):
         response = self.client.get(reverse('saga-detail', args=[1]))
         self.assertEqual(response.context['user_saga_relation'], 'r')
 
+class ObjectCacheTest(TestCase):
+    """
+    Test the cache of the pages and their fragments by object and catalog
+    version
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', password='12345')
+        cls.other_user = User.objects.create_user(username='otheruser', password='12345')
+        cls.author = Author.objects.create(first_name='Sara', last_name='Trueman')
+        cls.saga = BookSaga.objects.create(name='The Saga', author=cls.author)
+        cls.book = Book.objects.create(title='The Book', author=cls.author, saga=cls.saga,
+                                       saga_volume=1)
+        UserBookRelation.objects.create(user=cls.user, book=cls.book, status='r', rating=4,
+                                        review='Good book', review_date='2021-01-01')
+
+    def setUp(self):
+        cache.clear()
+        object_cache.reset_stats()
+
+    def test_second_request_is_cached(self):
+        """
+        Test if the second request of a page reuses the cached object and
+        context and costs fewer queries
+        """
+        self.client.login(username='testuser', password='12345')
+        with CaptureQueriesContext(connection) as first:
+            self.client.get(reverse('book-detail', args=[self.book.pk]))
+        with CaptureQueriesContext(connection) as second:
+            response = self.client.get(reverse('book-detail', args=[self.book.pk]))
+        self.assertLess(len(second), len(first))
+        self.assertEqual(response.context['average_rating'], 4)
+        self.assertEqual(object_cache.get_stats()['book:context'], {'hits': 1, 'misses': 1})
+        self.assertEqual(object_cache.get_stats()['book:object'], {'hits': 1, 'misses': 1})
+
+    def test_changes_invalidate_the_pages(self):
+        """
+        Test if rating a book refreshes its page, its author's and its saga's
+        """
+        self.client.login(username='testuser', password='12345')
+        for name, obj in (('book-detail', self.book), ('author-detail', self.author),
+                          ('saga-detail', self.saga)):
+            self.client.get(reverse(name, args=[obj.pk]))
+        UserBookRelation.objects.create(user=self.other_user, book=self.book, status='r',
+                                        rating=2)
+        response = self.client.get(reverse('book-detail', args=[self.book.pk]))
+        self.assertEqual(response.context['total_ratings'], 2)
+        response = self.client.get(reverse('author-detail', args=[self.author.pk]))
+        self.assertEqual(response.context['total_ratings'], 2)
+        response = self.client.get(reverse('saga-detail', args=[self.saga.pk]))
+        self.assertEqual(response.context['total_ratings'], 2)
+        self.assertContains(response, '2 ratings')
+        self.book.title = 'The Renamed Book'
+        self.book.save()
+        response = self.client.get(reverse('saga-detail', args=[self.saga.pk]))
+        self.assertContains(response, 'The Renamed Book')
+
+    def test_rating_a_book_invalidates_the_pages(self):
+        """
+        Test if rating a book from its page, which writes the rating without
+        model signals, refreshes its page, its author's and its saga's
+        """
+        self.client.login(username='otheruser', password='12345')
+        for name, obj in (('book-detail', self.book), ('author-detail', self.author),
+                          ('saga-detail', self.saga)):
+            self.client.get(reverse(name, args=[obj.pk]))
+        self.client.get(reverse('rating-book', args=[self.book.pk, 2]))
+        response = self.client.get(reverse('book-detail', args=[self.book.pk]))
+        self.assertEqual(response.context['total_ratings'], 2)
+        self.assertEqual(response.context['average_rating'], 3)
+        self.assertContains(response, '<span class="rating-text">3.0</span>', html=True)
+        response = self.client.get(reverse('author-detail', args=[self.author.pk]))
+        self.assertEqual(response.context['total_ratings'], 2)
+        response = self.client.get(reverse('saga-detail', args=[self.saga.pk]))
+        self.assertContains(response, '2 ratings')
+
+    def test_genre_changes_invalidate_the_book_page(self):
+        """
+        Test if adding, renaming, removing and deleting a genre of a book
+        refreshes its page
+        """
+        self.client.login(username='testuser', password='12345')
+        url = reverse('book-detail', args=[self.book.pk])
+        self.client.get(url)
+        fantasy = Genre.objects.create(name='Fantasy')
+        self.book.genre.add(fantasy)
+        self.assertContains(self.client.get(url), 'Fantasy')
+        fantasy.name = 'Epic Fantasy'
+        fantasy.save()
+        self.assertContains(self.client.get(url), 'Epic Fantasy')
+        fantasy.book_set.remove(self.book)
+        self.assertNotContains(self.client.get(url), 'Epic Fantasy')
+        drama = Genre.objects.create(name='Drama')
+        drama.book_set.add(self.book)
+        self.assertContains(self.client.get(url), 'Drama')
+        drama.book_set.clear()
+        self.assertNotContains(self.client.get(url), 'Drama')
+        self.book.genre.add(drama)
+        self.assertContains(self.client.get(url), 'Drama')
+        drama.delete()
+        self.assertNotContains(self.client.get(url), 'Drama')
+
+    def test_language_changes_invalidate_the_book_page(self):
+        """
+        Test if renaming and deleting the language of a book refreshes its
+        page
+        """
+        language = Language.objects.create(name='English')
+        Book.objects.filter(pk=self.book.pk).update(language=language)
+        object_cache.bump_version(Book, self.book.pk)
+        self.client.login(username='testuser', password='12345')
+        url = reverse('book-detail', args=[self.book.pk])
+        self.assertContains(self.client.get(url), 'English')
+        language.name = 'British English'
+        language.save()
+        self.assertContains(self.client.get(url), 'British English')
+        language.delete()
+        self.assertNotContains(self.client.get(url), 'English')
+
+    def test_user_data_is_not_shared(self):
+        """
+        Test if the relations of each user are not taken from the cache
+        """
+        self.client.login(username='testuser', password='12345')
+        response = self.client.get(reverse('book-detail', args=[self.book.pk]))
+        self.assertEqual(response.context['my_book'].rating, 4)
+        self.client.get(reverse('saga-detail', args=[self.saga.pk]))
+        self.client.login(username='otheruser', password='12345')
+        response = self.client.get(reverse('book-detail', args=[self.book.pk]))
+        self.assertIsNone(response.context['my_book'])
+        response = self.client.get(reverse('saga-detail', args=[self.saga.pk]))
+        self.assertNotIn('user_saga_relation', response.context)
+        self.assertFalse(hasattr(response.context['books'][0], 'status'))
+        self.assertNotContains(response, 'text-green')
+
+    def test_recent_books_fragment(self):
+        """
+        Test if the recent books are cached until the catalog changes
+        """
+        self.client.login(username='testuser', password='12345')
+        self.client.get(reverse('authors'))
+        Book.objects.filter(pk=self.book.pk).update(title='The Unsaved Title')
+        response = self.client.get(reverse('authors'))
+        self.assertEqual(response.context['recent_books'], [self.book])
+        self.assertContains(response, 'The Book')
+        self.assertEqual(object_cache.get_stats()['catalog:recent_books'],
+                         {'hits': 1, 'misses': 1})
+        self.book.title = 'The Renamed Book'
+        self.book.save()
+        response = self.client.get(reverse('authors'))
+        self.assertContains(response, 'The Renamed Book')
+        self.assertNotContains(response, 'The Book')
+
+    def test_cache_stats_are_shared(self):
+        """
+        Test if the hits and misses are counted in the cache, where the
+        counts of the other processes add up
+        """
+        for _ in range(3):
+            object_cache.get_or_set_catalog('test', lambda: 'value')
+        self.assertEqual(object_cache.get_stats()['catalog:test'], {'hits': 2, 'misses': 1})
+        # A hit counted by another process
+        cache.incr(object_cache._stats_key('catalog:test', 'hits'))
+        self.assertEqual(object_cache.get_stats()['catalog:test'], {'hits': 3, 'misses': 1})
+        object_cache.reset_stats()
+        self.assertEqual(object_cache.get_stats(), {})
+        object_cache.get_or_set_catalog('test', lambda: 'value')
+        self.assertEqual(object_cache.get_stats()['catalog:test'], {'hits': 1, 'misses': 0})
+
+    def test_cache_stats(self):
+        """
+        Test if the statistics of the cache are only shown to the staff
+        """
+        self.client.login(username='testuser', password='12345')
+        self.client.get(reverse('book-detail', args=[self.book.pk]))
+        response = self.client.get(reverse('cache-stats'))
+        self.assertEqual(response.status_code, 403)
+        User.objects.filter(pk=self.other_user.pk).update(is_staff=True)
+        self.client.login(username='otheruser', password='12345')
+        response = self.client.get(reverse('cache-stats'))
+        self.assertEqual(response.json()['objects']['book:context'], {'hits': 0, 'misses': 1})
+
 ################# Create Views #################
 
 class AuthorCreateViewTest(TestCase):
@@ -1032,7 +1724,7 @@ class UserBookRelationUpdateViewTest(TestCase):
                 book=self.book,
                 status='r',
             )
-        self.test_uuid=str(self.user_book_relation.id)
+        self.test_uuid=str(self.user_book_relation.uuid)
 
     def test_view_url_exists_at_desired_location(self):
         """
@@ -1058,7 +1750,7 @@ class UserBookRelationUpdateViewTest(TestCase):
                     args=[self.test_uuid]),
                     form_data)
         self.assertEqual(response.status_code, 302)
-        relation = UserBookRelation.objects.get(id=self.test_uuid)
+        relation = UserBookRelation.objects.get(uuid=self.test_uuid)
         self.assertEqual(relation.status, 'r')
 
     def test_view_method_post_with_user_logged(self):
@@ -1086,21 +1778,21 @@ class UserBookRelationUpdateViewTest(TestCase):
         """
         self.client.login(username=self.user, password='12345')
         form_data = {'status': 't'}
-        relation = UserBookRelation.objects.get(id=self.test_uuid)
+        relation = UserBookRelation.objects.get(uuid=self.test_uuid)
         self.assertEqual(relation.status, 'r')
         self.client.post(reverse('change-userbookrelation', args=[self.test_uuid]), form_data)
-        relation = UserBookRelation.objects.get(id=self.test_uuid)
+        relation = UserBookRelation.objects.get(uuid=self.test_uuid)
         self.assertEqual(relation.status, 't')
         form_data = {'status': 'i'}
-        relation = UserBookRelation.objects.get(id=self.test_uuid)
+        relation = UserBookRelation.objects.get(uuid=self.test_uuid)
         self.client.post(reverse('change-userbookrelation', args=[self.test_uuid]), form_data)
-        relation = UserBookRelation.objects.get(id=self.test_uuid)
+        relation = UserBookRelation.objects.get(uuid=self.test_uuid)
         self.assertEqual(relation.status, 'i')
         self.assertEqual(relation.reading_date, timezone.now().date())
         form_data = {'status': 'r'}
-        relation = UserBookRelation.objects.get(id=self.test_uuid)
+        relation = UserBookRelation.objects.get(uuid=self.test_uuid)
         self.client.post(reverse('change-userbookrelation', args=[self.test_uuid]), form_data)
-        relation = UserBookRelation.objects.get(id=self.test_uuid)
+        relation = UserBookRelation.objects.get(uuid=self.test_uuid)
         self.assertEqual(relation.status, 'r')
         self.assertEqual(relation.read_date, timezone.now().date())
 
@@ -1110,10 +1802,10 @@ class UserBookRelationUpdateViewTest(TestCase):
         """
         self.client.login(username=self.user.username, password='12345')
         form_data = {'review': 'Great book'}
-        relation = UserBookRelation.objects.get(id=self.test_uuid)
+        relation = UserBookRelation.objects.get(uuid=self.test_uuid)
         self.assertEqual(relation.review, None)
         self.client.post(reverse('change-userbookrelation', args=[self.test_uuid]), form_data)
-        relation = UserBookRelation.objects.get(id=self.test_uuid)
+        relation = UserBookRelation.objects.get(uuid=self.test_uuid)
         self.assertEqual(relation.review, 'Great book')
         self.assertEqual(relation.review_date, timezone.now().date())
 
@@ -1123,15 +1815,15 @@ class UserBookRelationUpdateViewTest(TestCase):
         """
         self.client.login(username=self.user.username, password='12345')
         form_data = {'rating': 5}
-        relation = UserBookRelation.objects.get(id=self.test_uuid)
+        relation = UserBookRelation.objects.get(uuid=self.test_uuid)
         self.assertEqual(relation.rating, None)
         self.client.post(reverse('change-userbookrelation', args=[self.test_uuid]), form_data)
-        relation = UserBookRelation.objects.get(id=self.test_uuid)
+        relation = UserBookRelation.objects.get(uuid=self.test_uuid)
         self.assertEqual(relation.rating, 5)
         form_data = {'rating': 3}
-        relation = UserBookRelation.objects.get(id=self.test_uuid)
+        relation = UserBookRelation.objects.get(uuid=self.test_uuid)
         self.client.post(reverse('change-userbookrelation', args=[self.test_uuid]), form_data)
-        relation = UserBookRelation.objects.get(id=self.test_uuid)
+        relation = UserBookRelation.objects.get(uuid=self.test_uuid)
         self.assertEqual(relation.rating, 3)
 
 ################# Delete Views #################
@@ -1347,8 +2039,8 @@ class SearchViewTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTrue('book_results' in response.context)
         self.assertEqual(len(response.context['book_results']), 2)
-        self.assertEqual(response.context['book_results'][0], self.book2)
-        self.assertEqual(response.context['book_results'][1], self.book1)
+        self.assertEqual(response.context['book_results'][0], self.book1)
+        self.assertEqual(response.context['book_results'][1], self.book2)
 
     def test_context_contains_correct_search_results_with_no_books(self):
         """
@@ -1426,8 +2118,8 @@ class SearchViewTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTrue('book_results' in response.context)
         self.assertEqual(len(response.context['book_results']), 2)
-        self.assertEqual(response.context['book_results'][0], self.book2)
-        self.assertEqual(response.context['book_results'][1], self.book1)
+        self.assertEqual(response.context['book_results'][0], self.book1)
+        self.assertEqual(response.context['book_results'][1], self.book2)
 
     def test_search_by_author(self):
         """
@@ -1450,6 +2142,105 @@ class SearchViewTest(TestCase):
         self.assertEqual(len(response.context['book_results']), 1)
         self.assertEqual(response.context['book_results'][0], self.book3)
 
+    def test_search_by_prefix(self):
+        """
+        Test if words are matched by prefix and in any order
+        """
+        response = self.client.get(reverse('search'), {'query': 'gre anoth'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['book_results']), [self.book2])
+
+    def test_search_by_summary(self):
+        """
+        Test if search by summary works correctly
+        """
+        self.book2.summary = 'A journey through the mountains'
+        self.book2.save()
+        response = self.client.get(reverse('search'), {'query': 'mountains'})
+        self.assertEqual(list(response.context['book_results']), [self.book2])
+
+    def test_search_index_follows_renames(self):
+        """
+        Test if the index is updated when a book, an author or a saga changes
+        """
+        self.author2.last_name = 'Tolkien'
+        self.author2.save()
+        self.saga.name = 'Legendary Saga'
+        self.saga.save()
+        response = self.client.get(reverse('search'), {'query': 'tolkien'})
+        self.assertEqual(list(response.context['book_results']), [self.book2])
+        response = self.client.get(reverse('search'), {'query': 'legendary'})
+        self.assertEqual(list(response.context['book_results']), [self.book3])
+        self.book2.delete()
+        response = self.client.get(reverse('search'), {'query': 'tolkien'})
+        self.assertEqual(list(response.context['book_results']), [])
+
+    def test_search_annotates_user_status(self):
+        """
+        Test if the status of the user is loaded with the results
+        """
+        with self.assertNumQueries(7):
+            # session, user, count and page of the search index, result page
+            # and two permission queries of the navigation bar
+            response = self.client.get(reverse('search'), {'query': 'Great'})
+        statuses = {book.pk: book.status for book in response.context['book_results']}
+        self.assertEqual(statuses, {self.book1.pk: 'Read', self.book2.pk: ''})
+
+    def test_search_for_anonymous_user(self):
+        """
+        Test if anonymous users get the results without status
+        """
+        self.client.logout()
+        response = self.client.get(reverse('search'), {'query': 'Great'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([book.status for book in response.context['book_results']], ['', ''])
+        response = self.client.get(reverse('search'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['book_results']), 3)
+
+    def test_search_is_paginated(self):
+        """
+        Test if the results are paginated in the server
+        """
+        for book_num in range(30):
+            Book.objects.create(title=f'Great {book_num}', author=self.author2)
+        response = self.client.get(reverse('search'), {'query': 'Great'})
+        self.assertTrue(response.context['is_paginated'])
+        self.assertEqual(len(response.context['book_results']), 25)
+        self.assertEqual(response.context['page_obj'].paginator.count, 32)
+        response = self.client.get(reverse('search'), {'query': 'Great', 'page': 2})
+        self.assertEqual(len(response.context['book_results']), 7)
+        response = self.client.get(reverse('search'), {'page': 2})
+        self.assertEqual(len(response.context['book_results']), 8)
+
+    def test_search_fetches_only_the_page(self):
+        """
+        Test if the matches are counted in the data base and only the ids of
+        the requested page are fetched, in rank order
+        """
+        for book_num in range(30):
+            Book.objects.create(title=f'Great {book_num}', author=self.author2)
+        ranked = search.search_book_ids('Great')
+        self.assertEqual(search.search_book_ids('Great', 25, 25), ranked[25:])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('search'), {'query': 'Great', 'page': 2})
+        self.assertEqual([book.pk for book in response.context['book_results']], ranked[25:])
+        fts_queries = [query['sql'] for query in queries if search.FTS_TABLE in query['sql']]
+        self.assertEqual(len(fts_queries), 2)
+        self.assertIn('COUNT(*)', fts_queries[0])
+        self.assertIn('LIMIT 7 OFFSET 25', fts_queries[1])
+
+    def test_search_with_special_characters(self):
+        """
+        Test if characters of the FTS5 query syntax are ignored
+        """
+        response = self.client.get(reverse('search'), {'query': '"Great* ('})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['book_results']), 2)
+        response = self.client.get(reverse('search'), {'query': '***'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['book_results']), 0)
+
 ################# General Views #################
 
 class ChangeBookStatusViewTest(TestCase):
@@ -1680,6 +2471,7 @@ class IndexViewTest(TestCase):
     Test if index view works correctly
     """
     def setUp(self):
+        cache.clear()
         number_of_books = 5
         number_of_authors = 3
 
@@ -1795,6 +2587,38 @@ class IndexViewTest(TestCase):
         self.assertEqual(response.context['my_books_read'], 1)
         self.assertEqual(response.context['my_books_this_year'], 1)
 
+    def test_counters_follow_the_shelf(self):
+        """
+        Test if the cached counters change with the shelf of the user, by
+        model saves and by the services
+        """
+        self.client.login(username=self.user, password='12345')
+        self.client.get(reverse('index'))
+        UserBookRelation.objects.create(user=self.user, book=Book.objects.get(id=2),
+                                        status='r', read_date='2001-01-01')
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['my_books_read'], 2)
+        self.assertEqual(response.context['my_books_this_year'], 1)
+        set_book_status(self.user, self.relation.book, 'i')
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['my_books_read'], 1)
+        self.assertEqual(response.context['my_books_this_year'], 0)
+        self.assertEqual(response.context['my_books_reading'], [self.relation.book])
+        Book.objects.create(title='Book 5', author=Author.objects.get(id=1))
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['total_books'], 6)
+
+    def test_cached_counters_do_not_count_rows(self):
+        """
+        Test if the home page does not count rows once its counters are cached
+        """
+        self.client.login(username=self.user, password='12345')
+        self.client.get(reverse('index'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['my_books_read'], 1)
+        self.assertFalse([query for query in queries if 'COUNT(' in query['sql']])
+
 class RatingBookViewTest(TestCase):
     """
     Test if RatingBookView works correctly
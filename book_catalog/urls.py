@@ -3,16 +3,23 @@ from . import views
 
 urlpatterns = [
     path('mybooks/', views.UserBookRelationListView.as_view(), name='my-books'),
+    path('mybooks/data/', views.UserBookRelationDataTableView.as_view(), name='my-books-data'),
+    path('mybooks/export/', views.export_shelf, name='export-shelf'),
+    path('mybooks/import/', views.import_shelf, name='import-shelf'),
+    path('mybooks/import/<int:pk>/', views.shelf_import_detail, name='shelf-import-detail'),
     # authors view
     path('authors/', views.AuthorListView.as_view(), name='authors'),
+    path('authors/data/', views.AuthorDataTableView.as_view(), name='authors-data'),
     path('author/<int:pk>', views.AuthorDetailView.as_view(), name='author-detail'),
     path('author/create/', views.AuthorCreateView.as_view(), name='author-create'),
     path('author/<int:pk>/update/', views.AuthorUpdateView.as_view(), name='author-update'),
     path('author/<int:pk>/delete/', views.AuthorDeleteView.as_view(), name='author-delete'),
     # books view
     path('books/', views.BookListView.as_view(), name='books'),
+    path('books/data/', views.BookDataTableView.as_view(), name='books-data'),
     path('book/create/', views.BookCreateView.as_view(), name='book-create'),
     path('book/<int:pk>', views.BookDetailView.as_view(), name='book-detail'),
+    path('book/<int:pk>/reviews/', views.book_reviews, name='book-reviews'),
     path('book/<int:pk>/change-status/<str:status>/', views.change_book_status,
          name='change-book-status'),
     path('book/<int:pk>/update/', views.BookUpdateView.as_view(), name='book-update'),
@@ -26,8 +33,9 @@ urlpatterns = [
     path('saga/<int:pk>/change-status/<str:status>/', views.change_booksaga_status,
          name='change-booksaga-status'),
     #others
-    path('userbookrelation/<uuid:pk>/update/', views.UserBookRelationUpdateView.as_view(),
+    path('userbookrelation/<uuid:uuid>/update/', views.UserBookRelationUpdateView.as_view(),
          name='change-userbookrelation'),
     path('search/', views.search, name='search'),
+    path('cache/stats/', views.cache_stats, name='cache-stats'),
     path('', views.index, name='index'),
 ]
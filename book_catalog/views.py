@@ -1,29 +1,55 @@
+import re
 from typing import Any
 from operator import and_
 from functools import reduce
-from django.db.models import Q
+from django.core.paginator import Paginator
+from django.db.models import F, OuterRef, Q, Subquery
+from django.utils.html import format_html
 from django.utils import timezone
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
-from django.shortcuts import get_object_or_404
-from django.http import HttpResponseRedirect
+from django.shortcuts import get_object_or_404, redirect
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence
 from django.urls import reverse, reverse_lazy
 from django import forms
-from .models import Author, Book, BookSaga, UserBookRelation, Language, Genre
+from .models import (Author, Book, BookSaga, ShelfImport, User, UserBookRelation, Language,
+                     Genre, get_reviewer_stats)
+from . import counts, export, goodreads, images, object_cache
+from .forms import ShelfImportForm
+from .datatables import DataTableView
+from .pagination import KeysetPaginationMixin
+from .search import SearchResults, book_search_condition
+from .services import rate_book, set_book_status, set_saga_status
 
+SEARCH_PAGINATE_BY = 25
+REVIEWS_PAGINATE_BY = 10
+RECENT_BOOKS = 5
+ACCEPTS_GZIP_RE = re.compile(r'\bgzip\b')
+
+
+def get_recent_books():
+    """
+    Returns the list of the last published books, cached until the catalog
+    changes.
+    """
+    return object_cache.get_or_set_catalog('recent_books', lambda: list(
+        Book.objects.select_related('author', 'saga').order_by('-publish_date')[:RECENT_BOOKS]))
 
 def index(request):
     """
     View function for home page of site.
     """
     # recent_books = Book.objects.all().order_by('-date_finished')[:5]
-    recent_books = Book.objects.all().order_by('-publish_date')[:5]
-    total_books = Book.objects.all().count()
+    recent_books = get_recent_books()
+    total_books = counts.get_count('books', Book.objects.all())
 
     # books_this_year = Book.objects.filter(date_finished__year=datetime.now().year).count()
-    total_authors=Author.objects.count()
+    total_authors = counts.get_count('authors', Author.objects.all())
     context = {
         'recent_books': recent_books,
         'total_books': total_books,
@@ -31,172 +57,296 @@ def index(request):
         # 'average_books_per_month': average_books_per_month,
     }
     if request.user.is_authenticated:
-        books_reading_id = UserBookRelation.objects.filter(
-            user=request.user, status='i').order_by('-id')[:3]
-        books_reading = [Book.objects.get(pk=book.book_id) for book in books_reading_id]
-        context['my_books_reading'] = books_reading
+        user = request.user
+        books_reading = UserBookRelation.objects.filter(
+            user=user, status='i').select_related('book').order_by('-id')[:3]
+        context['my_books_reading'] = [relation.book for relation in books_reading]
 
-        books_read_id = UserBookRelation.objects.filter(
-            user=request.user, status='r').order_by('-id')
-        context['my_books_read'] = len(books_read_id)
+        read = UserBookRelation.objects.filter(user=user, status='r')
+        context['my_books_read'] = counts.get_count(counts.read_count_name(user.pk), read)
 
-        reading_id = UserBookRelation.objects.filter(
-            user=request.user, status='r', read_date__year=timezone.now().year)
-        context['my_books_this_year'] = len(reading_id)
+        year = timezone.now().year
+        context['my_books_this_year'] = counts.get_count(
+            counts.read_count_name(user.pk, year), read.filter(read_date__year=year))
 
     return render(request, 'index_book.html', context = context,)
 
 ################# List Views #################
 
-class BookListView(ListView):
+class RecentBooksMixin:
     """
-    Generic class-based view listing books.
+    Add to the context the recent books and the version of the catalog, which
+    the cached fragment of recent_books.html varies on.
     """
-    model = Book
-    template_name = 'book_catalog/book_list.html'
-
     def get_context_data(self, **kwargs):
-        """
-        Recent book list
-        """
         context = super().get_context_data(**kwargs)
-        context["recent_books"] = Book.objects.all().order_by('-publish_date')[:5]
+        context['recent_books'] = get_recent_books()
+        context['catalog_version'] = object_cache.get_catalog_version()
         return context
 
-class AuthorListView(ListView):
+class BookListView(RecentBooksMixin, KeysetPaginationMixin, ListView):
+    """
+    Generic class-based view listing books.
+    """
+    model = Book
+    queryset = Book.objects.select_related('author', 'saga')
+    keyset_ordering = ('title', 'author_id')
+    template_name = 'book_catalog/book_list.html'
+
+    def serialize_object(self, obj):
+        return {
+            'id': obj.pk,
+            'title': obj.title,
+            'url': obj.get_absolute_url(),
+            'saga': obj.saga.name if obj.saga else None,
+            'saga_url': obj.saga.get_absolute_url() if obj.saga else None,
+            'saga_volume': obj.saga_volume,
+            'author': str(obj.author),
+            'author_url': obj.author.get_absolute_url(),
+            'cover_image': obj.cover_image.url if obj.cover_image else None,
+            'average_rating': obj.average_rating(),
+        }
+
+class AuthorListView(RecentBooksMixin, KeysetPaginationMixin, ListView):
     """
     Generic class-based view listing authors.
     """
     model = Author
+    queryset = Author.objects.with_stats()
+    keyset_ordering = ('last_name', 'first_name')
     template_name = 'book_catalog/author_list.html'
 
-    def get_context_data(self, **kwargs: Any):
-        """
-        Obtain an author list of authors that has books published recently
-        """
-        context = super().get_context_data(**kwargs)
-        context["recent_books"] = Book.objects.all().order_by('-publish_date')[:5]
-        return context
+    def serialize_object(self, obj):
+        return {
+            'id': obj.pk,
+            'last_name': obj.last_name,
+            'first_name': obj.first_name,
+            'url': obj.get_absolute_url(),
+            'photo': obj.photo.url if obj.photo else None,
+            'number_of_books': obj.number_of_books(),
+            'average_rating': obj.average_rating(),
+        }
 
-class UserBookRelationListView(LoginRequiredMixin, ListView):
+class UserBookRelationListView(LoginRequiredMixin, RecentBooksMixin, KeysetPaginationMixin,
+                               ListView):
     """
     Generic class-based view listing books of the current user.
     """
     login_url = '/accounts/login/'
     redirect_field_name = 'redirect_to'
     model = UserBookRelation
+    keyset_ordering = ('book__title',)
     template_name = 'book_catalog/userbookrelation_list.html'
-    # paginate_by = 10
 
     def get_queryset(self):
-        return super().get_queryset().filter(user=self.request.user)
+        return super().get_queryset().filter(user=self.request.user).select_related(
+            'book__author', 'book__saga')
     # template_name ='templates/book_catalog/userbookrelation_list.html'
 
-    def get_context_data(self, **kwargs: Any):
-        context = super().get_context_data(**kwargs)
-        context["recent_books"] = Book.objects.all().order_by('-publish_date')[:5]
-        return context
+    def serialize_object(self, obj):
+        return {
+            'id': str(obj.uuid),
+            'title': obj.book.title,
+            'url': obj.book.get_absolute_url(),
+            'saga': obj.book.saga.name if obj.book.saga else None,
+            'saga_url': obj.book.saga.get_absolute_url() if obj.book.saga else None,
+            'saga_volume': obj.book.saga_volume,
+            'author': str(obj.book.author),
+            'author_url': obj.book.author.get_absolute_url(),
+            'cover_image': obj.book.cover_image.url if obj.book.cover_image else None,
+            'rating': obj.rating,
+            'status': obj.display_status(),
+            'reading_date': obj.reading_date,
+            'read_date': obj.read_date,
+            'edit_url': reverse('change-userbookrelation', args=[str(obj.uuid)]),
+        }
 
 ################# Detail Views #################
 
-class BookDetailView(LoginRequiredMixin, DetailView):
+class CachedDetailMixin:
+    """
+    Cache the object of a detail view and the part of its context shared by
+    all the users, for the current version of the object (see
+    object_cache.py). The shared part is computed by get_shared_context_data()
+    and the part computed at every request (that of the current user, or
+    values with their own cache) by get_uncached_context_data(). The version
+    is given to the template as object_version, to cache its fragments.
+    """
+    def get_object(self, queryset=None):
+        if queryset is not None:
+            return super().get_object(queryset)
+        return object_cache.get_or_set(self.model, self.kwargs[self.pk_url_kwarg], 'object',
+                                       super().get_object)
+
+    def get_shared_context_data(self):
+        return {}
+
+    def get_uncached_context_data(self, context):
+        return {}
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['object_version'] = object_cache.get_version(self.model, self.object.pk)
+        context.update(object_cache.get_or_set(self.model, self.object.pk, 'context',
+                                               self.get_shared_context_data))
+        context.update(self.get_uncached_context_data(context))
+        return context
+
+class BookDetailView(LoginRequiredMixin, CachedDetailMixin, DetailView):
     """
     Generic class-based view detail of a book.
     """
     login_url = '/accounts/login/'
     redirect_field_name = 'redirect_to'
     model = Book
+    queryset = Book.objects.select_related('author', 'saga', 'language').prefetch_related('genre')
     template_name = 'book_catalog/book_detail.html'
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
+    def get_shared_context_data(self):
         book = self.object
-        user_book_relation = UserBookRelation.objects.filter(
-            book=book, user=self.request.user).first()
-        context['my_book'] = user_book_relation
+        context = {}
         context['average_rating'] = book.average_rating()
         context['average_rating_over_100'] = int(
             context['average_rating']*20) if context['average_rating'] else 0
         context['total_ratings'] = book.number_of_ratings()
         context['rating_range'] = range(5, 0, -1)
         context['total_reviews'] = book.number_of_reviews()
-        reviews = book.get_reviews()
-        if reviews:
-            for review in reviews:
-                review.user.review_count = UserBookRelation.objects.filter(
-                    user=self.request.user).exclude(review__isnull=True).values_list('review').count()
-                review.user.average_rating = UserBookRelation.objects.filter(
-                    user=self.request.user).exclude(rating__isnull=True).values_list('rating').count()
-                review.rating_over_100 = int(review.rating*20) if review.rating else 0
-        context['book_reviews'] = reviews
-
-        # context['user_id'] = self.request.user.id
+        reviews_page = _cacheable_page(get_reviews_page(book, 1))
+        context['reviews_page'] = reviews_page
+        context['book_reviews'] = reviews_page.object_list
         return context
 
-class AuthorDetailView(LoginRequiredMixin, DetailView):
+    def get_uncached_context_data(self, context):
+        # The reviewer statistics change with the reviews of other books
+        add_reviewer_stats(context['book_reviews'])
+        return {'my_book': UserBookRelation.objects.filter(
+            book=self.object, user=self.request.user).first()}
+
+def _cacheable_page(page):
+    """
+    Drop the queryset of the paginator of a page, which pickling would
+    evaluate whole. The paginator keeps its count, enough to move between
+    pages.
+    """
+    page.has_next()
+    page.paginator.object_list = ()
+    return page
+
+def get_reviews_page(book, number):
+    """
+    Returns the given page of the reviews of a book, with the statistics of
+    the reviewers.
+    """
+    paginator = Paginator(book.get_reviews(), REVIEWS_PAGINATE_BY)
+    page = paginator.get_page(number)
+    page.object_list = list(page.object_list)
+    for review in page.object_list:
+        review.rating_over_100 = int(review.rating*20) if review.rating else 0
+    add_reviewer_stats(page.object_list)
+    return page
+
+def add_reviewer_stats(reviews):
+    """
+    Set the statistics of its reviewer on every review.
+    """
+    reviewer_stats = get_reviewer_stats(review.user_id for review in reviews)
+    for review in reviews:
+        review.reviewer_stats = reviewer_stats[review.user_id]
+
+@login_required
+def book_reviews(request, pk):
+    """
+    View function returning a page of the reviews of a book, as an HTML
+    fragment appended to the detail page, or as JSON with ?format=json.
+    """
+    book = get_object_or_404(Book, pk=pk)
+    page = get_reviews_page(book, request.GET.get('page'))
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'results': [{
+                'username': review.user.username,
+                'rating': review.rating,
+                'review': review.review,
+                'review_date': review.review_date,
+                'review_count': review.reviewer_stats['review_count'],
+                'average_rating': review.reviewer_stats['average_rating'],
+            } for review in page],
+            'next': page.next_page_number() if page.has_next() else None,
+        })
+    return render(request, 'book_catalog/book_review_items.html',
+                  {'book': book, 'reviews_page': page})
+
+class AuthorDetailView(LoginRequiredMixin, CachedDetailMixin, DetailView):
     """
     Generic class-based view detail of an author.
     """
     login_url = '/accounts/login/'
     redirect_field_name = 'redirect_to'
     model = Author
+    queryset = Author.objects.with_stats()
     template_name = 'book_catalog/author_detail.html'
 
-    def get_context_data(self, **kwargs: Any):
-        context = super().get_context_data(**kwargs)
-        author = self.get_object()
-        books = author.book_set.all().order_by('saga', 'saga_volume')
-        context['books'] = books
+    def get_shared_context_data(self):
+        author = self.object
+        context = {}
+        context['books'] = list(author.book_set.all().order_by('saga', 'saga_volume'))
         context['average_rating'] = author.average_rating()
         context['average_rating_over_100'] = int(
             context['average_rating']*20) if context['average_rating'] else 0
-        context['book_list'] = Book.objects.filter(author=author)
+        context['book_list'] = list(
+            Book.objects.filter(author=author).select_related('author', 'saga'))
         context['total_ratings'] = author.number_of_ratings()
         context['total_reviews'] = author.number_of_reviews()
         return context
 
-class BookSagaDetailView(LoginRequiredMixin, DetailView):
+class BookSagaDetailView(LoginRequiredMixin, CachedDetailMixin, DetailView):
     """
     Generic class-based view detail of a book saga.
     """
     login_url = '/accounts/login/'
     redirect_field_name = 'redirect_to'
     model = BookSaga
+    queryset = BookSaga.objects.select_related('author').with_stats()
     template_name = 'book_catalog/booksaga_detail.html'
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        saga = self.get_object()
-        books = saga.book_set.all().order_by('saga_volume')
-        relations = [0]*len(books)
-        for i, book in enumerate(books):
-            relation = UserBookRelation.objects.filter(book=book, user=self.request.user).first()
-            if relation:
-                if relation.status == 'r':
-                    relations[i] = 3
-                    book.status = 'r'
-                if relation.status == 'i':
-                    relations[i] = 2
-                    book.status = 'i'
-                if relation.status == 't':
-                    relations[i] = 1
-                    book.status = 't'
-            # print(relations)
-        if sum(relations) == 3*len(saga.book_set.all()):
-            context['user_saga_relation'] = 'r'
-        elif sum(relations) >= len(saga.book_set.all())+1+2:
-            context['user_saga_relation'] = 'i'
-        elif sum(relations) >= len(saga.book_set.all()):
-            context['user_saga_relation'] = 't'
-        context['books'] = books
+    def get_shared_context_data(self):
+        saga = self.object
+        context = {}
+        context['books'] = list(saga.book_set.all().order_by('saga_volume'))
         context['average_rating'] = saga.average_rating()
         context['average_rating_over_100'] = int(
             context['average_rating']*20) if context['average_rating'] else 0
-        context['book_list'] = Book.objects.filter(saga=saga)
+        context['book_list'] = list(Book.objects.filter(saga=saga))
         context['total_ratings'] = saga.number_of_ratings()
         context['total_reviews'] = saga.number_of_reviews()
         return context
 
+    def get_uncached_context_data(self, context):
+        saga = self.object
+        books = context['books']
+        context = {}
+        user_status = dict(UserBookRelation.objects.filter(
+            book__saga=saga, user=self.request.user).values_list('book_id', 'status'))
+        relations = [0]*len(books)
+        for i, book in enumerate(books):
+            status = user_status.get(book.id)
+            if status == 'r':
+                relations[i] = 3
+                book.status = 'r'
+            if status == 'i':
+                relations[i] = 2
+                book.status = 'i'
+            if status == 't':
+                relations[i] = 1
+                book.status = 't'
+        if sum(relations) == 3*len(books):
+            context['user_saga_relation'] = 'r'
+        elif sum(relations) >= len(books)+1+2:
+            context['user_saga_relation'] = 'i'
+        elif sum(relations) >= len(books):
+            context['user_saga_relation'] = 't'
+        return context
+
 ################# Create Views #################
 
 class AuthorCreateView(PermissionRequiredMixin,CreateView):
@@ -358,6 +508,8 @@ class UserBookRelationUpdateView(LoginRequiredMixin, UpdateView):
     Generic class-based view for updating a book saga.
     """
     model = UserBookRelation
+    slug_field = 'uuid'
+    slug_url_kwarg = 'uuid'
     fields = ['status', 'reading_date', 'read_date',  'rating', 'review']
     template_name = 'book_catalog/userbookrelation_form.html'
 
@@ -411,6 +563,232 @@ class BookSagaDeleteView(PermissionRequiredMixin,DeleteView):
     success_url = reverse_lazy('books')
     permission_required = 'book_catalog.delete_booksaga'
 
+################# Data Table Views #################
+
+def _image_cell(image, alt):
+    """
+    HTML of a thumbnail cell of a table.
+    """
+    if not image:
+        return ''
+    return format_html('<div class="text-center">{}</div>', images.picture_html(
+        image, alt, '50px', 'img-fluid border rounded shadow', 'width: 50px; height: auto;'))
+
+def _link_cell(url, text):
+    """
+    HTML of a link cell of a table.
+    """
+    return format_html('<a class="no-underline" href="{}">{}</a>', url, text)
+
+def _saga_cell(book):
+    """
+    HTML of the saga cell of a book table.
+    """
+    if book.saga is None:
+        return ''
+    return format_html('{} #{}', _link_cell(book.saga.get_absolute_url(), book.saga.name),
+                       book.saga_volume)
+
+def _rating_cell(rating):
+    """
+    Text of a rating cell of a table.
+    """
+    return '' if rating is None else f'{rating:.1f}'
+
+class BookDataTableView(DataTableView):
+    """
+    Server-side processing of the book table.
+    """
+    columns = (
+        None,
+        ('title',),
+        ('saga__name', 'saga_volume'),
+        ('author__last_name', 'author__first_name'),
+        (F('rating_average'),),
+    )
+
+    def get_queryset(self):
+        return Book.objects.select_related('author', 'saga')
+
+    def get_records_total(self, queryset):
+        return counts.get_count('books', Book.objects.all())
+
+    def filter_queryset(self, queryset, search):
+        return queryset.filter(book_search_condition(search))
+
+    def render_row(self, obj):
+        return [
+            _image_cell(obj.cover_image, obj.title),
+            _link_cell(obj.get_absolute_url(), obj.title),
+            _saga_cell(obj),
+            _link_cell(obj.author.get_absolute_url(), obj.author),
+            _rating_cell(obj.rating_average),
+        ]
+
+class AuthorDataTableView(DataTableView):
+    """
+    Server-side processing of the author table.
+    """
+    columns = (
+        None,
+        ('last_name', 'first_name'),
+        ('first_name', 'last_name'),
+        ('books_total',),
+        (F('rating_average'),),
+    )
+
+    def get_queryset(self):
+        return Author.objects.all()
+
+    def get_records_total(self, queryset):
+        return counts.get_count('authors', queryset)
+
+    def annotate_queryset(self, queryset):
+        return queryset.with_stats()
+
+    def filter_queryset(self, queryset, search):
+        conditions = [Q(first_name__icontains=part) | Q(last_name__icontains=part)
+                      for part in search.split()]
+        return queryset.filter(reduce(and_, conditions))
+
+    def render_row(self, obj):
+        return [
+            _image_cell(obj.photo, obj),
+            _link_cell(obj.get_absolute_url(), obj.last_name),
+            _link_cell(obj.get_absolute_url(), obj.first_name),
+            obj.number_of_books(),
+            _rating_cell(obj.average_rating()),
+        ]
+
+class UserBookRelationDataTableView(LoginRequiredMixin, DataTableView):
+    """
+    Server-side processing of the book table of the current user.
+    """
+    login_url = '/accounts/login/'
+    redirect_field_name = 'redirect_to'
+    columns = (
+        None,
+        ('book__title',),
+        ('book__saga__name', 'book__saga_volume'),
+        ('book__author__last_name', 'book__author__first_name'),
+        (F('rating'),),
+        (F('status'),),
+        (F('reading_date'),),
+        (F('read_date'),),
+        None,
+    )
+
+    def get_queryset(self):
+        return UserBookRelation.objects.filter(user=self.request.user).select_related(
+            'book__author', 'book__saga')
+
+    def get_records_total(self, queryset):
+        return counts.get_count(counts.shelf_count_name(self.request.user.id), queryset)
+
+    def filter_queryset(self, queryset, search):
+        return queryset.filter(book_search_condition(search, prefix='book__'))
+
+    def render_row(self, obj):
+        return [
+            _image_cell(obj.book.cover_image, obj.book.title),
+            _link_cell(obj.book.get_absolute_url(), obj.book.title),
+            _saga_cell(obj.book),
+            _link_cell(obj.book.author.get_absolute_url(), obj.book.author),
+            obj.rating or '',
+            obj.display_status() or '',
+            obj.reading_date or '',
+            obj.read_date or '',
+            format_html('<a class="btn btn-primary" href="{}"><i class="fas fa-edit fa-lg"></i></a>',
+                        reverse('change-userbookrelation', args=[str(obj.uuid)])),
+        ]
+
+################# Export Views #################
+
+@login_required
+def export_shelf(request):
+    """
+    View function streaming the books of the current user, or of the user
+    given by ?user=<id> for staff, as CSV or as JSON Lines with
+    ?format=jsonl. The response is compressed with gzip on the fly if the
+    client accepts it.
+    """
+    file_format = request.GET.get('format', 'csv')
+    if file_format not in export.EXPORT_FORMATS:
+        raise Http404('Unknown export format')
+    user = request.user
+    if 'user' in request.GET:
+        if not request.user.is_staff:
+            raise PermissionDenied
+        if not request.GET['user'].isdigit():
+            raise Http404('Unknown user')
+        user = get_object_or_404(User, pk=request.GET['user'])
+    lines = (line.encode() for line in export.export_lines(export.get_shelf(user), file_format))
+    gzip = ACCEPTS_GZIP_RE.search(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    response = StreamingHttpResponse(compress_sequence(lines) if gzip else lines,
+                                     content_type=export.EXPORT_FORMATS[file_format])
+    if gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    response.headers['Content-Disposition'] = (
+        f'attachment; filename="books-{user.username}.{file_format}"')
+    return response
+
+################# Import Views #################
+
+@login_required
+def import_shelf(request):
+    """
+    View function uploading a Goodreads export into the shelf of the current
+    user. Small files are imported during the request, larger ones in the
+    background.
+    """
+    if request.method == 'POST':
+        form = ShelfImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            shelf_import = ShelfImport.objects.create(user=request.user, file=upload)
+            if upload.size <= goodreads.INLINE_SIZE:
+                goodreads.run_shelf_import(shelf_import.pk)
+            else:
+                goodreads.start_shelf_import(shelf_import)
+            return redirect(shelf_import)
+    else:
+        form = ShelfImportForm()
+    imports = ShelfImport.objects.filter(user=request.user).order_by('-created')[:10]
+    return render(request, 'book_catalog/shelf_import_form.html',
+                  {'form': form, 'imports': imports})
+
+@login_required
+def shelf_import_detail(request, pk):
+    """
+    View function showing the progress and the report of an import, or
+    returning them as JSON with ?format=json.
+    """
+    shelf_import = get_object_or_404(ShelfImport, pk=pk, user=request.user)
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'status': shelf_import.get_status_display(),
+            'finished': shelf_import.is_finished(),
+            'rows': shelf_import.rows,
+            'imported': shelf_import.imported,
+            'unmatched': shelf_import.unmatched,
+            'error': shelf_import.error,
+        })
+    return render(request, 'book_catalog/shelf_import_detail.html',
+                  {'shelf_import': shelf_import})
+
+################# Cache Views #################
+
+@login_required
+def cache_stats(request):
+    """
+    View function returning as JSON the hits and misses of the object cache
+    in all the processes. Staff only.
+    """
+    if not request.user.is_staff:
+        raise PermissionDenied
+    return JsonResponse({'objects': object_cache.get_stats()})
+
 ################# Form Views #################
 
 
@@ -420,27 +798,7 @@ def change_book_status(request, pk: int, status: str):
     View function for changing book status.
     """
     book = get_object_or_404(Book, pk=pk)
-    relation = UserBookRelation.objects.filter(user = request.user, book = book).first()
-    if relation:
-        if status == 'd':
-            relation.status = None
-            relation.read_date = None
-            relation.reading_date = None
-            relation.save()
-        else:
-            relation.status = status
-            if relation.status == 'r' and relation.read_date is None:
-                relation.read_date = timezone.now().date()
-            elif relation.status == 'i' and relation.reading_date is None:
-                relation.reading_date = timezone.now().date()
-            relation.save()
-    elif not relation and status != 'd':
-        relation = UserBookRelation.objects.create(user = request.user, book = book, status = status)
-        if relation.status == 'r' and relation.read_date is None:
-            relation.read_date = timezone.now().date()
-        elif relation.status == 'i' and relation.reading_date is None:
-            relation.reading_date = timezone.now().date()
-        relation.save()
+    set_book_status(request.user, book, status)
     return HttpResponseRedirect(reverse('book-detail', args=[str(pk)]))
 
 # @login_required
@@ -458,17 +816,7 @@ def change_booksaga_status(request, pk, status: str):
     View function for changing book status.
     """
     booksaga = get_object_or_404(BookSaga, pk=pk)
-    for book in booksaga.book_set.all():
-        relation = UserBookRelation.objects.filter(user = request.user, book = book).first()
-        if relation:
-            if status == 'd':
-                relation.status = None
-                relation.save()
-            else:
-                relation.status = status
-                relation.save()
-        elif not relation and status != 'd':
-            UserBookRelation.objects.create(user = request.user, book = book, status = status)
+    set_saga_status(request.user, booksaga, status)
     return HttpResponseRedirect(reverse('saga-detail', args=[str(pk)]))
 
 
@@ -477,27 +825,27 @@ def search(request):
     View function for searching books.
     """
     query = request.GET.get('query')
+    books = Book.objects.select_related('author', 'saga')
+    if request.user.is_authenticated:
+        books = books.annotate(user_status=Subquery(UserBookRelation.objects.filter(
+            user=request.user, book=OuterRef('pk')).values('status')[:1]))
     if query:
-        query_parts = query.split()
-        author_conditions = [Q(first_name__icontains=part) | Q(last_name__icontains=part) for part in query_parts]
-        combined_author_conditions = reduce(and_, author_conditions)
-        author_results = Author.objects.filter(combined_author_conditions)
-
-        book_results = Book.objects.filter(title__icontains=query)
-        author_books = Book.objects.filter(author__in=author_results)
-
-        saga_books = Book.objects.filter(saga__name__icontains=query)
-        combined_results = book_results | author_books | saga_books
-        combined_results = combined_results.distinct()
+        page_obj = Paginator(SearchResults(query), SEARCH_PAGINATE_BY).get_page(
+            request.GET.get('page'))
+        books = books.in_bulk(page_obj.object_list)
+        page_obj.object_list = [books[book_id] for book_id in page_obj.object_list
+                                if book_id in books]
     else:
-        combined_results = Book.objects.all()
-
-    for book in combined_results:
-        status = UserBookRelation.objects.filter(user=request.user, book=book).first()
-        book.status = status.display_status if status else ''
+        # Order of the book list, which follows the index on title and author
+        page_obj = Paginator(books.order_by('title', 'author_id', 'pk'),
+                             SEARCH_PAGINATE_BY).get_page(request.GET.get('page'))
+    for book in page_obj:
+        book.status = UserBookRelation.STATUS_DISPLAY.get(getattr(book, 'user_status', None), '')
     context = {
         'query': query,
-        'book_results': combined_results,
+        'book_results': page_obj,
+        'page_obj': page_obj,
+        'is_paginated': page_obj.has_other_pages(),
     }
     return render(request, 'search_results.html', context)
 
@@ -507,13 +855,5 @@ def rating_book(request, pk, rating: int):
     """
     if rating >= 0 and rating <= 5:
         book = get_object_or_404(Book, pk=pk)
-        relation = UserBookRelation.objects.filter(user = request.user, book = book).first()
-        if relation:
-            if rating == relation.rating:
-                relation.rating = None
-            else:
-                relation.rating = rating
-            relation.save()
-        else:
-            UserBookRelation.objects.create(user = request.user, book = book, rating = rating)
+        rate_book(request.user, book, rating)
     return HttpResponseRedirect(reverse('book-detail', args=[str(pk)]))
@@ -86,6 +86,28 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# The cached pages and counts are invalidated by deleting keys, so the web
+# server, the run_jobs workers and the management commands must share the
+# cache: the files under BASE_DIR/cache by default, Memcached or Redis when
+# the processes run on several machines. Never a local-memory cache.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+        'TIMEOUT': 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
+# The tests use a cache of their own, see my_library/test_runner.py
+TEST_RUNNER = 'my_library.test_runner.TestRunner'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -134,3 +156,5 @@ EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
+# Uploads that are not served, e.g. the Goodreads exports
+PRIVATE_MEDIA_ROOT = os.path.join(BASE_DIR, 'private')
@@ -24,7 +24,8 @@ from .views import (UserProfileDetailView,
                     UserProfileDeleteView,
                     UserProfileUpdateView,
                     UserRegisterView,
-                    CustomLoginView)
+                    CustomLoginView,
+                    serve_media)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -43,4 +44,4 @@ urlpatterns += [
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
 
 # if settings.DEBUG:
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+urlpatterns += static(settings.MEDIA_URL, view=serve_media, document_root=settings.MEDIA_ROOT)
@@ -12,6 +12,8 @@ from django.utils.decorators import method_decorator
 from django import forms
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth import authenticate
+from django.views.static import serve
+from book_catalog.storage import media_cache_control
 from .forms import UserRegisterForm
 
 def not_logged_in(user):
@@ -20,6 +22,17 @@ def not_logged_in(user):
     """
     return not user.is_authenticated
 
+def serve_media(request, path, document_root=None):
+    """
+    Serve an uploaded file, with a far-future Cache-Control header if its
+    name is its content hash.
+    """
+    response = serve(request, path, document_root=document_root)
+    cache_control = media_cache_control(path)
+    if cache_control and response.status_code == 200:
+        response.headers['Cache-Control'] = cache_control
+    return response
+
 class CustomLoginView(LoginView):
     """
     Custom login view.
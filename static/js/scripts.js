@@ -14,18 +14,57 @@ document.addEventListener("DOMContentLoaded", function() {
     let covers = document.querySelectorAll('.book-cover');
     let currentIndex = 0;
 
+    // Las portadas ocultas se cargan de forma diferida: se pide la siguiente
+    // antes de mostrarla
+    function preloadCover(index) {
+        if (covers.length > 1) {
+            covers[index % covers.length].loading = 'eager';
+        }
+    }
+
     function showNextCover() {
         covers[currentIndex].style.display = 'none';
         currentIndex = (currentIndex + 1) % covers.length;
         covers[currentIndex].style.display = 'block';
+        preloadCover(currentIndex + 1);
     }
 
     if (covers.length > 0) {
         covers[0].style.display = 'block';
+        preloadCover(1);
         setInterval(showNextCover, 3000); // Cambia la imagen cada 3 segundos
     }
   });
 
+// Para cargar más reseñas al hacer scroll
+document.addEventListener("DOMContentLoaded", function() {
+    let container = document.getElementById("book_reviews");
+    if (!container || !("IntersectionObserver" in window)) {
+        return;
+    }
+    let observer = new IntersectionObserver(function(entries) {
+        entries.forEach(function(entry) {
+            if (!entry.isIntersecting) {
+                return;
+            }
+            let sentinel = entry.target;
+            observer.unobserve(sentinel);
+            fetch(sentinel.dataset.url, {credentials: "same-origin"})
+                .then(function(response) { return response.text(); })
+                .then(function(html) {
+                    sentinel.insertAdjacentHTML("afterend", html);
+                    sentinel.remove();
+                    container.querySelectorAll(".reviews-next").forEach(function(next) {
+                        observer.observe(next);
+                    });
+                });
+        });
+    });
+    container.querySelectorAll(".reviews-next").forEach(function(next) {
+        observer.observe(next);
+    });
+});
+
 // Para calcular el average_rating sobre 100
 function calculateRating(rating) {
     return rating * 20;
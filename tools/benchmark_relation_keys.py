@@ -0,0 +1,114 @@
+"""
+Compare the UserBookRelation table keyed by a random UUID (before migration
+0026) with the table keyed by an integer and holding the UUID in a secondary
+unique column (after it).
+
+Both layouts are created in temporary SQLite files with the same data; the
+script prints the time to insert the rows, the size of the data base and
+the time of the shelf join and primary key lookups.
+
+    python tools/benchmark_relation_keys.py --rows 200000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import uuid
+
+COMMON_INDEXES = [
+    'CREATE UNIQUE INDEX relation_user_book ON relation (user_id, book_id)',
+    'CREATE INDEX relation_book ON relation (book_id)',
+    'CREATE INDEX relation_user_status ON relation (user_id, status, read_date)',
+    'CREATE INDEX relation_book_rating ON relation (book_id, rating) WHERE rating IS NOT NULL',
+]
+
+LAYOUTS = {
+    'uuid primary key': (
+        'CREATE TABLE relation (id char(32) NOT NULL PRIMARY KEY, user_id integer NOT NULL, '
+        'book_id integer NOT NULL, status varchar(1) NULL, read_date date NULL, '
+        'rating integer NULL)',
+        'INSERT INTO relation (id, user_id, book_id, status, read_date, rating) '
+        'VALUES (?, ?, ?, ?, ?, ?)',
+    ),
+    'integer primary key': (
+        'CREATE TABLE relation (id integer NOT NULL PRIMARY KEY AUTOINCREMENT, '
+        'user_id integer NOT NULL, book_id integer NOT NULL, status varchar(1) NULL, '
+        'read_date date NULL, rating integer NULL, uuid char(32) NOT NULL UNIQUE)',
+        'INSERT INTO relation (uuid, user_id, book_id, status, read_date, rating) '
+        'VALUES (?, ?, ?, ?, ?, ?)',
+    ),
+}
+
+SHELF_QUERY = (
+    'SELECT r.id, b.title FROM relation AS r INNER JOIN book AS b ON b.id = r.book_id '
+    'WHERE r.user_id = ? ORDER BY b.title, r.id')
+
+
+def generate_rows(rows, users, books):
+    """
+    Returns the rows of random distinct (user, book) relations.
+    """
+    random.seed(0)
+    pairs = random.sample(range(users * books), rows)
+    return [(uuid.uuid4().hex, pair // books + 1, pair % books + 1, random.choice('rti'),
+             None, random.choice([None, 1, 2, 3, 4, 5])) for pair in pairs]
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+def run_layout(path, layout, data, users, books, lookups):
+    create_table, insert = layout
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE book (id integer PRIMARY KEY, title text NOT NULL)')
+    connection.executemany('INSERT INTO book (id, title) VALUES (?, ?)',
+                           [(book_id, f'Book {book_id}') for book_id in range(1, books + 1)])
+    connection.execute(create_table)
+    for index in COMMON_INDEXES:
+        connection.execute(index)
+    connection.commit()
+
+    def insert_rows():
+        with connection:
+            connection.executemany(insert, data)
+    insert_time, _ = timed(insert_rows)
+    connection.execute('ANALYZE')
+    ids = [row[0] for row in connection.execute('SELECT id FROM relation')]
+    random.seed(1)
+    sample = random.sample(ids, min(lookups, len(ids)))
+
+    def shelves():
+        for user_id in range(1, users + 1):
+            connection.execute(SHELF_QUERY, [user_id]).fetchall()
+    join_time, _ = timed(shelves)
+
+    def primary_keys():
+        for key in sample:
+            connection.execute('SELECT status FROM relation WHERE id = ?', [key]).fetchone()
+    lookup_time, _ = timed(primary_keys)
+    connection.close()
+    return insert_time, os.path.getsize(path), join_time, lookup_time
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--books', type=int, default=2000)
+    parser.add_argument('--lookups', type=int, default=20000)
+    args = parser.parse_args()
+    data = generate_rows(args.rows, args.users, args.books)
+    print(f'{args.rows} relations, {args.users} users, {args.books} books')
+    print(f"{'layout':<22}{'insert (s)':>12}{'size (MB)':>12}{'shelves (s)':>13}{'pk lookups (s)':>16}")
+    with tempfile.TemporaryDirectory() as directory:
+        for name, layout in LAYOUTS.items():
+            path = os.path.join(directory, name.replace(' ', '_') + '.sqlite3')
+            insert_time, size, join_time, lookup_time = run_layout(
+                path, layout, data, args.users, args.books, args.lookups)
+            print(f'{name:<22}{insert_time:>12.3f}{size / 2 ** 20:>12.1f}'
+                  f'{join_time:>13.3f}{lookup_time:>16.3f}')
+
+if __name__ == '__main__':
+    main()